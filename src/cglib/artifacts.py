@@ -0,0 +1,463 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+
+'''
+This module contains a cache of the files given by the tools, addressed by
+their content instead of their name:
+
+    - the key of the isocontours of a field is the hash of the content of the
+      .npy file and of the parameters of the extraction,
+    - the key of the cycle is the key of the isocontours which are stitched
+      and the parameters of the stitching.
+
+An artifact with the same key is the same file, so it is copied from the cache
+instead of being computed again. Each run of a tool only writes files with
+a name of their own, or replaces a file with os.replace, so concurrent runs
+never read a partially written file nor overwrite each other's files.
+
+The cache is data/cache:
+
+    - <key>.npz: the artifacts.
+    - field_<hash>.json: the record of a field, i.e. the output name, the
+      key of the isocontours of the last extraction and its parameters, read
+      by the other tools.
+    - hash_<key>.txt: the hash of a file with its size and its modification
+      time, one for each path, so that a field is only read again when it
+      changes.
+
+When the total size of the artifacts and of the hashes exceeds the maximal
+size, the least recently used ones are removed.
+
+'''
+
+
+
+CACHE_DIRECTORY = "data/cache"
+MAX_CACHE_SIZE = 4 * 1024**3
+
+def write_atomically(
+        file_path: str,
+        text: str):
+    '''
+    Write a text file, which is replaced at once: a concurrent reader gets
+    either the previous file or the new one.
+
+    Parameters
+    -------
+
+    file_path: str
+
+        path to the file.
+
+    text: str
+
+        content of the file.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    file_descriptor, temporary_path = tempfile.mkstemp(dir = os.path.dirname(file_path),
+                                                       suffix = ".tmp")
+    with os.fdopen(file_descriptor, "w") as temporary_file:
+        temporary_file.write(text)
+    os.chmod(temporary_path,
+             0o644)
+    os.replace(temporary_path,
+               file_path)
+
+def copy_atomically(
+        source_path: str,
+        file_path: str):
+    '''
+    Copy a file, which is replaced at once, see write_atomically.
+
+    Parameters
+    -------
+
+    source_path: str
+
+        path to the copied file.
+
+    file_path: str
+
+        path to the copy.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    file_descriptor, temporary_path = tempfile.mkstemp(dir = os.path.dirname(file_path),
+                                                       suffix = ".tmp")
+    os.close(file_descriptor)
+    try:
+        shutil.copyfile(source_path,
+                        temporary_path)
+        shutil.copymode(source_path,
+                        temporary_path)
+        os.replace(temporary_path,
+                   file_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+def hash_file(file_path: str) -> str:
+    '''
+    Compute the SHA-256 hash of the content of a file. The hash is kept in
+    the cache for the path of the file, with its size and its modification
+    time, so the file is only read when it changes, and the hash of the
+    previous content is replaced.
+
+    Parameters
+    -------
+
+    file_path: str
+
+        path to the file.
+
+
+    Returns
+    -------
+
+    str
+
+        hexadecimal hash of the content.
+    '''
+    status = os.stat(file_path)
+    stamp = [status.st_size,
+             status.st_mtime_ns]
+    path_key = hashlib.sha256(os.path.abspath(file_path).encode()).hexdigest()
+    stamp_path = os.path.join(CACHE_DIRECTORY,
+                              "hash_" + path_key + ".txt")
+    try:
+        with open(stamp_path, "r") as stamp_file:
+            size, mtime, content_hash = json.load(stamp_file)
+        if [size, mtime] == stamp:
+            #mark the hash as recently used, see evict_artifacts
+            os.utime(stamp_path)
+            return content_hash
+    except (FileNotFoundError, ValueError, TypeError):
+        #no hash for this path, or a hash written by a previous version
+        pass
+
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b""):
+            content_hash.update(chunk)
+
+    write_atomically(stamp_path,
+                     json.dumps(stamp + [content_hash.hexdigest()]))
+    return content_hash.hexdigest()
+
+def get_artifact_key(
+        input_key: str,
+        stage: str,
+        parameters: dict) -> str:
+    '''
+    Give the key of the output of a stage, from the key of its input and
+    the parameters which change its output.
+
+    Parameters
+    -------
+
+    input_key: str
+
+        hash of the field, or key of the artifact given to the stage.
+
+    stage: str
+
+        name of the stage, such as contour or stitch.
+
+    parameters: dict
+
+        parameters of the stage, which can be written in JSON.
+
+
+    Returns
+    -------
+
+    str
+
+        hexadecimal key of the artifact.
+    '''
+    description = json.dumps([input_key,
+                              stage,
+                              parameters],
+                             sort_keys = True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+def fetch_artifact(
+        key: str,
+        file_path: str) -> bool:
+    '''
+    Copy an artifact of the cache to a file, if it is in the cache, and mark
+    it as recently used.
+
+    Parameters
+    -------
+
+    key: str
+
+        key of the artifact, see get_artifact_key.
+
+    file_path: str
+
+        path to the copy.
+
+
+    Returns
+    -------
+
+    bool
+
+        True if the artifact was in the cache.
+    '''
+    artifact_path = os.path.join(CACHE_DIRECTORY,
+                                 key + ".npz")
+    try:
+        os.utime(artifact_path)
+        copy_atomically(artifact_path,
+                        file_path)
+    except FileNotFoundError:
+        #the artifact was never computed, or removed by another run
+        return False
+    return True
+
+def use_artifact(key: str):
+    '''
+    Mark an artifact of the cache as recently used, before it is read in
+    place. FileNotFoundError is raised if it is not in the cache.
+
+    Parameters
+    -------
+
+    key: str
+
+        key of the artifact, see get_artifact_key.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    os.utime(os.path.join(CACHE_DIRECTORY,
+                          key + ".npz"))
+
+def store_artifact(
+        key: str,
+        file_path: str,
+        max_size: int = MAX_CACHE_SIZE):
+    '''
+    Copy a file to the cache as the artifact of a key, then remove the least
+    recently used artifacts if the cache is too large.
+
+    Parameters
+    -------
+
+    key: str
+
+        key of the artifact, see get_artifact_key.
+
+    file_path: str
+
+        path to the file.
+
+    max_size: int
+
+        maximal total size of the artifacts in bytes, 4 GiB by default.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    copy_atomically(file_path,
+                    os.path.join(CACHE_DIRECTORY,
+                                 key + ".npz"))
+    evict_artifacts(max_size)
+
+def write_artifact(
+        key: str,
+        directory: str,
+        file_name: str,
+        write,
+        max_size: int = MAX_CACHE_SIZE):
+    '''
+    Write an .npz file in a temporary file of its directory, store the
+    temporary file in the cache as the artifact of a key, then replace the
+    file with it. The stored artifact is the file written by this run, even
+    if another run writes a file of the same name at the same time, and a
+    reader gets either the previous file or the new one.
+
+    Parameters
+    -------
+
+    key: str
+
+        key of the artifact, see get_artifact_key. The file is not stored
+        in the cache if None.
+
+    directory: str
+
+        directory of the file, such as data/np.
+
+    file_name: str
+
+        name of the file, without the .npz extension. The file is only
+        stored in the cache if None.
+
+    write: function
+
+        function writing the file, called with the name of the temporary
+        file in the directory, without the .npz extension, such as the
+        file_name of data_structure_to_numpy in data/np.
+
+    max_size: int
+
+        maximal total size of the artifacts in bytes, 4 GiB by default.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    file_descriptor, temporary_path = tempfile.mkstemp(dir = directory,
+                                                       suffix = ".npz")
+    os.close(file_descriptor)
+    try:
+        write(os.path.basename(temporary_path)[:-len(".npz")])
+        if key is not None:
+            store_artifact(key,
+                           temporary_path,
+                           max_size)
+        if file_name is None:
+            os.remove(temporary_path)
+        else:
+            os.chmod(temporary_path,
+                     0o644)
+            os.replace(temporary_path,
+                       os.path.join(directory,
+                                    file_name + ".npz"))
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def evict_artifacts(max_size: int = MAX_CACHE_SIZE):
+    '''
+    Remove the least recently used artifacts and hashes of files until their
+    total size is at most max_size.
+
+    Parameters
+    -------
+
+    max_size: int
+
+        maximal total size of the artifacts in bytes, 4 GiB by default.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    #the hashes are small, but a field which is never used again leaves one
+    artifacts = []
+    for entry in os.scandir(CACHE_DIRECTORY):
+        if entry.name.endswith(".npz") or entry.name.startswith("hash_"):
+            try:
+                status = entry.stat()
+            except FileNotFoundError:
+                continue
+            artifacts.append((status.st_mtime_ns,
+                              status.st_size,
+                              entry.path))
+
+    total_size = sum(size for _, size, _ in artifacts)
+    for _, size, path in sorted(artifacts):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+def save_field_record(
+        field_path: str,
+        output_name: str,
+        contour_key: str = None,
+        contour_parameters: dict = None):
+    '''
+    Record the output name, the key of the isocontours of a field and the
+    parameters of their extraction, which replace the previous record of
+    the same field. A record is written for each field, so the runs on
+    different fields never write the same file.
+
+    Parameters
+    -------
+
+    field_path: str
+
+        path to the .npy file containing the scalar field.
+
+    output_name: str
+
+        prefix of the names of the output files.
+
+    contour_key: str
+
+        key of the isocontours, see get_artifact_key.
+
+    contour_parameters: dict
+
+        parameters of the extraction given to get_artifact_key, so that the
+        isocontours can be extracted again if they leave the cache.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    write_atomically(os.path.join(CACHE_DIRECTORY,
+                                  "field_" + hash_file(field_path) + ".json"),
+                     json.dumps({"output_name": output_name,
+                                 "contour_key": contour_key,
+                                 "contour_parameters": contour_parameters}))
+
+def load_field_record(field_path: str) -> dict:
+    '''
+    Read the record of a field, see save_field_record. FileNotFoundError
+    is raised if the field was never extracted.
+
+    Parameters
+    -------
+
+    field_path: str
+
+        path to the .npy file containing the scalar field.
+
+
+    Returns
+    -------
+
+    dict
+
+        output_name, contour_key and contour_parameters of the field.
+    '''
+    with open(os.path.join(CACHE_DIRECTORY,
+                           "field_" + hash_file(field_path) + ".json"), "r") as record_file:
+        return json.load(record_file)
@@ -0,0 +1,226 @@
+import taichi as ti
+
+from cglib.calc import compute_neighbours_energies
+from cglib.index import edge_1d_to_3d_index, get_neighbour_edge, get_grid_edge, get_graph_edge
+from cglib.union_find import get_cycle
+
+
+
+'''
+This module contains a cache of the best candidate of each edge, used by the
+stitching algorithm with neighbours. The minimal cycle is stitched at each
+iteration, so a cache of the best candidate of each cycle would never be read
+again; the best candidate of each edge is kept instead, because the edges of
+the minimal cycle were often browsed before, as edges of a smaller cycle.
+
+The energy between two edges only changes when one of them is stitched, and
+a stitching can only exclude candidates, so a cached candidate is still the
+best one while it is in another cycle and while no edge of the neighbourhood
+has been stitched. After each stitching, the candidates of the neighbourhoods
+of the two stitched edges are invalidated.
+
+    - candidate_energy: 1D field containing the minimal energy of each edge, inf
+      if the edge has no neighbour in another cycle.
+    - candidate_edge: 1D field containing the 1D index of the best candidate of each edge.
+    - is_cached: 1D field containing 1 if the candidate of an edge is valid.
+    - cache_counters: 1D field containing the number of hits and of misses.
+
+'''
+
+
+
+@ti.func
+def get_edge_candidate(
+        points: ti.template(),
+        next_edge: ti.template(),
+        segment_length: ti.template(),
+        energy_function: ti.template(),
+        cycle_index: ti.template(),
+        cycle_parent: ti.template(),
+        cycle_label: ti.template(),
+        use_union_find: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        current_edge_1d_index: int,
+        distance_from_edge: int,
+        candidate_energy: ti.template(),
+        candidate_edge: ti.template(),
+        is_cached: ti.template(),
+        cache_counters: ti.template()) -> ti.math.vec2:
+    '''
+    Give the best candidate of an edge among its neighbours, from the cache
+    if it is still valid, otherwise with compute_neighbours_energies.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points
+        and the lengths of their segments, such as patching_energy_with_lengths.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_parent, cycle_label: ti.template
+
+        fields of the cycle forest. Only used if use_union_find is True.
+
+    use_union_find: ti.template
+
+        if True, the cycle of an edge is found with the cycle forest.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    current_edge_1d_index: int
+
+        1D index of the reference edge.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    candidate_energy, candidate_edge, is_cached, cache_counters: ti.template
+
+        fields of the cache.
+
+
+    Returns
+    -------
+
+    ti.math.vec2
+
+        x: minimal energy for the current edge
+        y: 1D index of the edge which has the minimal energy with the current edge
+    '''
+    result = ti.math.vec2(candidate_energy[current_edge_1d_index],
+                          candidate_edge[current_edge_1d_index])
+
+    is_valid = is_cached[current_edge_1d_index]
+    if is_valid == 1 and result.x != ti.math.inf:
+        if get_cycle(cycle_index,
+                     cycle_parent,
+                     cycle_label,
+                     candidate_edge[current_edge_1d_index],
+                     use_union_find) == get_cycle(cycle_index,
+                                                  cycle_parent,
+                                                  cycle_label,
+                                                  current_edge_1d_index,
+                                                  use_union_find):
+            is_valid = 0
+
+    if is_valid == 1:
+        cache_counters[0] += 1
+    else:
+        cache_counters[1] += 1
+        result = compute_neighbours_energies(points,
+                                             next_edge,
+                                             segment_length,
+                                             energy_function,
+                                             cycle_index,
+                                             cycle_parent,
+                                             cycle_label,
+                                             use_union_find,
+                                             shape,
+                                             edge_ids,
+                                             current_edge_1d_index,
+                                             distance_from_edge)
+
+        #the last edges of the grid are not the neighbours of their neighbours,
+        #so their candidate would not be invalidated
+        edge_3d_index = edge_1d_to_3d_index(shape,
+                                            get_grid_edge(edge_ids,
+                                                          current_edge_1d_index))
+        if edge_3d_index.x < shape.x and edge_3d_index.y < shape.y:
+            candidate_energy[current_edge_1d_index] = result.x
+            candidate_edge[current_edge_1d_index] = int(result.y)
+            is_cached[current_edge_1d_index] = 1
+
+    return result
+
+@ti.func
+def invalidate_candidates(
+        is_cached: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        stitched_edges: ti.math.ivec2,
+        distance_from_edge: int):
+    '''
+    Invalidate the candidates of the edges whose neighbourhood contains
+    one of the two stitched edges.
+
+    Parameters
+    -------
+
+    is_cached: ti.template
+
+        1D field containing 1 if the candidate of an edge is valid.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    stitched_edges: ti.math.ivec2
+
+        1D index of the two edges whose next edge has changed.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    k = distance_from_edge*2 + 1
+
+    for edge_number in ti.static(range(2)):
+
+        edge_3d_index = edge_1d_to_3d_index(shape,
+                                            get_grid_edge(edge_ids,
+                                                          stitched_edges[edge_number]))
+        is_cached[stitched_edges[edge_number]] = 0
+
+        #the neighbourhoods are symmetric inside the grid
+        for neighbour in range(k * k * 2):
+            neighbour_edge = get_graph_edge(edge_ids,
+                                            get_neighbour_edge(shape,
+                                                               edge_3d_index,
+                                                               neighbour,
+                                                               distance_from_edge))
+            if neighbour_edge != -1:
+                is_cached[neighbour_edge] = 0
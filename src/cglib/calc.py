@@ -1,6 +1,8 @@
 import taichi as ti 
 
-from cglib.index import index2d_to_cartesians_coo, edge_1d_to_3d_index, edge_3d_to_1d_index
+from cglib.index import index2d_to_cartesians_coo, edge_1d_to_3d_index, edge_3d_to_1d_index, is_compact, get_grid_edge, get_graph_edge, get_graph_edge_after, get_graph_neighbour_edge, find_edge_position
+from cglib.union_find import get_cycle
+from cglib.implicit import get_grid_value
 
 
 
@@ -9,23 +11,35 @@ def linear_interpolation(
         grid: ti.template(), 
         point_0_index : ti.math.ivec2, 
         point_1_index: ti.math.ivec2, 
-        value: float) -> ti.math.vec2: 
+        value: float, 
+        tile_origin: ti.math.ivec2, 
+        field_shape: ti.template()) -> ti.math.vec2: 
     '''
     Find the point on a segment where a function, or a scalar field is equal to the value in argument
-    by approximating this function by a linear function. 
+    by approximating this function by a linear function. The grid may be a tile of a larger 
+    field, the coordinates of the point are then given in the whole field. 
 
     Parameters 
     -------
 
     grid: ti.template 
 
-        the 2D field containing the scalar field values. 
+        the 2D field containing the scalar field values, or an ImplicitField. 
 
     point_0_index, point_1_index: ti.math.ivec2
 
         the 2D index of the grid points forming the segment. 
         value : value whose abscissa we want to find on the segment. 
 
+    tile_origin: ti.math.ivec2 
+
+        2D index in the whole field of the first point of the grid, 
+        (0, 0) if the grid is the whole field. 
+
+    field_shape: ti.template 
+
+        2D shape of the whole field, as a tuple. 
+
     Returns
     -------
 
@@ -35,25 +49,28 @@ def linear_interpolation(
         in the scalar field is equal to the value passed as an argument. 
     '''
 
-    point_0 = index2d_to_cartesians_coo(ti.math.ivec2(grid.shape[0], grid.shape[1]), 
-                                        point_0_index)
-    point_1 = index2d_to_cartesians_coo(ti.math.ivec2(grid.shape[0],grid.shape[1]), 
-                                        point_1_index)
+    point_0 = index2d_to_cartesians_coo(ti.math.ivec2(field_shape[0], field_shape[1]), 
+                                        tile_origin + point_0_index)
+    point_1 = index2d_to_cartesians_coo(ti.math.ivec2(field_shape[0], field_shape[1]), 
+                                        tile_origin + point_1_index)
     
     res_x = 0.
     res_y = 0.
 
 
+    value_0 = get_grid_value(grid, 
+                             point_0_index)
+    value_1 = get_grid_value(grid, 
+                             point_1_index)
+
     if point_0_index.y == point_1_index.y: 
-        res_x = point_0.x + (value-grid[point_0_index.x, point_0_index.y]) *\
-              (point_1.x - point_0.x) / (grid[point_1_index.x, point_1_index.y]\
-                                         -grid[point_0_index.x, point_0_index.y])
+        res_x = point_0.x + (value-value_0) *\
+              (point_1.x - point_0.x) / (value_1-value_0)
         res_y = point_1.y
 
     else: 
-        res_y = point_0.y + (value-grid[point_0_index.x, point_0_index.y]) *\
-              (point_1.y - point_0.y) / (grid[point_1_index.x, point_1_index.y]\
-                                         -grid[point_0_index.x, point_0_index.y])
+        res_y = point_0.y + (value-value_0) *\
+              (point_1.y - point_0.y) / (value_1-value_0)
         res_x = point_0.x
 
     return ti.math.vec2(res_x, 
@@ -84,17 +101,147 @@ def euclidean_distance(
     return ti.math.sqrt(vector.x **2 + vector.y**2)
 
 @ti.func
-def compute_all_energies(
+def patching_energy(
+        i_1: ti.math.vec2, 
+        i_2: ti.math.vec2, 
+        j_1: ti.math.vec2, 
+        j_2: ti.math.vec2) -> float: 
+    '''
+    Calculate the patching energy of two edges, i.e. the length added to the 
+    cycles if the adjacency of the two edges is exchanged. 
+
+    Parameters 
+    -------
+
+    i_1, i_2 : ti.math.vec2
+
+        points of the first edge and of its next edge. 
+
+    j_1, j_2 : ti.math.vec2
+
+        points of the second edge and of its next edge. 
+    
+
+    Returns
+    -------
+
+    float: 
+
+        the patching energy. 
+    '''
+    return patching_energy_with_lengths(i_1, 
+                                        i_2, 
+                                        j_1, 
+                                        j_2, 
+                                        euclidean_distance(i_1 - i_2), 
+                                        euclidean_distance(j_2 - j_1))
+
+@ti.func
+def patching_energy_with_lengths(
+        i_1: ti.math.vec2, 
+        i_2: ti.math.vec2, 
+        j_1: ti.math.vec2, 
+        j_2: ti.math.vec2, 
+        length_I: float, 
+        length_J: float) -> float: 
+    '''
+    Calculate the patching energy of two edges when the lengths of their 
+    segments are already known, e.g. read from the segment_length field. 
+    This is the default energy function of the stitching algorithms, any 
+    ti.func with the same signature can replace it. 
+
+    Parameters 
+    -------
+
+    i_1, i_2 : ti.math.vec2
+
+        points of the first edge and of its next edge. 
+
+    j_1, j_2 : ti.math.vec2
+
+        points of the second edge and of its next edge. 
+
+    length_I, length_J : float
+
+        distance between i_1 and i_2, and between j_1 and j_2. 
+    
+
+    Returns
+    -------
+
+    float: 
+
+        the patching energy. 
+    '''
+    energy = 0. 
+
+    cross = euclidean_distance(i_1 - j_2) + euclidean_distance(i_2 - j_1) 
+    no_cross = euclidean_distance(i_1 - j_1) + euclidean_distance(i_2 - j_2)
+
+    if cross < no_cross: 
+        energy = cross - length_I - length_J
+    else: 
+        energy = no_cross - length_I - length_J
+
+    return energy
+
+@ti.func
+def energy_to_key(
+        energy: float, 
+        order: int) -> ti.i64: 
+    '''
+    Give an integer key whose order is the order of the energies, then the order 
+    of the second argument. It is used to find a minimal energy with an atomic 
+    operation, so that the result does not depend on the order of the threads. 
+
+    Parameters 
+    -------
+
+    energy : float
+
+        the energy, converted to 32 bits. 
+
+    order : int 
+
+        a non-negative integer used when two energies are equal. 
+    
+
+    Returns
+    -------
+
+    ti.i64: 
+
+        the key 
+    '''
+    #-0. and 0. must have the same key 
+    energy_32 = ti.cast(energy, ti.f32)
+    if energy_32 == 0.: 
+        energy_32 = 0.
+
+    #the negative floats are sorted in the reverse order of their bits 
+    bits = ti.bit_cast(energy_32, ti.i32)
+    if bits < 0: 
+        bits = bits ^ 0x7FFFFFFF
+
+    return (ti.cast(bits, ti.i64) << 32) | ti.cast(order, ti.i64)
+
+@ti.func
+def compute_minimal_energy(
         points: ti.template(), 
         next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(), 
-        energies: ti.template(), 
-        current_edge_1d_index: int): 
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        current_edge_1d_index: int) -> ti.math.vec2: 
    
    
     '''
-    For a given edge of the graph, calculate all the patching energies between this edge 
-    and edges not belonging to the same cycle. 
+    For a given edge of the graph, find the edge not belonging to the same cycle 
+    with the minimal patching energy. The energies are computed and compared in 
+    the same loop, so no field is needed to store them. 
 
     Parameters 
     -------
@@ -109,15 +256,35 @@ def compute_all_energies(
         field containing the next edge of an edge in a cycle, 
         arranged according to the edges of the grid. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index : ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
         arranged according to the edges of the grid. 
 
-    energies : ti.template
+    cycle_parent : ti.template
 
-        Fields containing the value of the patching energy with the reference edge, 
-        arranged according to the edges of the grid. 
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label : ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find : ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
 
     current_edge_1d_index : int
 
@@ -127,50 +294,62 @@ def compute_all_energies(
     Returns
     -------
 
-    None
+    ti.math.vec2:
+
+        x: minimal energy for the current edge, inf if there is no other cycle 
+        y: 1D index of the first edge which has the minimal energy with the current edge
     '''
 
     edge_I = ti.math.ivec2(current_edge_1d_index, 
                            next_edge[current_edge_1d_index])
-    edge_cycle = cycle_index[current_edge_1d_index]
+    length_I = segment_length[current_edge_1d_index]
+    edge_cycle = get_cycle(cycle_index, 
+                           cycle_parent, 
+                           cycle_label, 
+                           current_edge_1d_index, 
+                           use_union_find)
 
+    minimal_energy = ti.math.inf
+    minimal_energy_edge = 0
 
-    for index in range(energies.shape[0]): 
-        
-        #if there is a point thesame cycle
-        if cycle_index[index] == edge_cycle:  
-            energies[index] = ti.math.inf
-
-        #if there is no point
-        elif cycle_index[index] == -1: 
-            energies[index] = ti.math.inf
+    ti.loop_config(serialize=True)
+    for index in range(cycle_index.shape[0]): 
 
+        index_cycle = get_cycle(cycle_index, 
+                                cycle_parent, 
+                                cycle_label, 
+                                index, 
+                                use_union_find)
+        
         #if there is a point belonging to another cycle
-        elif cycle_index[index] != edge_cycle: 
-
-            energy = 0. 
-            edge_J = ti.math.ivec2(index, next_edge[index])
-            i_1 = points[edge_I.x]
-            i_2 = points[edge_I.y]
-            j_1 = points[edge_J.x]
-            j_2 = points[edge_J.y]
+        if index_cycle != -1 and index_cycle != edge_cycle: 
 
-            cross = euclidean_distance(i_1 - j_2) + euclidean_distance(i_2 - j_1) 
-            no_cross = euclidean_distance(i_1 - j_1) + euclidean_distance(i_2 - j_2)
+            energy = energy_function(points[edge_I.x], 
+                                     points[edge_I.y], 
+                                     points[index], 
+                                     points[next_edge[index]], 
+                                     length_I, 
+                                     segment_length[index])
 
-            if cross < no_cross: 
-                energy = cross - euclidean_distance(i_1 - i_2) - euclidean_distance(j_2 - j_1)
-            else: 
-                energy = no_cross - euclidean_distance(i_1 - i_2) - euclidean_distance(j_2 - j_1)
+            if energy < minimal_energy: 
+                minimal_energy = energy
+                minimal_energy_edge = index
 
-            energies[index] = energy 
+    return ti.math.vec2(minimal_energy, 
+                        minimal_energy_edge)
 
 @ti.func
 def compute_neighbours_energies(
         points: ti.template(), 
         next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(),
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
         shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
         current_edge_1d_index: int, 
         distance_from_edge: int) -> ti.math.vec2: 
     '''
@@ -191,15 +370,46 @@ def compute_neighbours_energies(
         field containing the next edge of an edge in a cycle, 
         arranged according to the edges of the grid. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index : ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
         arranged according to the edges of the grid. 
 
+    cycle_parent : ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label : ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find : ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
     shape : ti.math.ivec2
 
         the dimensions of the scalar field grid. 
 
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
     current_edge_1d_index : int
 
         1D index of the reference edge which will be used to calcultate the energies. 
@@ -217,19 +427,36 @@ def compute_neighbours_energies(
     #we use 3D edge index instead of 1D edge index
     edge_I = ti.math.ivec2(current_edge_1d_index, 
                            next_edge[current_edge_1d_index])
-    edge_I_cycle = cycle_index[current_edge_1d_index]
+    length_I = segment_length[current_edge_1d_index]
+    edge_I_cycle = get_cycle(cycle_index, 
+                             cycle_parent, 
+                             cycle_label, 
+                             current_edge_1d_index, 
+                             use_union_find)
     edge_I_3d_index = edge_1d_to_3d_index(shape, 
-                                          current_edge_1d_index)
+                                          get_grid_edge(edge_ids, 
+                                                        current_edge_1d_index))
 
     minimal_energy = ti.math.inf
     minimum_value_3d_index = ti.math.ivec3(0, 0, 0)
     k = distance_from_edge*2 +1 
     ti.loop_config(serialize= True)
     for x_index in range(k): 
+
+        #in a compact graph, the edges of a row of the grid are browsed 
+        #in increasing order, so they are searched from the previous one 
+        row_positions = ti.math.ivec2(0, 0)
+        if ti.static(is_compact(edge_ids)): 
+            for z_index in ti.static(range(2)): 
+                row_positions[z_index] = find_edge_position(edge_ids, 
+                                                            edge_3d_to_1d_index(shape, 
+                                                                                edge_I_3d_index.x + x_index - distance_from_edge, 
+                                                                                ti.math.max(edge_I_3d_index.y - distance_from_edge, 0), 
+                                                                                z_index))
+
         ti.loop_config(serialize= True)
         for y_index in range(k): 
-            ti.loop_config(serialize= True)
-            for z_index in range(2): 
+            for z_index in ti.static(range(2)): 
 
                 #if the edge is in the grid
                 if edge_I_3d_index.x + x_index - distance_from_edge >= 0.\
@@ -241,33 +468,39 @@ def compute_neighbours_energies(
                                                         edge_I_3d_index.x + x_index - distance_from_edge, 
                                                         edge_I_3d_index.y + y_index - distance_from_edge, 
                                                         z_index)
+                    if ti.static(is_compact(edge_ids)): 
+                        edge_and_position = get_graph_edge_after(edge_ids, 
+                                                                 edge_J_1d_index, 
+                                                                 row_positions[z_index])
+                        edge_J_1d_index = edge_and_position.x
+                        row_positions[z_index] = edge_and_position.y
+                    
+                    #in a compact graph, an edge without point is not in the graph 
+                    edge_J_cycle = -1 
+                    if edge_J_1d_index != -1: 
+                        edge_J_cycle = get_cycle(cycle_index, 
+                                                 cycle_parent, 
+                                                 cycle_label, 
+                                                 edge_J_1d_index, 
+                                                 use_union_find)
                     
                     #if there is a point in the same cycle or no point at all 
-                    if (cycle_index[edge_J_1d_index] == edge_I_cycle)\
-                    or (cycle_index[edge_J_1d_index] == -1):  
+                    if (edge_J_cycle == edge_I_cycle)\
+                    or (edge_J_cycle == -1):  
                         pass
                     
                     #if there is a point in another cycle 
                     else: 
 
-                        energy = 0.
                         edge_J = ti.math.ivec2(edge_J_1d_index, 
                                                next_edge[edge_J_1d_index])
                         
-                        i_1 = points[edge_I.x]
-                        i_2 = points[edge_I.y]
-                        j_1 = points[edge_J.x]
-                        j_2 = points[edge_J.y]
-
-                        cross = euclidean_distance(i_1 - j_2) + euclidean_distance(i_2 - j_1) 
-                        no_cross = euclidean_distance(i_1 - j_1) + euclidean_distance(i_2 - j_2)
-
-                        if cross < no_cross: 
-                            energy = cross - euclidean_distance(i_1 - i_2)\
-                            - euclidean_distance(j_2 - j_1)
-                        else: 
-                            energy = no_cross - euclidean_distance(i_1 - i_2)\
-                            - euclidean_distance(j_2 - j_1)
+                        energy = energy_function(points[edge_I.x], 
+                                                 points[edge_I.y], 
+                                                 points[edge_J.x], 
+                                                 points[edge_J.y], 
+                                                 length_I, 
+                                                 segment_length[edge_J.x])
 
                         if energy < minimal_energy\
                               and energy != ti.math.inf: 
@@ -283,7 +516,131 @@ def compute_neighbours_energies(
 
 
     return ti.math.vec2(minimal_energy, 
-                        edge_3d_to_1d_index(shape, 
-                                            res.x, 
-                                            res.y, 
-                                            res.z))
\ No newline at end of file
+                        get_graph_edge(edge_ids, 
+                                       edge_3d_to_1d_index(shape, 
+                                                           res.x, 
+                                                           res.y, 
+                                                           res.z)))
+
+@ti.func
+def compute_neighbour_energy(
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
+        cycle_index: ti.template(),
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
+        current_edge_1d_index: int, 
+        neighbour: int, 
+        distance_from_edge: int) -> float: 
+    '''
+    Calculate the patching energy between an edge and one of its neighbours. 
+    The neighbours are numbered in the same order as in compute_neighbours_energies. 
+
+    Parameters 
+    -------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to the edges of the grid. 
+    
+    next_edge : ti.template
+    
+        field containing the next edge of an edge in a cycle, 
+        arranged according to the edges of the grid. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
+    cycle_index : ti.template
+
+        Fields containing the index of the cycle to which each edge belongs, 
+        arranged according to the edges of the grid. 
+
+    cycle_parent : ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label : ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find : ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
+    shape : ti.math.ivec2
+
+        the dimensions of the scalar field grid. 
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
+    current_edge_1d_index : int
+
+        1D index of the reference edge. 
+
+    neighbour : int
+
+        number of the neighbour, see get_neighbour_edge. 
+
+    distance_from_edge : int
+
+        distance from the reference edge to compute the neighbours.
+
+        
+    Returns
+    -------
+
+    float: 
+
+        the patching energy, inf if there is no point on the neighbour 
+        or if it belongs to the same cycle. 
+    '''
+    energy = ti.math.inf
+    edge_J_1d_index = get_graph_neighbour_edge(shape, 
+                                               edge_ids, 
+                                               current_edge_1d_index, 
+                                               neighbour, 
+                                               distance_from_edge)
+
+    if edge_J_1d_index != -1: 
+
+        edge_I_cycle = get_cycle(cycle_index, 
+                                 cycle_parent, 
+                                 cycle_label, 
+                                 current_edge_1d_index, 
+                                 use_union_find)
+        edge_J_cycle = get_cycle(cycle_index, 
+                                 cycle_parent, 
+                                 cycle_label, 
+                                 edge_J_1d_index, 
+                                 use_union_find)
+
+        if edge_J_cycle != edge_I_cycle and edge_J_cycle != -1: 
+            energy = energy_function(points[current_edge_1d_index], 
+                                     points[next_edge[current_edge_1d_index]], 
+                                     points[edge_J_1d_index], 
+                                     points[next_edge[edge_J_1d_index]], 
+                                     segment_length[current_edge_1d_index], 
+                                     segment_length[edge_J_1d_index])
+
+    return energy
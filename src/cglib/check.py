@@ -7,6 +7,7 @@ This module contains functions to check if two functions are valid:
 
     - check_if_one_cycle: check if there is only one cycle in the graph and if it is closed.
     - check_closure: check if all cycles in the graph are closed.
+    - compute_path_length: compute the total length of the cycles, used to compare stitchings.
 
 '''
 
@@ -128,4 +129,40 @@ def flood(
     if current_edge != cycle.x: 
         res = 0
     
-    return res 
\ No newline at end of file
+    return res 
+
+@ti.kernel
+def compute_path_length(
+        points: ti.template(), 
+        next_edge: ti.template()) -> float:
+    '''
+    Compute the total length of the segments of the graph. When the graph 
+    is a single cycle, it is the length of the print path. 
+
+    Parameters:
+    -----------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to 1D indexes of the grid edges. 
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    Returns:
+    --------
+
+    float:
+
+        sum of the distances between the point of each edge 
+        and the point of its next edge.
+    '''
+    length = 0.
+    for edge in next_edge: 
+        if next_edge[edge] != 0: 
+            length += ti.math.length(points[edge] - points[next_edge[edge]])
+
+    return length
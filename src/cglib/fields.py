@@ -2,122 +2,204 @@ import taichi as ti
 
 
 
-@ti.func
-def reset_energies(energies: ti.template()): 
+@ti.kernel
+def count_cycles(cycles: ti.template()) -> int: 
     '''
-    Resets the value of the entire field to Nan. 
+    Count the numbers of elements (cycles) in the 'cycles' field, 
+    used for the graph data. 
 
     Parameters 
     -------
 
-    energies : ti.template
+    cycles : ti.template
 
-        Fields containing the value of the patching energy with the reference edge, 
-        arranged according to the edges of the grid. 
+        1D Vector field for which we want to the number of cycles 
+        which size is different from 0
 
         
     Returns
     -------
 
-    None
-    '''
+    int
 
-    for index in range(energies.shape[0]): 
-        energies[index] = ti.math.inf
+        number of cycles
+    '''
+    cycles_count = 0
 
-@ti.func
-def find_minimum_in_field(f: ti.template())\
-                            -> ti.math.vec2: 
+    for index in cycles: 
+        if cycles[index].y != 0: 
+            cycles_count += 1 
+    
+    return cycles_count
+    
+@ti.kernel 
+def fill_final_cycles(
+        cycles: ti.template(), 
+        final_cycles: ti.template()): 
     '''
-    Find the minimum value and the position of this minimum in a field. 
+    Fill the field final_cycles with the data of cycles
 
     Parameters 
     -------
 
-    f : ti.template
+    cycles : ti.template
 
-        1D field for which we want to know the minimum
+        1D Vector field with useless [0, 0] vectors. 
 
+    final_cycles : ti.template 
         
+        1D Vector field without useless vectors. 
+
+
     Returns
     -------
 
-    ti.math.vec2
+    None
+    '''
+    for index in final_cycles: 
+        final_cycles[index] = cycles[index]
 
-        x: minimum of the field 
-        y: index of the minimum 
+@ti.func
+def compute_exclusive_scan(
+        values: ti.template(), 
+        offsets: ti.template()): 
     '''
-    minimal_value = ti.math.inf
-    index = 0
-        
-           
+    Compute the exclusive prefix sum of a field or an array: offsets[i] is 
+    the sum of the values before i, and offsets[n] is the sum of all the 
+    values. The values are summed by blocks in parallel, then the sums of 
+    the blocks are propagated. The function must be called at the top level 
+    of a kernel, so that its loops are parallelised. 
+
+    Parameters 
+    -------
+
+    values : ti.template
+
+        1D int field or array of size n. 
+
+    offsets : ti.template 
+
+        1D int field or array of size n + 1, containing the prefix sum. 
+
+
+    Returns
+    -------
+
+    None
+    '''
+    block_size = 1024
+    size = values.shape[0]
+    nb_blocks = (size + block_size - 1) // block_size
+
+    #sum of each block, offsets[i + 1] is the sum up to i in the block 
+    offsets[0] = 0
+    for block in range(nb_blocks): 
+        block_sum = 0 
+        for index in range(block * block_size, 
+                           ti.min((block + 1) * block_size, size)): 
+            block_sum += values[index]
+            offsets[index + 1] = block_sum
+
+    #propagate the sums to the last value of each block 
     ti.loop_config(serialize=True)
-    for i in range(f.shape[0]):
-        
-        if f[i] < minimal_value\
-              and f[i] != ti.math.inf: 
-            minimal_value = f[i]
-            index = i
+    for block in range(1, nb_blocks): 
+        last_index = ti.min((block + 1) * block_size, size)
+        offsets[last_index] += offsets[block * block_size]
 
-    return ti.math.vec2(minimal_value, 
-                        index)
+    #add the sum of the previous blocks to the other values 
+    for index in range(block_size, size): 
+        if (index + 1) % block_size != 0 and index + 1 != size: 
+            offsets[index + 1] += offsets[(index // block_size) * block_size]
 
 @ti.kernel
-def count_cycles(cycles: ti.template()) -> int: 
+def exclusive_scan(
+        values: ti.template(), 
+        offsets: ti.template()): 
     '''
-    Count the numbers of elements (cycles) in the 'cycles' field, 
-    used for the graph data. 
+    Compute the exclusive prefix sum of a field, see compute_exclusive_scan. 
 
     Parameters 
     -------
 
-    cycles : ti.template
+    values : ti.template
+
+        1D int field of size n. 
+
+    offsets : ti.template 
+
+        1D int field of size n + 1, containing the prefix sum. 
 
-        1D Vector field for which we want to the number of cycles 
-        which size is different from 0
 
-        
     Returns
     -------
 
-    int
+    None
+    '''
+    compute_exclusive_scan(values, 
+                           offsets)
 
-        number of cycles
+@ti.kernel
+def exclusive_scan_array(
+        values: ti.types.ndarray(), 
+        offsets: ti.types.ndarray()): 
     '''
-    cycles_count = 0
+    Compute the exclusive prefix sum of an array, see compute_exclusive_scan. 
+    The kernel is compiled once for all the arrays of the same type, 
+    while exclusive_scan is compiled for each field. 
 
-    for index in cycles: 
-        if cycles[index].y != 0: 
-            cycles_count += 1 
-    
-    return cycles_count
-    
-@ti.kernel 
-def fill_final_cycles(
-        cycles: ti.template(), 
-        final_cycles: ti.template()): 
+    Parameters 
+    -------
+
+    values : ti.types.ndarray
+
+        1D int array of size n. 
+
+    offsets : ti.types.ndarray 
+
+        1D int array of size n + 1, containing the prefix sum. 
+
+
+    Returns
+    -------
+
+    None
     '''
-    Fill the field final_cycles with the data of cycles
+    compute_exclusive_scan(values, 
+                           offsets)
+
+@ti.kernel
+def copy_field_interior(
+        array: ti.types.ndarray(), 
+        grid: ti.template()): 
+    '''
+    Write the values of an array in the interior of a field, transposing 
+    them, and a border of 1 around them. The array is read in place, without 
+    being copied, and may be memory-mapped. 
 
     Parameters 
     -------
 
-    cycles : ti.template
+    array : ti.types.ndarray 
 
-        1D Vector field with useless [0, 0] vectors. 
+        2D array of shape (grid.shape[1] - 2, grid.shape[0] - 2), 
+        of any floating point type. 
 
-    final_cycles : ti.template 
+    grid : ti.template 
         
-        1D Vector field without useless vectors. 
-
+        the 2D field containing the scalar field values. 
 
+        
     Returns
     -------
 
     None
     '''
-    for index in final_cycles: 
-        final_cycles[index] = cycles[index]
+    for x_index, y_index in grid: 
+        if x_index == 0 or y_index == 0\
+                or x_index == grid.shape[0] - 1 or y_index == grid.shape[1] - 1: 
+            grid[x_index, y_index] = 1.
+        else: 
+            grid[x_index, y_index] = array[y_index - 1, x_index - 1]
 
 @ti.kernel
 def compute_pixels(
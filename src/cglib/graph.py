@@ -1,30 +1,214 @@
 import taichi as ti 
+import numpy as np
+
+from cglib.index import index2d_to_edge_index, get_graph_edge
+from cglib.calc import linear_interpolation, euclidean_distance
+from cglib.fields import count_cycles, fill_final_cycles, exclusive_scan
+from cglib.implicit import get_grid_value
+
+
+
+'''
+Edges joined in a cell by the marching square algorithm, for each configuration 
+of the cell. The edges of a cell are numbered top, right, bottom, left, and the 
+bit k of the configuration is 1 if the corner k is above the isovalue, the 
+corners being numbered top left, top right, bottom right, bottom left. 
+Each row contains two pairs (edge, next edge), -1 if there is no pair. 
+The saddle configurations 5 and 10 depend on the average value of the cell: 
+the rows 5 and 10 are used when the average is above the isovalue, the rows 
+16 and 17 when it is below. 
+'''
+CELL_EDGE_PAIRS = [[-1, -1, -1, -1], 
+                   [ 0,  3, -1, -1], 
+                   [ 1,  0, -1, -1], 
+                   [ 1,  3, -1, -1], 
+                   [ 2,  1, -1, -1], 
+                   [ 0,  1,  2,  3], 
+                   [ 2,  0, -1, -1], 
+                   [ 2,  3, -1, -1], 
+                   [ 3,  2, -1, -1], 
+                   [ 0,  2, -1, -1], 
+                   [ 3,  0,  1,  2], 
+                   [ 1,  2, -1, -1], 
+                   [ 3,  1, -1, -1], 
+                   [ 0,  1, -1, -1], 
+                   [ 3,  0, -1, -1], 
+                   [-1, -1, -1, -1], 
+                   [ 0,  3,  2,  1], 
+                   [ 1,  0,  3,  2]]
 
-from cglib.index import index2d_to_edge_index
-from cglib.calc import linear_interpolation
-from cglib.fields import count_cycles, fill_final_cycles
 
 
-
-@ti.kernel 
-def compute_binary_grid(
+@ti.func
+def get_cell_values(
         grid: ti.template(), 
-        binary_grid: ti.template()): 
+        cell: ti.math.ivec2) -> ti.math.vec4: 
     '''
-    Gives a 1 to the binary grid if the value of the field with the same coordinates 
-    is positive, 0 if the value of the field is negative. 
+    Give the values of the scalar field at the four corners of a cell. 
 
     Parameters 
     -------
 
     grid: ti.template 
 
-        the 2D field containing the scalar field values. 
-        
-    binary_grid : ti.template 
+        the 2D field containing the scalar field values, or an ImplicitField. 
+
+    cell: ti.math.ivec2 
+
+        2D index of the cell. 
+
+
+    Returns
+    -------
+
+    ti.math.vec4
+
+        values at the top left, top right, bottom right and bottom left corners. 
+    '''
+    return ti.math.vec4(get_grid_value(grid, cell), 
+                        get_grid_value(grid, cell + ti.math.ivec2(0, 1)), 
+                        get_grid_value(grid, cell + ti.math.ivec2(1, 1)), 
+                        get_grid_value(grid, cell + ti.math.ivec2(1, 0)))
+
+@ti.func
+def get_cell_configuration(
+        cell_values: ti.math.vec4, 
+        isovalue: float) -> int: 
+    '''
+    Give the configuration of a cell in the marching square algorithm: 
+    the bit k is 1 if the value of the corner k is above the isovalue, 
+    0 if it is below. 
+
+    Parameters 
+    -------
+
+    cell_values: ti.math.vec4 
+
+        values of the corners of the cell, given by get_cell_values. 
+
+    isovalue: float 
+
+        value of the isocontours. 
+
+
+    Returns
+    -------
+
+    int
+
+        configuration of the cell, between 0 and 15. 
+    '''
+    configuration = 0
+    for corner in ti.static(range(4)): 
+        if ti.math.sign(cell_values[corner] - isovalue) != -1: 
+            configuration |= 1 << corner
+    return configuration
+
+@ti.func
+def is_edge_crossed(
+        configuration: int, 
+        corner_0: ti.template(), 
+        corner_1: ti.template()) -> bool: 
+    '''
+    Tell if the isocontour crosses the edge between two corners of a cell. 
+
+    Parameters 
+    -------
+
+    configuration: int 
+
+        configuration of the cell, given by get_cell_configuration. 
+
+    corner_0, corner_1: ti.template 
+
+        number of the two corners of the edge. 
+
+
+    Returns
+    -------
+
+    bool
+
+        True if one corner is above the isovalue and the other one below. 
+    '''
+    return ((configuration >> corner_0) & 1) != ((configuration >> corner_1) & 1)
+
+@ti.func
+def get_cell_edge_pairs(
+        configuration: int, 
+        cell_values: ti.math.vec4, 
+        isovalue: float) -> ti.math.ivec4: 
+    '''
+    Give the edges joined in a cell, read in CELL_EDGE_PAIRS. The interior, 
+    i.e. where the field is below the isovalue, is always to the left of the 
+    edges. The average value of the cell is only computed for the saddle 
+    configurations. 
+
+    Parameters 
+    -------
+
+    configuration: int 
+
+        configuration of the cell, given by get_cell_configuration. 
+
+    cell_values: ti.math.vec4 
+
+        values of the corners of the cell, given by get_cell_values. 
+
+    isovalue: float 
+
+        value of the isocontours. 
+
+
+    Returns
+    -------
+
+    ti.math.ivec4
+
+        two pairs (edge, next edge) numbered in the cell, -1 if there is no pair. 
+    '''
+    row = configuration
+    if configuration == 5 or configuration == 10: 
+        average_value = (cell_values[0] +\
+                         cell_values[1] +\
+                         cell_values[2] +\
+                         cell_values[3])/4
+        if configuration == 5 and not average_value > isovalue: 
+            row = 16
+        if configuration == 10 and average_value < isovalue: 
+            row = 17
+
+    edge_pairs = ti.Matrix(CELL_EDGE_PAIRS, ti.i32)
+    return ti.math.ivec4(edge_pairs[row, 0], 
+                         edge_pairs[row, 1], 
+                         edge_pairs[row, 2], 
+                         edge_pairs[row, 3])
+
+@ti.func
+def compute_cell_graph(
+        grid: ti.template(), 
+        isovalues: ti.template(), 
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(), 
+        edge_ids: ti.template(), 
+        tile_origin: ti.math.ivec2, 
+        field_shape: ti.template(), 
+        current_cell: ti.math.ivec2): 
+    '''
+    Compute the points of the edges owned by a cell and the adjacency of 
+    its edges for each level, see compute_graph. 
+
+    Parameters 
+    -------
+
+    grid, isovalues, points, previous_edge, next_edge, edge_ids, tile_origin, field_shape: 
+
+        see compute_graph. 
 
-        2D field of the same size than grid, 
-        containing the sine of the scalar field in each cell. 
+    current_cell: ti.math.ivec2 
+
+        2D index of the cell. 
 
 
     Returns
@@ -32,39 +216,129 @@ def compute_binary_grid(
 
     None
     '''
-    for x_index, y_index in grid:
+    grid_shape = ti.math.ivec2(grid.shape[0], 
+                               grid.shape[1])
+    level_size = points.shape[0] // isovalues.shape[0]
+    x_index = current_cell.x
+    y_index = current_cell.y
+
+    #border case
+    if x_index != grid_shape.x-1 and y_index != grid_shape.y-1: 
 
-        if ti.math.sign(grid[x_index, y_index]) == -1: 
-            binary_grid[x_index, y_index] = 0
-        else:  
-            binary_grid[x_index, y_index] = 1
+        cell_values = get_cell_values(grid, 
+                                      current_cell)
+        grid_edge_indexes = index2d_to_edge_index(current_cell, 
+                                                  grid_shape)
+
+        for level in range(isovalues.shape[0]): 
+
+            isovalue = isovalues[level]
+            current_cell_configuration = get_cell_configuration(cell_values, 
+                                                                isovalue)
+        
+            #if the cell contains an isocontour
+            if current_cell_configuration != 0 and current_cell_configuration != 15: 
+
+                edge_indexes = ti.math.ivec4(0)
+                for edge_number in ti.static(range(4)): 
+                    edge_indexes[edge_number] = get_graph_edge(edge_ids, 
+                                                               grid_edge_indexes[edge_number])\
+                                                + level * level_size
+
+                '''
+                Compute the points of the cell.
+                we compute only the right and bottom points, so we 
+                can parallelize the computation without conflicts.
+                '''
+                #right edge
+                if is_edge_crossed(current_cell_configuration, 1, 2): 
+                    points[edge_indexes[1]] = linear_interpolation(grid, 
+                                                                   ti.math.ivec2(x_index, y_index+1),
+                                                                   ti.math.ivec2(x_index+1 , y_index+1), 
+                                                                   isovalue, 
+                                                                   tile_origin, 
+                                                                   field_shape)
+
+                #bottom edge
+                if is_edge_crossed(current_cell_configuration, 2, 3): 
+                    points[edge_indexes[2]] = linear_interpolation(grid, 
+                                                                   ti.math.ivec2(x_index+1, y_index+1),
+                                                                   ti.math.ivec2(x_index+1, y_index), 
+                                                                   isovalue, 
+                                                                   tile_origin, 
+                                                                   field_shape)
+
+                #top and left edges of the first row and column, 
+                #which are not the bottom or right edge of another cell 
+                if x_index == 0 and is_edge_crossed(current_cell_configuration, 0, 1): 
+                    points[edge_indexes[0]] = linear_interpolation(grid, 
+                                                                   ti.math.ivec2(x_index, y_index), 
+                                                                   ti.math.ivec2(x_index, y_index+1), 
+                                                                   isovalue, 
+                                                                   tile_origin, 
+                                                                   field_shape)
+
+                if y_index == 0 and is_edge_crossed(current_cell_configuration, 3, 0): 
+                    points[edge_indexes[3]] = linear_interpolation(grid, 
+                                                                   ti.math.ivec2(x_index+1, y_index), 
+                                                                   ti.math.ivec2(x_index, y_index), 
+                                                                   isovalue, 
+                                                                   tile_origin, 
+                                                                   field_shape)
+
+                #compute the adjacency of the graph
+                edge_pairs = get_cell_edge_pairs(current_cell_configuration, 
+                                                 cell_values, 
+                                                 isovalue)
+                for pair_number in ti.static(range(2)): 
+                    if edge_pairs[2*pair_number] != -1: 
+                        edge = edge_indexes[edge_pairs[2*pair_number]]
+                        following_edge = edge_indexes[edge_pairs[2*pair_number + 1]]
+                        next_edge[edge] = following_edge
+                        previous_edge[following_edge] = edge
 
 @ti.kernel
 def compute_graph(
         grid: ti.template(), 
-        binary_grid: ti.template(), 
+        isovalues: ti.template(), 
         points: ti.template(),
         previous_edge: ti.template(),
-        next_edge: ti.template()): 
+        next_edge: ti.template(), 
+        edge_ids: ti.template(), 
+        tile_origin: ti.math.ivec2, 
+        field_shape: ti.template()): 
     '''
     Compute the adjacency (previous point and next point in the cycle) 
-    for each point of the graph. The interior, i.e. where the field is negative, 
-    should always be to the left of the edges. See marching square algorithm
-    to understand the way the configuration of a cell is defined. 
+    for each point of the graph. The interior, i.e. where the field is below 
+    the isovalue, should always be to the left of the edges. See marching square 
+    algorithm to understand the way the configuration of a cell is defined. 
     Compute also the coordinates of all the points in the graph.
     The border cells are not considered.
 
+    The corners of each cell are read once and classified for each level in 
+    registers, and the edges joined in the cell are read in CELL_EDGE_PAIRS. 
+
+    The graphs of all the levels are computed in the same launch. They are 
+    stacked in the fields of the graph: the edges of a level are offset by 
+    the level times the number of edges of a level, and the adjacency gives 
+    these offset edges, so that the cycles of all the levels can be computed 
+    at once. 
+
     Parameters 
     -------
 
     grid: ti.template 
 
-        the 2D field containing the scalar field values. 
-        
-    binary_grid : ti.template 
+        the 2D field containing the scalar field values, or an ImplicitField. 
 
-        2D field of the same size than grid, 
-        containing the sine of the scalar field in each cell. 
+    isovalues : ti.template 
+
+        1D field containing the isovalue of each level. 
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to 1D indexes of the grid edges. 
 
     previous_edge: ti.template
 
@@ -76,154 +350,191 @@ def compute_graph(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    edge_ids : ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. None if the fields are arranged 
+        according to 1D indexes of the grid edges. A compact graph has 
+        a single level. 
+
+    tile_origin: ti.math.ivec2 
+
+        2D index in the whole field of the first point of the grid, if the 
+        grid is a tile of a larger field, see to_tiled_graph. The edges are 
+        still arranged according to the grid, only the points are given in 
+        the whole field. (0, 0) if the grid is the whole field. 
+
+    field_shape: ti.template 
+
+        2D shape of the whole field, as a tuple. 
+
 
     Returns
     -------
 
     None
     '''
+    for x_index, y_index in ti.ndrange(grid.shape[0], grid.shape[1]):
+        compute_cell_graph(grid, 
+                           isovalues, 
+                           points, 
+                           previous_edge, 
+                           next_edge, 
+                           edge_ids, 
+                           tile_origin, 
+                           field_shape, 
+                           ti.math.ivec2(x_index, y_index))
+
+@ti.func
+def get_owned_edges(
+        grid: ti.template(), 
+        isovalue: float, 
+        cell: ti.math.ivec2) -> ti.math.ivec4: 
+    '''
+    Give the edges of a cell which carry a point and whose point is computed 
+    by this cell in compute_graph: the right and bottom edges, and the top 
+    and left edges in the first row and column. Each edge with a point is 
+    owned by exactly one cell. The border cells own no edge. 
+
+    Parameters 
+    -------
+
+    grid: ti.template 
+
+        the 2D field containing the scalar field values, or an ImplicitField. 
+
+    isovalue: float 
+
+        value of the isocontours. 
+
+    cell: ti.math.ivec2 
+
+        2D index of the cell. 
+
+
+    Returns
+    -------
+
+    ti.math.ivec4
+
+        1D grid index of the top, right, bottom and left edges if the cell 
+        owns them, -1 otherwise. 
+    '''
     grid_shape = ti.math.ivec2(grid.shape[0], 
                                grid.shape[1])
+    result = ti.math.ivec4(-1, -1, -1, -1)
 
-    for x_index, y_index in binary_grid:
+    #border case
+    if cell.x != grid_shape.x-1 and cell.y != grid_shape.y-1: 
 
-        #border case
-        if x_index != grid_shape.x-1 and y_index != grid_shape.y-1: 
+        edge_indexes = index2d_to_edge_index(cell, 
+                                             grid_shape)
+        configuration = get_cell_configuration(get_cell_values(grid, cell), 
+                                               isovalue)
 
-            current_cell = ti.math.ivec2(x_index, y_index)
-            
-            current_cell_configuration =\
-                        1*binary_grid[current_cell.x, current_cell.y] +\
-                        2*binary_grid[current_cell.x, current_cell.y+1] +\
-                        4*binary_grid[current_cell.x+1, current_cell.y+1] +\
-                        8*binary_grid[current_cell.x+1, current_cell.y]
-            
-            #if the cell contains an isocontour
-            if current_cell_configuration != 0 and current_cell_configuration != 15: 
+        if cell.x == 0 and is_edge_crossed(configuration, 0, 1): 
+            result[0] = edge_indexes[0]
 
-                '''
-                Compute the points of the cell.
-                we compute only the right and bottom points, so we 
-                can parallelize the computation without conflicts.
-                '''
-                edge_indexes = index2d_to_edge_index(current_cell, 
-                                                    grid_shape)
-                
-                #right edge
-                if binary_grid[x_index, y_index+1] !=  binary_grid[x_index+1, y_index+1]: 
-                    right_edge_point = linear_interpolation(grid, 
-                                                            ti.math.ivec2(x_index, y_index+1),
-                                                            ti.math.ivec2(x_index+1 , y_index+1), 
-                                                            0.)
-                    points[edge_indexes[1]] = right_edge_point
+        if is_edge_crossed(configuration, 1, 2): 
+            result[1] = edge_indexes[1]
 
-                #bottom edge
-                if binary_grid[x_index+1, y_index+1] !=  binary_grid[x_index+1, y_index]: 
-                    bottom_edge_point = linear_interpolation(grid, 
-                                                            ti.math.ivec2(x_index+1, y_index+1),
-                                                            ti.math.ivec2(x_index+1, y_index), 
-                                                            0.)
-                    points[edge_indexes[2]] = bottom_edge_point
+        if is_edge_crossed(configuration, 2, 3): 
+            result[2] = edge_indexes[2]
 
-                '''
-                Compute the adjacency of the graph. For each case of the marching
-                square algorithm, we define the next and previous edge.
-                The interior of the cycle is always to the left of the edge 
-                and is defined as the points where the scalar field is negative .
-                ''' 
-                if current_cell_configuration == 1: 
-                    next_edge[edge_indexes[0]] = edge_indexes[3]
-                    previous_edge[edge_indexes[3]] = edge_indexes[0]
-
-                            
-                elif current_cell_configuration == 2: 
-                    next_edge[edge_indexes[1]] = edge_indexes[0]
-                    previous_edge[edge_indexes[0]] = edge_indexes[1]
-                    
-                                        
-                elif current_cell_configuration == 3: 
-                    next_edge[edge_indexes[1]] = edge_indexes[3]
-                    previous_edge[edge_indexes[3]] = edge_indexes[1]
-                
-                                        
-                elif current_cell_configuration == 4: 
-                    next_edge[edge_indexes[2]] = edge_indexes[1]
-                    previous_edge[edge_indexes[1]] = edge_indexes[2]
-
-                #two edges in the cell                     
-                elif current_cell_configuration == 5: 
-
-
-                    average_value = (grid[current_cell.x, current_cell.y] +\
-                                        grid[current_cell.x, current_cell.y + 1] +\
-                                        grid[current_cell.x+ 1, current_cell.y+1] +\
-                                        grid[current_cell.x+1, current_cell.y])/4
-                    
-                    if average_value > 0: 
-                        next_edge[edge_indexes[0]] = edge_indexes[1]
-                        previous_edge[edge_indexes[1]] = edge_indexes[0]
-                        
-                        next_edge[edge_indexes[2]] = edge_indexes[3]
-                        previous_edge[edge_indexes[3]] = edge_indexes[2]
-                    else: 
-                        next_edge[edge_indexes[0]] = edge_indexes[3]
-                        previous_edge[edge_indexes[3]] = edge_indexes[0]
-                        
-                        next_edge[edge_indexes[2]] = edge_indexes[1]
-                        previous_edge[edge_indexes[1]] = edge_indexes[2]
-                
-                elif current_cell_configuration == 6: 
-                    next_edge[edge_indexes[2]] = edge_indexes[0]
-                    previous_edge[edge_indexes[0]] = edge_indexes[2]
-
-                elif current_cell_configuration == 7: 
-                    next_edge[edge_indexes[2]] = edge_indexes[3]
-                    previous_edge[edge_indexes[3]] = edge_indexes[2]
-
-                elif current_cell_configuration == 8: 
-                    next_edge[edge_indexes[3]] = edge_indexes[2]
-                    previous_edge[edge_indexes[2]] = edge_indexes[3]
-
-                elif current_cell_configuration == 9: 
-                    next_edge[edge_indexes[0]] = edge_indexes[2]
-                    previous_edge[edge_indexes[2]] = edge_indexes[0]
-
-                #two edges in the cell 
-                elif current_cell_configuration == 10: 
-
-                    average_value = (grid[current_cell.x, current_cell.y] +\
-                                        grid[current_cell.x, current_cell.y + 1] +\
-                                        grid[current_cell.x+ 1, current_cell.y+1] +\
-                                        grid[current_cell.x+1, current_cell.y])/4
-                    
-                    if average_value < 0: 
-                        next_edge[edge_indexes[1]] = edge_indexes[0]
-                        previous_edge[edge_indexes[0]] = edge_indexes[1]
-                        
-                        next_edge[edge_indexes[3]] = edge_indexes[2]
-                        previous_edge[edge_indexes[2]] = edge_indexes[3]
-                    else: 
-                        next_edge[edge_indexes[3]] = edge_indexes[0]
-                        previous_edge[edge_indexes[0]] = edge_indexes[3]
-                        
-                        next_edge[edge_indexes[1]] = edge_indexes[2]
-                        previous_edge[edge_indexes[2]] = edge_indexes[1]       
-
-                elif current_cell_configuration == 11: 
-                    next_edge[edge_indexes[1]] = edge_indexes[2]
-                    previous_edge[edge_indexes[2]] = edge_indexes[1]
-                    
-                elif current_cell_configuration == 12: 
-                    next_edge[edge_indexes[3]] = edge_indexes[1]
-                    previous_edge[edge_indexes[1]] = edge_indexes[3]
-
-                elif current_cell_configuration == 13: 
-                    next_edge[edge_indexes[0]] = edge_indexes[1]
-                    previous_edge[edge_indexes[1]] = edge_indexes[0]
-
-                elif current_cell_configuration == 14: 
-                    next_edge[edge_indexes[3]] = edge_indexes[0]
-                    previous_edge[edge_indexes[0]] = edge_indexes[3]
+        if cell.y == 0 and is_edge_crossed(configuration, 3, 0): 
+            result[3] = edge_indexes[3]
+
+    return result
+
+@ti.kernel
+def count_active_edges(
+        grid: ti.template(), 
+        isovalue: float, 
+        edge_count: ti.template()): 
+    '''
+    Count the edges carrying a point which are owned by each cell. 
+
+    Parameters 
+    -------
+
+    grid: ti.template 
+
+        the 2D field containing the scalar field values, or an ImplicitField. 
+
+    isovalue: float 
+
+        value of the isocontours. 
+
+    edge_count : ti.template 
+
+        1D field containing the number of edges owned by each cell, 
+        arranged according to the 1D index x * shape.y + y of the cells. 
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in ti.ndrange(grid.shape[0], grid.shape[1]): 
+
+        owned_edges = get_owned_edges(grid, 
+                                      isovalue, 
+                                      ti.math.ivec2(x_index, y_index))
+        count = 0
+        for edge_number in ti.static(range(4)): 
+            if owned_edges[edge_number] != -1: 
+                count += 1
+
+        edge_count[x_index * grid.shape[1] + y_index] = count
+
+@ti.kernel
+def fill_edge_ids(
+        grid: ti.template(), 
+        isovalue: float, 
+        edge_offsets: ti.template(), 
+        edge_ids: ti.template()): 
+    '''
+    Write the grid 1D index of the edges owned by each cell in its output 
+    slots. The first slot of edge_ids is not an edge and is set to -1, so 
+    that next_edge is still 0 for an edge without point. 
+
+    Parameters 
+    -------
+
+    grid: ti.template 
+
+        the 2D field containing the scalar field values, or an ImplicitField. 
+
+    isovalue: float 
+
+        value of the isocontours. 
+
+    edge_offsets : ti.template 
+
+        exclusive prefix sum of the number of edges owned by each cell. 
+
+    edge_ids : ti.template 
+
+        1D field containing the grid 1D index of each edge of the graph. 
+
+
+    Returns
+    -------
+
+    None
+    '''
+    edge_ids[0] = -1
+    for x_index, y_index in ti.ndrange(grid.shape[0], grid.shape[1]): 
+
+        owned_edges = get_owned_edges(grid, 
+                                      isovalue, 
+                                      ti.math.ivec2(x_index, y_index))
+        slot = edge_offsets[x_index * grid.shape[1] + y_index] + 1
+        for edge_number in ti.static(range(4)): 
+            if owned_edges[edge_number] != -1: 
+                edge_ids[slot] = owned_edges[edge_number]
+                slot += 1
 
 @ti.kernel
 def compute_cycles(
@@ -272,6 +583,46 @@ def compute_cycles(
                 cycle_number)
             cycle_number += 1
 
+@ti.kernel
+def compute_segment_lengths(
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        segment_length: ti.template()): 
+    '''
+    Compute the length of the segment between the point of each edge and 
+    the point of its next edge. The stitching algorithms read these lengths 
+    instead of computing them for each energy, and update them when the 
+    adjacency of two edges is exchanged. 
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        1D field containing the length of the segment of each edge, 
+        0 if there is no point on the edge. 
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge_index in next_edge: 
+        segment_length[edge_index] = 0.
+        if next_edge[edge_index] != 0: 
+            segment_length[edge_index] = euclidean_distance(points[edge_index]\
+                                                            - points[next_edge[edge_index]])
+
 @ti.func
 def flood( 
         next_edge: ti.template(), 
@@ -330,8 +681,492 @@ def flood(
     cycles[cycle_number].x = first_edge
     cycles[cycle_number].y = cycle_lenght
 
+@ti.kernel
+def init_cycle_labels(
+        next_edge: ti.template(), 
+        cycle_label: ti.template(), 
+        jump_edge: ti.template()): 
+    '''
+    Initialise the pointer jumping: each edge is labelled with its own 
+    index and points to its next edge. 
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_label: ti.template
+
+        1D field containing the minimal index found in the cycle of each 
+        edge, -1 if there is no point on the edge. 
+
+    jump_edge: ti.template
+
+        1D field containing the edge to which each edge points. 
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge_index in next_edge: 
+        cycle_label[edge_index] = -1
+        jump_edge[edge_index] = next_edge[edge_index]
+        if next_edge[edge_index] != 0: 
+            cycle_label[edge_index] = edge_index
+
+@ti.kernel
+def jump_cycle_labels(
+        cycle_label: ti.template(), 
+        jump_edge: ti.template(), 
+        new_cycle_label: ti.template(), 
+        new_jump_edge: ti.template()) -> int: 
+    '''
+    Make one round of pointer jumping. If the label of each edge is the 
+    minimal index of the 2^k edges from this edge, and if each edge points 
+    to the edge 2^k further, the fields hold the same for 2^(k+1) edges 
+    after the round. 
+
+    Parameters
+    -------
+
+    cycle_label, jump_edge: ti.template
+
+        labels and pointers, updated by the round. 
+
+    new_cycle_label, new_jump_edge: ti.template
+
+        buffers of the round, so that each edge reads the fields 
+        of the previous round. 
+
+    Returns
+    -------
+
+    int 
+
+        number of labels changed during the round. When no label changes, 
+        the label of each edge is the minimal index of its cycle. 
+    '''
+    nb_changes = 0
+    for edge_index in cycle_label: 
+        if cycle_label[edge_index] != -1: 
+            jump = jump_edge[edge_index]
+            label = ti.min(cycle_label[edge_index], 
+                           cycle_label[jump])
+            if label != cycle_label[edge_index]: 
+                nb_changes += 1
+
+            new_cycle_label[edge_index] = label
+            new_jump_edge[edge_index] = jump_edge[jump]
+
+    for edge_index in cycle_label: 
+        if cycle_label[edge_index] != -1: 
+            cycle_label[edge_index] = new_cycle_label[edge_index]
+            jump_edge[edge_index] = new_jump_edge[edge_index]
+
+    return nb_changes
+
+@ti.kernel
+def count_cycle_lengths(
+        cycle_label: ti.template(), 
+        cycle_length: ti.template(), 
+        is_representative: ti.template()): 
+    '''
+    Compute the length of each cycle with a histogram of the labels, and 
+    mark the representative of each cycle, i.e. its edge with the minimal 
+    index. 
+
+    Parameters
+    -------
+
+    cycle_label: ti.template
+
+        1D field containing the minimal index of the cycle of each edge, 
+        -1 if there is no point on the edge. 
+
+    cycle_length: ti.template
+
+        1D field containing the length of the cycle of each representative. 
+
+    is_representative: ti.template
+
+        1D field containing 1 if the edge is the representative of its cycle. 
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge_index in cycle_label: 
+        cycle_length[edge_index] = 0
+        is_representative[edge_index] = 0
+        if cycle_label[edge_index] == edge_index: 
+            is_representative[edge_index] = 1
+
+    for edge_index in cycle_label: 
+        if cycle_label[edge_index] != -1: 
+            ti.atomic_add(cycle_length[cycle_label[edge_index]], 1)
+
+@ti.kernel
+def fill_labelled_cycles(
+        cycle_label: ti.template(), 
+        cycle_length: ti.template(), 
+        cycle_offsets: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template()): 
+    '''
+    Give to each edge the index of its cycle, which is the number of 
+    representatives before the representative of the cycle, and fill 
+    the cycles. The layout is the same as the one given by compute_cycles. 
+
+    Parameters
+    -------
+
+    cycle_label: ti.template
+
+        1D field containing the minimal index of the cycle of each edge, 
+        -1 if there is no point on the edge. 
+
+    cycle_length: ti.template
+
+        1D field containing the length of the cycle of each representative. 
+
+    cycle_offsets: ti.template
+
+        exclusive prefix sum of the representatives. 
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+    
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge_index in cycle_label: 
+        label = cycle_label[edge_index]
+        if label != -1: 
+            cycle_index[edge_index] = cycle_offsets[label]
+            if label == edge_index: 
+                cycles[cycle_offsets[edge_index]] = ti.math.ivec2(edge_index, 
+                                                                  cycle_length[edge_index])
+
+def compute_cycles_by_pointer_jumping(
+        next_edge: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template()) -> int: 
+    '''
+    Compute the cycles of the graph in parallel, with the same result as 
+    compute_cycles. The representative of each cycle is its edge with the 
+    minimal index, which is found by pointer jumping in O(log L) rounds for 
+    a cycle of length L. The lengths are given by a histogram of the 
+    representatives, and the cycles are numbered by a prefix sum of the 
+    representatives, i.e. in the order in which compute_cycles discovers them. 
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+    
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+    Returns
+    -------
+
+    int
+
+        number of rounds of pointer jumping
+    '''
+    cycle_label = ti.field(dtype = int, 
+                           shape = next_edge.shape)
+    jump_edge = ti.field(dtype = int, 
+                         shape = next_edge.shape)
+    new_cycle_label = ti.field(dtype = int, 
+                               shape = next_edge.shape)
+    new_jump_edge = ti.field(dtype = int, 
+                             shape = next_edge.shape)
+
+    init_cycle_labels(next_edge, 
+                      cycle_label, 
+                      jump_edge)
+
+    nb_rounds = 0
+    nb_changes = 1
+    while nb_changes > 0: 
+        nb_changes = jump_cycle_labels(cycle_label, 
+                                       jump_edge, 
+                                       new_cycle_label, 
+                                       new_jump_edge)
+        nb_rounds += 1
+
+    # the buffers of the rounds hold the lengths and the representatives 
+    cycle_length = new_cycle_label
+    is_representative = new_jump_edge
+    count_cycle_lengths(cycle_label, 
+                        cycle_length, 
+                        is_representative)
+
+    cycle_offsets = ti.field(dtype = int, 
+                             shape = next_edge.shape[0] + 1)
+    exclusive_scan(is_representative, 
+                   cycle_offsets)
+    fill_labelled_cycles(cycle_label, 
+                         cycle_length, 
+                         cycle_offsets, 
+                         cycle_index, 
+                         cycles)
+
+    return nb_rounds
+
+def label_cycles(
+        next_edge: ti.template(), 
+        use_pointer_jumping: bool = False) -> tuple[ti.template(), 
+                                                    ti.template()]: 
+    '''
+    Compute the cycles of a graph whose adjacency is known. 
+
+    Parameters 
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    use_pointer_jumping: bool 
+
+        if True, the cycles are labelled in parallel by pointer jumping, 
+        instead of flooding them one by one. The result is the same. 
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
+
+        - cycle_index: index of the cycle to which each edge belongs, 
+          -1 if there is no point on the edge. 
+        - cycles: starting edge and length of each cycle. 
+    '''
+    cycle_index = ti.field(dtype = int, 
+                           shape = next_edge.shape) 
+    cycle_index.fill(-1)
+    cycles = ti.Vector.field(n = 2, 
+                             dtype = int, 
+                             shape = next_edge.shape)
+
+    if use_pointer_jumping: 
+        compute_cycles_by_pointer_jumping(next_edge, 
+                                          cycle_index, 
+                                          cycles)
+    else: 
+        compute_cycles(next_edge, 
+                       cycle_index, 
+                       cycles)
+
+    # reduce the size of the cycle field 
+    cycles_count = count_cycles(cycles)
+    final_cycles = ti.Vector.field(n = 2, 
+                                   dtype = int, 
+                                   shape = cycles_count) 
+    fill_final_cycles(cycles, 
+                      final_cycles)
+
+    return cycle_index, final_cycles
+
+def split_levels(
+        points: ti.template(), 
+        previous_edge: ti.template(), 
+        next_edge: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template(), 
+        nb_levels: int) -> list[tuple]: 
+    '''
+    Split a graph whose levels are stacked, see compute_graph, into one graph 
+    per level arranged according to 1D indexes of the grid edges. The cycles 
+    are numbered in the order of their starting edge, so the cycles of each 
+    level are contiguous. 
+
+    Parameters 
+    -------
+
+    points, previous_edge, next_edge, cycle_index, cycles: ti.template 
+
+        fields of the stacked graph. 
+
+    nb_levels: int 
+
+        number of levels stacked in the graph. 
+
+
+    Returns
+    -------
+
+    list[tuple]
+
+        the graph of each level, in the order of the levels, see to_graph. 
+    '''
+    level_size = points.shape[0] // nb_levels
+    all_points = points.to_numpy()
+    all_previous_edges = previous_edge.to_numpy()
+    all_next_edges = next_edge.to_numpy()
+    all_cycle_indexes = cycle_index.to_numpy()
+    all_cycles = cycles.to_numpy()
+
+    cycle_offsets = np.searchsorted(all_cycles[:, 0], 
+                                    np.arange(nb_levels + 1) * level_size)
+
+    graphs = []
+    for level in range(nb_levels): 
+
+        edges = slice(level * level_size, 
+                      (level + 1) * level_size)
+        first_cycle = cycle_offsets[level]
+        last_cycle = cycle_offsets[level + 1]
+
+        level_points = ti.Vector.field(n=2, 
+                                       dtype=float, 
+                                       shape=level_size) 
+        level_points.from_numpy(all_points[edges])
+
+        # the adjacency gives the stacked edges, 0 is still no edge 
+        level_previous_edge = ti.field(dtype = int, 
+                                       shape = level_size)
+        level_previous_edge.from_numpy(np.where(all_previous_edges[edges] != 0, 
+                                                all_previous_edges[edges] - edges.start, 
+                                                0).astype(np.int32))
+
+        level_next_edge = ti.field(dtype = int, 
+                                   shape = level_size)
+        level_next_edge.from_numpy(np.where(all_next_edges[edges] != 0, 
+                                            all_next_edges[edges] - edges.start, 
+                                            0).astype(np.int32))
+
+        level_cycle_index = ti.field(dtype = int, 
+                                     shape = level_size)
+        level_cycle_index.from_numpy(np.where(all_cycle_indexes[edges] != -1, 
+                                              all_cycle_indexes[edges] - first_cycle, 
+                                              -1).astype(np.int32))
+
+        level_cycles = ti.Vector.field(n = 2, 
+                                       dtype = int, 
+                                       shape = last_cycle - first_cycle)
+        level_cycles.from_numpy((all_cycles[first_cycle:last_cycle]\
+                                 - np.array([edges.start, 0])).astype(np.int32))
+
+        graphs.append((level_points, 
+                       level_previous_edge, 
+                       level_next_edge, 
+                       level_cycle_index, 
+                       level_cycles))
+
+    return graphs
+
+def to_graphs(
+        grid: ti.template(), 
+        isovalues: list[float], 
+        use_pointer_jumping: bool = False) -> list[tuple]: 
+    '''
+    Extract the isocontours of several isovalues from the scalar field and 
+    arrange them in the form of one graph per isovalue. The graphs of all the 
+    levels are computed in a single pass over the field, stacked in the same 
+    fields, and the cycles of all the levels are computed at once. The kernels 
+    are therefore compiled and launched once for all the levels, instead of 
+    once for the graph of each level. 
+
+    Parameters 
+    -------
+
+    grid: ti.template 
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    isovalues: list[float] 
+
+        isovalue of each level. 
+
+    use_pointer_jumping: bool 
+
+        if True, the cycles are labelled in parallel by pointer jumping, 
+        instead of flooding them one by one. The result is the same. 
+
+
+    Returns
+    -------
+
+    list[tuple]
+
+        the graph of each level, in the order of isovalues, see to_graph. 
+    '''
+    nb_levels = len(isovalues)
+
+    #initialise the fields of the graph
+    edge_fields_shape = grid.shape[0]*(grid.shape[1]+1)\
+            + grid.shape[1] *(grid.shape[0]+1)\
+            - 1    
+    
+    level_values = ti.field(dtype = float, 
+                            shape = nb_levels)
+    level_values.from_numpy(np.array(isovalues, 
+                                     dtype = np.float32))
+
+    points = ti.Vector.field(n=2, 
+                             dtype=float, 
+                             shape=nb_levels * edge_fields_shape) 
+    
+    previous_edge= ti.field(dtype = int, 
+                            shape = nb_levels * edge_fields_shape)
+    
+    next_edge= ti.field(dtype = int, 
+                        shape = nb_levels * edge_fields_shape)
+    
+    # get the adjacency and the points of the graph 
+    compute_graph(grid, 
+                level_values, 
+                points,
+                previous_edge, 
+                next_edge, 
+                None, 
+                ti.math.ivec2(0, 0), 
+                grid.shape)
+    
+    # get the cycles of the graph
+    cycle_index, final_cycles = label_cycles(next_edge, 
+                                             use_pointer_jumping)
+
+    if nb_levels == 1: 
+        return [(points, previous_edge, next_edge, cycle_index, final_cycles)]
+
+    return split_levels(points, 
+                        previous_edge, 
+                        next_edge, 
+                        cycle_index, 
+                        final_cycles, 
+                        nb_levels)
+
 def to_graph(
-        grid: ti.template()) -> tuple[ti.template(),  
+        grid: ti.template(), 
+        use_pointer_jumping: bool = False, 
+        isovalue: float = 0.) -> tuple[ti.template(),  
                                         ti.template(), 
                                         ti.template(), 
                                         ti.template(),
@@ -344,7 +1179,17 @@ def to_graph(
 
     grid: ti.template 
 
-        the 2D field containing the scalar field values.
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    use_pointer_jumping: bool 
+
+        if True, the cycles are labelled in parallel by pointer jumping, 
+        instead of flooding them one by one. The result is the same. 
+
+    isovalue: float 
+
+        value of the isocontours, 0 by default. See to_graphs to extract 
+        several isovalues at once. 
 
 
     Returns
@@ -359,55 +1204,106 @@ def to_graph(
             - cycle_index 
             - cycles 
     '''
+    return to_graphs(grid, 
+                     [isovalue], 
+                     use_pointer_jumping)[0]
 
-    #initialise the fields of the graph
-    edge_fields_shape = grid.shape[0]*(grid.shape[1]+1)\
-            + grid.shape[1] *(grid.shape[0]+1)\
-            - 1    
-    
-    binary_grid = ti.field(dtype = int, shape = grid.shape) 
+def to_compact_graph(
+        grid: ti.template(), 
+        use_pointer_jumping: bool = False, 
+        isovalue: float = 0.) -> tuple[ti.template(),  
+                                        ti.template(), 
+                                        ti.template(), 
+                                        ti.template(),
+                                        ti.template(), 
+                                        ti.template()]: 
+    '''
+    Extract the isocontours from the scalar field and arrange them in the form 
+    of a compact graph, whose fields only contain the edges carrying a point. 
+    The edges are numbered from 1 in the order of their grid 1D index, the 
+    index 0 is kept free so that next_edge is 0 for no edge, and edge_ids 
+    gives the grid 1D index of each edge. The stitching algorithms accept 
+    this graph when edge_ids is passed to them. 
+
+    The edges owned by each cell are counted, their output slots are given 
+    by a prefix sum, and the points and their adjacency are written directly 
+    in the compact fields. 
+
+    Parameters 
+    -------
+
+    grid: ti.template 
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    use_pointer_jumping: bool 
+
+        if True, the cycles are labelled in parallel by pointer jumping, 
+        instead of flooding them one by one. The result is the same. 
+
+    isovalue: float 
+
+        value of the isocontours, 0 by default. 
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
     
+        fields describing the graph
+            - points 
+            - previous_edge 
+            - next_edge 
+            - cycle_index 
+            - cycles 
+            - edge_ids 
+    '''
+    # count the edges with a point and give them an output slot
+    edge_count = ti.field(dtype = int, 
+                          shape = grid.shape[0] * grid.shape[1])
+    edge_offsets = ti.field(dtype = int, 
+                            shape = grid.shape[0] * grid.shape[1] + 1)
+    count_active_edges(grid, 
+                       isovalue, 
+                       edge_count)
+    exclusive_scan(edge_count, 
+                   edge_offsets)
+    edge_fields_shape = edge_offsets[grid.shape[0] * grid.shape[1]] + 1
+
+    # the map between the compact edges and the grid edges, sorted so that 
+    # the edges are browsed in the same order as in the grid 
+    edge_ids = ti.field(dtype = int, 
+                        shape = edge_fields_shape)
+    fill_edge_ids(grid, 
+                  isovalue, 
+                  edge_offsets, 
+                  edge_ids)
+    edge_ids.from_numpy(np.sort(edge_ids.to_numpy()))
+
     points = ti.Vector.field(n=2, 
                              dtype=float, 
                              shape=edge_fields_shape) 
-    
     previous_edge= ti.field(dtype = int, 
                             shape = edge_fields_shape)
-    
     next_edge= ti.field(dtype = int, 
                         shape = edge_fields_shape)
-    
-    cycle_index = ti.field(dtype = int, 
-                           shape = edge_fields_shape) 
-    cycle_index.fill(-1)
 
-    cycles = ti.Vector.field(n = 2, 
-                             dtype = int, 
-                             shape = edge_fields_shape)
-    
-    # compute the binary grid
-    compute_binary_grid(grid, 
-                        binary_grid)
-    
     # get the adjacency and the points of the graph 
+    level_values = ti.field(dtype = float, 
+                            shape = 1)
+    level_values[0] = isovalue
     compute_graph(grid, 
-                binary_grid, 
-                points,
-                previous_edge, 
-                next_edge)
+                  level_values, 
+                  points, 
+                  previous_edge, 
+                  next_edge, 
+                  edge_ids, 
+                  ti.math.ivec2(0, 0), 
+                  grid.shape)
     
     # get the cycles of the graph
-    compute_cycles(
-                next_edge, 
-                cycle_index,
-                cycles)
-
-    # reduce the size of the cycle field 
-    cycles_count = count_cycles(cycles)
-    final_cycles = ti.Vector.field(n = 2, 
-                                   dtype = int, 
-                                   shape = cycles_count) 
-    fill_final_cycles(cycles, 
-                      final_cycles)
+    cycle_index, final_cycles = label_cycles(next_edge, 
+                                             use_pointer_jumping)
 
-    return points, previous_edge, next_edge, cycle_index, final_cycles
\ No newline at end of file
+    return points, previous_edge, next_edge, cycle_index, final_cycles, edge_ids
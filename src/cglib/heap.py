@@ -0,0 +1,335 @@
+import taichi as ti
+
+
+
+'''
+This module contains a binary min-heap of cycles stored in Taichi fields.
+It is used by the stitching algorithm to find the minimal cycle without
+browsing all the cycles at each iteration. The cycles are ordered by length,
+then by index, so that the heap gives the same cycle as find_minimal_cycle.
+
+    - heap: 1D field containing the index of the cycles, arranged as a binary tree.
+    - heap_position: 1D field containing the position of each cycle in the heap,
+      -1 if the cycle is not in the heap.
+
+'''
+
+
+
+@ti.func
+def is_before(
+        cycles: ti.template(),
+        cycle_1_index: int,
+        cycle_2_index: int) -> bool:
+    '''
+    Check if a cycle must be placed before another one in the heap.
+
+    Parameters
+    -------
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+        The starting edge is arbitrarily defined.
+
+    cycle_1_index, cycle_2_index: int
+
+        index of the two cycles to compare.
+
+
+    Returns
+    -------
+
+    bool
+
+        True if the first cycle is shorter than the second one, or if
+        they have the same length and the first index is the smallest.
+    '''
+    lenght_1 = cycles[cycle_1_index].y
+    lenght_2 = cycles[cycle_2_index].y
+
+    return (lenght_1 < lenght_2)\
+            or (lenght_1 == lenght_2 and cycle_1_index < cycle_2_index)
+
+@ti.func
+def swap_nodes(
+        heap: ti.template(),
+        heap_position: ti.template(),
+        node_1: int,
+        node_2: int):
+    '''
+    Exchange two nodes of the heap.
+
+    Parameters
+    -------
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree.
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap.
+
+    node_1, node_2: int
+
+        position in the heap of the two nodes to exchange.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    cycle_1_index = heap[node_1]
+    cycle_2_index = heap[node_2]
+
+    heap[node_1] = cycle_2_index
+    heap[node_2] = cycle_1_index
+    heap_position[cycle_2_index] = node_1
+    heap_position[cycle_1_index] = node_2
+
+@ti.func
+def sift_up(
+        heap: ti.template(),
+        heap_position: ti.template(),
+        cycles: ti.template(),
+        node: int):
+    '''
+    Move a node up in the heap until its parent is before it.
+
+    Parameters
+    -------
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree.
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+    node: int
+
+        position in the heap of the node to move.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    current_node = node
+
+    while current_node > 0:
+
+        parent_node = (current_node - 1) // 2
+
+        if is_before(cycles,
+                     heap[current_node],
+                     heap[parent_node]):
+            swap_nodes(heap,
+                       heap_position,
+                       current_node,
+                       parent_node)
+            current_node = parent_node
+        else:
+            current_node = 0
+
+@ti.func
+def sift_down(
+        heap: ti.template(),
+        heap_position: ti.template(),
+        cycles: ti.template(),
+        heap_size: int,
+        node: int):
+    '''
+    Move a node down in the heap until its children are after it.
+
+    Parameters
+    -------
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree.
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+    heap_size: int
+
+        number of cycles in the heap.
+
+    node: int
+
+        position in the heap of the node to move.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    current_node = node
+    is_placed = False
+
+    while not is_placed:
+
+        smallest_node = current_node
+        left_node = 2 * current_node + 1
+        right_node = 2 * current_node + 2
+
+        #the operators are not short-circuited in the Taichi scope
+        if left_node < heap_size:
+            if is_before(cycles, heap[left_node], heap[smallest_node]):
+                smallest_node = left_node
+        if right_node < heap_size:
+            if is_before(cycles, heap[right_node], heap[smallest_node]):
+                smallest_node = right_node
+
+        if smallest_node == current_node:
+            is_placed = True
+        else:
+            swap_nodes(heap,
+                       heap_position,
+                       current_node,
+                       smallest_node)
+            current_node = smallest_node
+
+@ti.func
+def build_cycle_heap(
+        heap: ti.template(),
+        heap_position: ti.template(),
+        cycles: ti.template()) -> int:
+    '''
+    Put all the cycles whose length is not 0 in the heap.
+
+    Parameters
+    -------
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree.
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+
+    Returns
+    -------
+
+    int
+
+        number of cycles in the heap
+    '''
+    heap_size = 0
+
+    ti.loop_config(serialize=True)
+    for cycle_number in range(cycles.shape[0]):
+
+        heap_position[cycle_number] = -1
+        if cycles[cycle_number].y != 0:
+            heap[heap_size] = cycle_number
+            heap_position[cycle_number] = heap_size
+            heap_size += 1
+
+    #the last parent is at (heap_size - 2) // 2
+    ti.loop_config(serialize=True)
+    for node_count in range(heap_size // 2):
+        sift_down(heap,
+                  heap_position,
+                  cycles,
+                  heap_size,
+                  heap_size // 2 - 1 - node_count)
+
+    return heap_size
+
+@ti.func
+def update_cycle_heap(
+        heap: ti.template(),
+        heap_position: ti.template(),
+        cycles: ti.template(),
+        heap_size: int,
+        merged_cycles: ti.math.ivec2) -> int:
+    '''
+    Update the heap after the stitching of two cycles: the first cycle
+    is longer, the second one is removed from the heap.
+
+    Parameters
+    -------
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree.
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+    heap_size: int
+
+        number of cycles in the heap.
+
+    merged_cycles: ti.math.ivec2
+
+        x: index of the cycle which has been kept
+        y: index of the cycle which has been removed
+
+
+    Returns
+    -------
+
+    int
+
+        number of cycles in the heap
+    '''
+    #the lengths of both cycles have already changed, so the removed
+    #cycle is first moved to the root, as if its length was -inf.
+    current_node = heap_position[merged_cycles.y]
+    while current_node > 0:
+        parent_node = (current_node - 1) // 2
+        swap_nodes(heap,
+                   heap_position,
+                   current_node,
+                   parent_node)
+        current_node = parent_node
+
+    #the first cycle can only be longer
+    sift_down(heap,
+              heap_position,
+              cycles,
+              heap_size,
+              heap_position[merged_cycles.x])
+
+    #remove the root, the last node takes its place
+    new_heap_size = heap_size - 1
+    swap_nodes(heap,
+               heap_position,
+               0,
+               new_heap_size)
+    heap_position[merged_cycles.y] = -1
+    sift_down(heap,
+              heap_position,
+              cycles,
+              new_heap_size,
+              0)
+
+    return new_heap_size
@@ -0,0 +1,126 @@
+import taichi as ti
+
+from cglib.index import index2d_to_cartesians_coo
+
+
+
+'''
+This module contains the scalar fields given by a function instead of an
+array of values, such as signed distance functions or periodic infills.
+An ImplicitField can be passed to to_graph, to_graphs and to_compact_graph in
+place of the field given by numpy_to_field: the values of the corners of each
+cell are evaluated when the cell is computed, so the grid is never stored and
+only the fields of the graph are allocated. With to_compact_graph, the memory
+used is given by the number of edges with a point, not by the resolution.
+
+The kernels read the values of a grid with get_grid_value, which is resolved
+at compile time for the fields and for the implicit fields.
+
+'''
+
+
+
+@ti.data_oriented
+class ImplicitField:
+    '''
+    Scalar field whose values are given by a ti.func of the Cartesian
+    coordinates of the grid points, see index2d_to_cartesians_coo. As in
+    numpy_to_field, a border of 1 is added around the field, so the interior
+    of the contours is where the function is below the isovalue.
+
+    Parameters
+    -------
+
+    function: ti.func
+
+        function taking the Cartesian coordinates of a point as a
+        ti.math.vec2 and returning its value as a float.
+
+    shape: tuple[int, int]
+
+        number of rows and columns of values, without the border.
+    '''
+
+    def __init__(
+            self,
+            function,
+            shape: tuple[int, int]):
+        self.function = function
+        self.shape = (shape[0] + 2,
+                      shape[1] + 2)
+
+@ti.func
+def get_grid_value(
+        grid: ti.template(),
+        index: ti.math.ivec2) -> float:
+    '''
+    Give the value of a point of the grid.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    index: ti.math.ivec2
+
+        2D index of the point in the grid.
+
+
+    Returns
+    -------
+
+    float
+
+        value of the scalar field at the point
+    '''
+    value = 1.
+    if ti.static(isinstance(grid, ImplicitField)):
+        if index.x != 0 and index.y != 0\
+                and index.x != grid.shape[0] - 1 and index.y != grid.shape[1] - 1:
+            value = grid.function(index2d_to_cartesians_coo(ti.math.ivec2(grid.shape[0],
+                                                                          grid.shape[1]),
+                                                            index))
+    else:
+        value = grid[index.x, index.y]
+    return value
+
+@ti.kernel
+def evaluate_field_tile(
+        field: ti.template(),
+        tile_origin: ti.math.ivec2,
+        tile_grid: ti.template()):
+    '''
+    Evaluate a block of an implicit field, as get_field_tile reads a block
+    of a memory-mapped field. The points outside the field are given the
+    value of the border.
+
+    Parameters
+    -------
+
+    field: ti.template
+
+        the ImplicitField.
+
+    tile_origin: ti.math.ivec2
+
+        2D index of the first value of the block in the field with its border.
+
+    tile_grid: ti.template
+
+        2D field containing the values of the block.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in tile_grid:
+        index = tile_origin + ti.math.ivec2(x_index, y_index)
+        value = 1.
+        if index.x < field.shape[0] and index.y < field.shape[1]:
+            value = get_grid_value(field,
+                                   index)
+        tile_grid[x_index, y_index] = value
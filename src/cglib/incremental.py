@@ -0,0 +1,985 @@
+import taichi as ti
+import numpy as np
+
+from cglib.index import index2d_to_edge_index
+from cglib.graph import compute_cell_graph
+from cglib.stitch import stitch_all_cycles_with_neighbourhood
+from cglib.mst import relabel_cycles
+
+
+
+'''
+This module contains an incremental extraction of the isocontours, for fields
+which are edited in a small rectangle. The graph of the whole field is patched
+in place instead of being extracted again:
+
+    - the cells with a corner in the rectangle are the dirty cells, the other
+      cells have the same configuration, so the points and the adjacency
+      they give are unchanged,
+    - the cycles with an edge in a dirty cell are released: their edges get
+      the cycle index -1, and their slots in cycles are freed,
+    - the adjacency written by the dirty cells is cleared, and compute_graph
+      is run again on the dirty cells only,
+    - the released edges and the edges of the dirty cells are flooded again,
+      the new cycles take the freed slots, and the last cycles are moved to
+      the remaining free slots so that cycles has no hole.
+
+The cost is given by the number of dirty cells and the length of the released
+cycles, not by the size of the field. Only the full graphs are updated, the
+compact graphs, whose edges are numbered by a prefix sum, must be extracted
+again.
+
+A stitched graph is updated from the graph of its isocontours. Stitching two
+cycles exchanges the next edges of two edges, so the next edge of each edge in
+the stitched graph is the next edge, in the isocontours, of another edge:
+
+    next_edge_stitched = next_edge_contour o swap
+
+where swap is a permutation of the edges, given by
+swap(edge) = previous_edge_contour[next_edge_stitched[edge]]. The cycles of
+swap made of edges of clean cells only are the stitchings which are still
+valid, and the edges of the other cycles of swap get their next edge in the
+new isocontours. Only the cycles which were split this way are stitched again.
+
+'''
+
+
+
+@ti.kernel
+def set_grid_values(
+        grid: ti.template(),
+        values: ti.types.ndarray(),
+        origin: ti.math.ivec2):
+    '''
+    Write a block of values in the scalar field.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values.
+
+    values: ti.types.ndarray
+
+        2D array containing the new values.
+
+    origin: ti.math.ivec2
+
+        2D index in grid of the first value of the block.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in ti.ndrange(values.shape[0], values.shape[1]):
+        grid[origin.x + x_index, origin.y + y_index] = values[x_index, y_index]
+
+@ti.kernel
+def collect_cell_edges(
+        shape: ti.math.ivec2,
+        cell_origin: ti.math.ivec2,
+        cell_shape: ti.math.ivec2,
+        cell_edges: ti.types.ndarray()):
+    '''
+    Give the four edges of each dirty cell. The edges shared by two dirty
+    cells appear twice.
+
+    Parameters
+    -------
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    cell_origin, cell_shape: ti.math.ivec2
+
+        2D index of the first dirty cell and number of rows and columns
+        of dirty cells.
+
+    cell_edges: ti.types.ndarray
+
+        1D array containing the 1D index of the four edges of each dirty cell.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in ti.ndrange(cell_shape.x, cell_shape.y):
+        edge_indexes = index2d_to_edge_index(cell_origin + ti.math.ivec2(x_index, y_index),
+                                             shape)
+        for edge_number in ti.static(range(4)):
+            cell_edges[4 * (x_index * cell_shape.y + y_index) + edge_number] = edge_indexes[edge_number]
+
+@ti.kernel
+def mark_dirty_cycles(
+        cycle_index: ti.template(),
+        seed_edges: ti.types.ndarray(),
+        is_dirty_cycle: ti.types.ndarray()):
+    '''
+    Mark the cycles to which the seed edges belong.
+
+    Parameters
+    -------
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    seed_edges: ti.types.ndarray
+
+        1D array containing the 1D index of the edges whose cycle is dirty.
+
+    is_dirty_cycle: ti.types.ndarray
+
+        1D array containing 1 for the dirty cycles.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(seed_edges.shape[0]):
+        edge = seed_edges[position]
+        if cycle_index[edge] != -1:
+            is_dirty_cycle[cycle_index[edge]] = 1
+
+@ti.kernel
+def release_dirty_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        first_edges: ti.types.ndarray(),
+        cycle_offsets: ti.types.ndarray(),
+        released_edges: ti.types.ndarray()):
+    '''
+    Give the cycle index -1 to the edges of the dirty cycles, and list
+    these edges. The cycles are browsed with the adjacency before the update.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    first_edges: ti.types.ndarray
+
+        1D array containing the starting edge of each dirty cycle.
+
+    cycle_offsets: ti.types.ndarray
+
+        1D array containing the position of the first edge of each dirty
+        cycle in released_edges.
+
+    released_edges: ti.types.ndarray
+
+        1D array containing the 1D index of the edges of the dirty cycles.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(first_edges.shape[0]):
+        first_edge = first_edges[position]
+        current_edge = first_edge
+        slot = cycle_offsets[position]
+        while True:
+            released_edges[slot] = current_edge
+            cycle_index[current_edge] = -1
+            slot += 1
+            current_edge = next_edge[current_edge]
+            if current_edge == first_edge:
+                break
+
+@ti.kernel
+def clear_cells_graph(
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        shape: ti.math.ivec2,
+        cell_origin: ti.math.ivec2,
+        cell_shape: ti.math.ivec2):
+    '''
+    Clear the adjacency written by the dirty cells, i.e. the links between
+    two edges of the same dirty cell, and the points of the edges owned by
+    the dirty cells. Two edges belong to at most one cell, so the links
+    written by the clean cells are kept.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    previous_edge: ti.template
+
+        field containing the previous edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    cell_origin, cell_shape: ti.math.ivec2
+
+        2D index of the first dirty cell and number of rows and columns
+        of dirty cells.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in ti.ndrange(cell_shape.x, cell_shape.y):
+        cell = cell_origin + ti.math.ivec2(x_index, y_index)
+        edge_indexes = index2d_to_edge_index(cell,
+                                             shape)
+
+        for edge_number in ti.static(range(4)):
+            following_edge = next_edge[edge_indexes[edge_number]]
+            if following_edge != 0:
+                is_in_cell = 0
+                for other_number in ti.static(range(4)):
+                    if following_edge == edge_indexes[other_number]:
+                        is_in_cell = 1
+                if is_in_cell == 1:
+                    next_edge[edge_indexes[edge_number]] = 0
+                    previous_edge[following_edge] = 0
+
+        #the edges owned by the cell, see get_owned_edges
+        points[edge_indexes[1]] = ti.math.vec2(0., 0.)
+        points[edge_indexes[2]] = ti.math.vec2(0., 0.)
+        if cell.x == 0:
+            points[edge_indexes[0]] = ti.math.vec2(0., 0.)
+        if cell.y == 0:
+            points[edge_indexes[3]] = ti.math.vec2(0., 0.)
+
+@ti.kernel
+def update_cells_graph(
+        grid: ti.template(),
+        isovalues: ti.types.ndarray(),
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        cell_origin: ti.math.ivec2,
+        cell_shape: ti.math.ivec2):
+    '''
+    Compute the points and the adjacency of the dirty cells, as compute_graph.
+
+    Parameters
+    -------
+
+    grid, points, previous_edge, next_edge: ti.template
+
+        see compute_graph, with a single level.
+
+    isovalues: ti.types.ndarray
+
+        1D array containing the value of the isocontours.
+
+    cell_origin, cell_shape: ti.math.ivec2
+
+        2D index of the first dirty cell and number of rows and columns
+        of dirty cells.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_index, y_index in ti.ndrange(cell_shape.x, cell_shape.y):
+        compute_cell_graph(grid,
+                           isovalues,
+                           points,
+                           previous_edge,
+                           next_edge,
+                           None,
+                           ti.math.ivec2(0, 0),
+                           grid.shape,
+                           cell_origin + ti.math.ivec2(x_index, y_index))
+
+@ti.kernel
+def label_released_edges(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        candidate_edges: ti.types.ndarray(),
+        free_cycles: ti.types.ndarray(),
+        nb_free_cycles: int,
+        nb_cycles: int,
+        new_cycles: ti.types.ndarray()) -> int:
+    '''
+    Flood the new cycles from the candidate edges which have a point and
+    no cycle. The new cycles take the free slots, then the slots after the
+    last cycle.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_edges: ti.types.ndarray
+
+        1D array containing the released edges and the edges of the dirty cells.
+
+    free_cycles: ti.types.ndarray
+
+        1D array containing the free slots in increasing order.
+
+    nb_free_cycles: int
+
+        number of free slots.
+
+    nb_cycles: int
+
+        number of cycles before the update, including the free slots.
+
+    new_cycles: ti.types.ndarray
+
+        2D array containing the starting edge and the length of each
+        new cycle, in the order of their slots.
+
+
+    Returns
+    -------
+
+    int
+
+        number of new cycles
+    '''
+    nb_new_cycles = 0
+    ti.loop_config(serialize = True)
+    for position in range(candidate_edges.shape[0]):
+        first_edge = candidate_edges[position]
+        if cycle_index[first_edge] == -1 and next_edge[first_edge] != 0:
+
+            cycle_number = nb_cycles + nb_new_cycles - nb_free_cycles
+            if nb_new_cycles < nb_free_cycles:
+                cycle_number = free_cycles[nb_new_cycles]
+
+            current_edge = first_edge
+            cycle_length = 0
+            while True:
+                cycle_index[current_edge] = cycle_number
+                cycle_length += 1
+                current_edge = next_edge[current_edge]
+                if current_edge == first_edge:
+                    break
+
+            new_cycles[nb_new_cycles, 0] = first_edge
+            new_cycles[nb_new_cycles, 1] = cycle_length
+            nb_new_cycles += 1
+
+    return nb_new_cycles
+
+@ti.kernel
+def move_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        moved_edges: ti.types.ndarray(),
+        moved_slots: ti.types.ndarray()):
+    '''
+    Give a new index to the edges of some cycles.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    moved_edges: ti.types.ndarray
+
+        1D array containing the starting edge of each moved cycle.
+
+    moved_slots: ti.types.ndarray
+
+        1D array containing the new index of each moved cycle.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(moved_edges.shape[0]):
+        first_edge = moved_edges[position]
+        current_edge = first_edge
+        while True:
+            cycle_index[current_edge] = moved_slots[position]
+            current_edge = next_edge[current_edge]
+            if current_edge == first_edge:
+                break
+
+@ti.kernel
+def collect_broken_stitchings(
+        contour_previous_edge: ti.template(),
+        stitched_next_edge: ti.template(),
+        cell_edges: ti.types.ndarray(),
+        broken_edges: ti.types.ndarray(),
+        nb_broken_edges: ti.types.ndarray()):
+    '''
+    List the edges of the cycles of swap, see the description of the module,
+    which contain an edge of a dirty cell. The contour graph must not be
+    updated yet. An edge may be listed several times.
+
+    Parameters
+    -------
+
+    contour_previous_edge: ti.template
+
+        field containing the previous edge of an edge in the isocontours,
+        arranged according to 1D indexes of the grid edges.
+
+    stitched_next_edge: ti.template
+
+        field containing the next edge of an edge in the stitched graph,
+        arranged according to 1D indexes of the grid edges.
+
+    cell_edges: ti.types.ndarray
+
+        1D array containing the edges of the dirty cells.
+
+    broken_edges: ti.types.ndarray
+
+        1D array containing the listed edges. The edges which do not fit
+        are counted but not listed.
+
+    nb_broken_edges: ti.types.ndarray
+
+        1D array of size 1 containing the number of listed edges.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(cell_edges.shape[0]):
+        first_edge = cell_edges[position]
+        if stitched_next_edge[first_edge] != 0\
+                and contour_previous_edge[stitched_next_edge[first_edge]] != first_edge:
+
+            current_edge = first_edge
+            while True:
+                slot = ti.atomic_add(nb_broken_edges[0], 1)
+                if slot < broken_edges.shape[0]:
+                    broken_edges[slot] = current_edge
+                current_edge = contour_previous_edge[stitched_next_edge[current_edge]]
+                if current_edge == first_edge:
+                    break
+
+@ti.kernel
+def restore_contour_adjacency(
+        contour_points: ti.template(),
+        contour_next_edge: ti.template(),
+        stitched_points: ti.template(),
+        stitched_previous_edge: ti.template(),
+        stitched_next_edge: ti.template(),
+        edges: ti.types.ndarray()):
+    '''
+    Give to the listed edges of the stitched graph their point and their
+    next edge in the updated isocontours.
+
+    Parameters
+    -------
+
+    contour_points, contour_next_edge: ti.template
+
+        fields of the updated isocontours.
+
+    stitched_points, stitched_previous_edge, stitched_next_edge: ti.template
+
+        fields of the stitched graph.
+
+    edges: ti.types.ndarray
+
+        1D array containing the edges of the dirty cells and of the broken
+        stitchings.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(edges.shape[0]):
+        edge = edges[position]
+        following_edge = contour_next_edge[edge]
+        stitched_points[edge] = contour_points[edge]
+        stitched_next_edge[edge] = following_edge
+        if following_edge != 0:
+            stitched_previous_edge[following_edge] = edge
+        else:
+            stitched_previous_edge[edge] = 0
+
+def get_dirty_cells(
+        shape: tuple[int, int],
+        dirty_origin: tuple[int, int],
+        dirty_shape: tuple[int, int]) -> tuple[ti.math.ivec2, ti.math.ivec2]:
+    '''
+    Give the cells with a corner in a rectangle of values of the grid.
+
+    Parameters
+    -------
+
+    shape: tuple[int, int]
+
+        shape of the scalar field grid
+
+    dirty_origin, dirty_shape: tuple[int, int]
+
+        2D index of the first edited value of the grid, and number of rows
+        and columns of edited values.
+
+
+    Returns
+    -------
+
+    tuple[ti.math.ivec2, ti.math.ivec2]
+
+        2D index of the first dirty cell and number of rows and columns of
+        dirty cells.
+    '''
+    #the last row and column of the grid are not the top left corner of a cell
+    start = [max(dirty_origin[axis] - 1, 0) for axis in range(2)]
+    end = [min(dirty_origin[axis] + dirty_shape[axis], shape[axis] - 1) for axis in range(2)]
+    return ti.math.ivec2(start), ti.math.ivec2(max(end[0] - start[0], 0),
+                                               max(end[1] - start[1], 0))
+
+
+def get_cell_edges(
+        shape: ti.math.ivec2,
+        cell_origin: ti.math.ivec2,
+        cell_shape: ti.math.ivec2) -> np.ndarray:
+    '''
+    Give the four edges of each dirty cell, see collect_cell_edges.
+
+    Parameters
+    -------
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    cell_origin, cell_shape: ti.math.ivec2
+
+        2D index of the first dirty cell and number of rows and columns
+        of dirty cells.
+
+
+    Returns
+    -------
+
+    np.ndarray
+
+        1D index of the edges of the dirty cells.
+    '''
+    cell_edges = np.zeros(4 * cell_shape.x * cell_shape.y,
+                          dtype = np.int32)
+    collect_cell_edges(shape,
+                       cell_origin,
+                       cell_shape,
+                       cell_edges)
+    return cell_edges
+
+def release_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        all_cycles: np.ndarray,
+        seed_edges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Release the cycles to which the seed edges belong, see release_dirty_cycles.
+
+    Parameters
+    -------
+
+    next_edge, cycle_index: ti.template
+
+        fields of the graph, before the update of its adjacency.
+
+    all_cycles: np.ndarray
+
+        starting edge and length of each cycle of the graph.
+
+    seed_edges: np.ndarray
+
+        1D index of the edges whose cycle is dirty.
+
+
+    Returns
+    -------
+
+    tuple[np.ndarray, np.ndarray]
+
+        - index of the released cycles, in increasing order,
+        - 1D index of the edges of the released cycles.
+    '''
+    is_dirty_cycle = np.zeros(all_cycles.shape[0],
+                              dtype = np.int32)
+    mark_dirty_cycles(cycle_index,
+                      seed_edges,
+                      is_dirty_cycle)
+
+    dirty_cycles = np.nonzero(is_dirty_cycle)[0].astype(np.int32)
+    if dirty_cycles.shape[0] == 0:
+        return dirty_cycles, np.zeros(0, dtype = np.int32)
+
+    lengths = all_cycles[dirty_cycles, 1]
+    cycle_offsets = (np.cumsum(lengths) - lengths).astype(np.int32)
+    released_edges = np.zeros(int(lengths.sum()),
+                              dtype = np.int32)
+    release_dirty_cycles(next_edge,
+                         cycle_index,
+                         np.ascontiguousarray(all_cycles[dirty_cycles, 0]),
+                         cycle_offsets,
+                         released_edges)
+
+    return dirty_cycles, released_edges
+
+def relabel_released_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template(),
+        all_cycles: np.ndarray,
+        dirty_cycles: np.ndarray,
+        candidate_edges: np.ndarray) -> ti.template():
+    '''
+    Flood the new cycles from the candidate edges, give them the slots of the
+    released cycles, and fill the holes of cycles with its last cycles.
+
+    Parameters
+    -------
+
+    next_edge, cycle_index, cycles: ti.template
+
+        fields of the graph, after the update of its adjacency.
+
+    all_cycles: np.ndarray
+
+        starting edge and length of each cycle of the graph, before the update.
+
+    dirty_cycles: np.ndarray
+
+        index of the released cycles, in increasing order.
+
+    candidate_edges: np.ndarray
+
+        1D index of the released edges and of the edges of the dirty cells.
+
+
+    Returns
+    -------
+
+    ti.template
+
+        1D vector field containing the length and starting edge of each cycle,
+        cycles itself if the number of cycles has not changed.
+    '''
+    nb_cycles = all_cycles.shape[0]
+    nb_free_cycles = dirty_cycles.shape[0]
+
+    new_cycles = np.zeros((candidate_edges.shape[0], 2),
+                          dtype = np.int32)
+    nb_new_cycles = label_released_edges(next_edge,
+                                         cycle_index,
+                                         candidate_edges,
+                                         np.concatenate((dirty_cycles, [0])).astype(np.int32),
+                                         nb_free_cycles,
+                                         nb_cycles,
+                                         new_cycles)
+    new_cycles = new_cycles[:nb_new_cycles]
+
+    #the new cycles take the free slots, then the slots after the last cycle
+    final_count = nb_cycles - nb_free_cycles + nb_new_cycles
+    nb_added_cycles = max(nb_new_cycles - nb_free_cycles, 0)
+    slots = np.concatenate((dirty_cycles,
+                            np.arange(nb_cycles, nb_cycles + nb_added_cycles)))
+    all_cycles = np.concatenate((all_cycles,
+                                 np.zeros((nb_added_cycles, 2), dtype = all_cycles.dtype)))
+    all_cycles[slots[:nb_new_cycles]] = new_cycles
+
+    #the last cycles are moved to the slots which are still free
+    free_slots = dirty_cycles[nb_new_cycles:]
+    holes = free_slots[free_slots < final_count]
+    if holes.shape[0] > 0:
+        is_free = np.zeros(nb_cycles,
+                           dtype = bool)
+        is_free[free_slots] = True
+        moved = np.nonzero(~is_free[final_count:])[0] + final_count
+
+        move_cycles(next_edge,
+                    cycle_index,
+                    np.ascontiguousarray(all_cycles[moved, 0]).astype(np.int32),
+                    holes.astype(np.int32))
+        all_cycles[holes] = all_cycles[moved]
+
+    final_cycles = cycles
+    if final_count != cycles.shape[0]:
+        final_cycles = ti.Vector.field(n = 2,
+                                       dtype = int,
+                                       shape = final_count)
+    final_cycles.from_numpy(all_cycles[:final_count].astype(np.int32))
+
+    return final_cycles
+
+def update_graph(
+        grid: ti.template(),
+        graph: tuple,
+        dirty_origin: tuple[int, int],
+        dirty_shape: tuple[int, int],
+        isovalue: float = 0.) -> tuple:
+    '''
+    Update the graph of the isocontours after an edition of the scalar field
+    in a rectangle. The points, the adjacency and the cycle indexes are
+    patched in place. The graph is the one given by to_graph on the edited
+    field, except the numbering of its cycles.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, already edited,
+        for instance with set_grid_values.
+
+    graph: tuple
+
+        fields of the graph given by to_graph on the field before its edition:
+        points, previous_edge, next_edge, cycle_index, cycles.
+
+    dirty_origin, dirty_shape: tuple[int, int]
+
+        2D index of the first edited value of the grid, and number of rows
+        and columns of edited values.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+
+    Returns
+    -------
+
+    tuple
+
+        fields of the updated graph. cycles is a new field if the number of
+        cycles has changed.
+    '''
+    points, previous_edge, next_edge, cycle_index, cycles = graph
+    shape = ti.math.ivec2(grid.shape[0],
+                          grid.shape[1])
+    cell_origin, cell_shape = get_dirty_cells(grid.shape,
+                                              dirty_origin,
+                                              dirty_shape)
+    if cell_shape.x * cell_shape.y == 0:
+        return graph
+
+    cell_edges = get_cell_edges(shape,
+                                cell_origin,
+                                cell_shape)
+
+    #the cycles are browsed with the adjacency before the update
+    all_cycles = cycles.to_numpy()
+    dirty_cycles, released_edges = release_cycles(next_edge,
+                                                  cycle_index,
+                                                  all_cycles,
+                                                  cell_edges)
+
+    clear_cells_graph(points,
+                      previous_edge,
+                      next_edge,
+                      shape,
+                      cell_origin,
+                      cell_shape)
+    update_cells_graph(grid,
+                       np.array([isovalue], dtype = np.float32),
+                       points,
+                       previous_edge,
+                       next_edge,
+                       cell_origin,
+                       cell_shape)
+
+    cycles = relabel_released_cycles(next_edge,
+                                     cycle_index,
+                                     cycles,
+                                     all_cycles,
+                                     dirty_cycles,
+                                     np.concatenate((released_edges, cell_edges)))
+
+    return points, previous_edge, next_edge, cycle_index, cycles
+
+def update_stitched_graph(
+        grid: ti.template(),
+        graph: tuple,
+        stitched_graph: tuple,
+        dirty_origin: tuple[int, int],
+        dirty_shape: tuple[int, int],
+        distance_from_edge: int,
+        isovalue: float = 0.,
+        stitching_algorithm = stitch_all_cycles_with_neighbourhood,
+        **stitching_options) -> tuple[tuple, tuple]:
+    '''
+    Update the graph of the isocontours and the stitched graph after an
+    edition of the scalar field in a rectangle. The stitchings which do not
+    involve a dirty cell are kept, and only the cycles they no longer join
+    are stitched again. All the fields are patched in place.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, already edited,
+        for instance with set_grid_values.
+
+    graph: tuple
+
+        fields of the graph given by to_graph on the field before its edition:
+        points, previous_edge, next_edge, cycle_index, cycles.
+
+    stitched_graph: tuple
+
+        fields of a copy of graph after its stitching, whose cycle_index and
+        cycles describe the single cycle, see relabel_cycles.
+
+    dirty_origin, dirty_shape: tuple[int, int]
+
+        2D index of the first edited value of the grid, and number of rows
+        and columns of edited values.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+    stitching_algorithm:
+
+        function stitching the remaining cycles, with the signature of
+        stitch_all_cycles_with_neighbourhood.
+
+    stitching_options:
+
+        options of the stitching algorithm.
+
+
+    Returns
+    -------
+
+    tuple[tuple, tuple]
+
+        fields of the updated graph and of the updated stitched graph.
+        Their cycles are new fields if the number of cycles has changed.
+    '''
+    points, previous_edge, next_edge, cycle_index, cycles = stitched_graph
+    shape = ti.math.ivec2(grid.shape[0],
+                          grid.shape[1])
+    cell_origin, cell_shape = get_dirty_cells(grid.shape,
+                                              dirty_origin,
+                                              dirty_shape)
+    if cell_shape.x * cell_shape.y == 0:
+        return graph, stitched_graph
+
+    cell_edges = get_cell_edges(shape,
+                                cell_origin,
+                                cell_shape)
+
+    #the stitchings are read before the update of the isocontours,
+    #the list is allocated again if it is too small
+    nb_broken_edges = np.zeros(1,
+                               dtype = np.int32)
+    broken_edges = np.zeros(cell_edges.shape[0],
+                            dtype = np.int32)
+    while True:
+        nb_broken_edges[0] = 0
+        collect_broken_stitchings(graph[1],
+                                  next_edge,
+                                  cell_edges,
+                                  broken_edges,
+                                  nb_broken_edges)
+        if nb_broken_edges[0] <= broken_edges.shape[0]:
+            break
+        broken_edges = np.zeros(nb_broken_edges[0],
+                                dtype = np.int32)
+    changed_edges = np.concatenate((cell_edges,
+                                    broken_edges[:nb_broken_edges[0]]))
+
+    all_cycles = cycles.to_numpy()
+    dirty_cycles, released_edges = release_cycles(next_edge,
+                                                  cycle_index,
+                                                  all_cycles,
+                                                  changed_edges)
+
+    graph = update_graph(grid,
+                         graph,
+                         dirty_origin,
+                         dirty_shape,
+                         isovalue)
+
+    restore_contour_adjacency(graph[0],
+                              graph[2],
+                              points,
+                              previous_edge,
+                              next_edge,
+                              changed_edges)
+
+    cycles = relabel_released_cycles(next_edge,
+                                     cycle_index,
+                                     cycles,
+                                     all_cycles,
+                                     dirty_cycles,
+                                     np.concatenate((released_edges, changed_edges)))
+
+    if cycles.shape[0] > 1:
+        stitching_algorithm(points,
+                            previous_edge,
+                            next_edge,
+                            cycle_index,
+                            cycles,
+                            shape,
+                            distance_from_edge,
+                            **stitching_options)
+        cycles = relabel_cycles(next_edge,
+                                cycle_index,
+                                cycles)
+
+    return graph, (points, previous_edge, next_edge, cycle_index, cycles)
@@ -204,4 +204,301 @@ def edge_3d_to_1d_index(
             maximal_horizontal_index = shape.y * (shape.x + 1) 
             result = maximal_horizontal_index + x * (shape.y + 1) + y
 
-    return result
\ No newline at end of file
+    return result
+
+@ti.func
+def get_neighbour_edge(
+        shape: ti.math.ivec2, 
+        edge_3d_index: ti.math.ivec3, 
+        neighbour: int, 
+        distance_from_edge: int) -> int: 
+    '''
+    Gives the 1D index of a neighbour of an edge. The neighbours are the edges 
+    whose x and y coordinates of the 3D index are at a distance of 
+    distance_from_edge or less. They are numbered by x, then y, then z. 
+
+    Parameters 
+    -------
+
+    shape: ti.math.ivec2
+
+        2D shape of the scalar field grid
+
+    edge_3d_index: ti.math.ivec3
+
+        3D index of the reference edge 
+
+    neighbour: int 
+
+        number of the neighbour, between 0 and 2 * (2 * distance_from_edge + 1)**2
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+        
+    Returns
+    -------
+
+    int 
+
+        1D edge index, -1 if the neighbour is outside the grid 
+    '''
+    k = distance_from_edge*2 + 1
+    x = edge_3d_index.x + neighbour // (2 * k) - distance_from_edge
+    y = edge_3d_index.y + (neighbour // 2) % k - distance_from_edge
+    z = neighbour % 2
+
+    result = -1
+    if x >= 0 and x < shape.x and y >= 0 and y < shape.y: 
+        result = edge_3d_to_1d_index(shape, 
+                                     x, 
+                                     y, 
+                                     z)
+
+    return result
+
+def is_compact(edge_ids) -> bool: 
+    '''
+    Tell if a graph is compact, i.e. if its edges are numbered from 1 to 
+    the number of points instead of being arranged according to 1D indexes 
+    of the grid edges. To be used with ti.static in the Taichi scope. 
+
+    Parameters 
+    -------
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, None if the graph is arranged according to the grid edges. 
+
+        
+    Returns
+    -------
+
+    bool 
+
+        True if edge_ids is a field 
+    '''
+    return edge_ids is not None
+
+@ti.func
+def get_grid_edge(
+        edge_ids: ti.template(), 
+        edge: int) -> int: 
+    '''
+    Gives the 1D index in the grid of an edge of the graph. 
+
+    Parameters 
+    -------
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. None if the graph is arranged 
+        according to the grid edges. 
+
+    edge: int 
+
+        index of the edge in the graph 
+
+        
+    Returns
+    -------
+
+    int 
+
+        1D edge index in the grid 
+    '''
+    result = edge
+    if ti.static(is_compact(edge_ids)): 
+        result = edge_ids[edge]
+
+    return result
+
+@ti.func
+def get_graph_edge(
+        edge_ids: ti.template(), 
+        grid_edge: int) -> int: 
+    '''
+    Gives the index in the graph of a grid edge. In a compact graph, the 
+    edge is found by a binary search in edge_ids. 
+
+    Parameters 
+    -------
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. None if the graph is arranged 
+        according to the grid edges. 
+
+    grid_edge: int 
+
+        1D edge index in the grid, -1 if the edge is outside the grid 
+
+        
+    Returns
+    -------
+
+    int 
+
+        index of the edge in the graph, -1 if the edge is outside the grid 
+        or, in a compact graph, if there is no point on the edge 
+    '''
+    result = grid_edge
+    if ti.static(is_compact(edge_ids)): 
+        result = -1
+        if grid_edge != -1: 
+            result = get_graph_edge_after(edge_ids, 
+                                          grid_edge, 
+                                          find_edge_position(edge_ids, 
+                                                             grid_edge)).x
+
+    return result
+
+@ti.func
+def find_edge_position(
+        edge_ids: ti.template(), 
+        grid_edge: int) -> int: 
+    '''
+    Gives the position of the first edge of a compact graph whose grid 1D 
+    index is not lower than grid_edge, with a binary search. 
+
+    Parameters 
+    -------
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. 
+
+    grid_edge: int 
+
+        1D edge index in the grid 
+
+        
+    Returns
+    -------
+
+    int 
+
+        position in edge_ids, edge_ids.shape[0] if all the edges are lower 
+    '''
+    #the first slot is not an edge 
+    lower = 1
+    upper = edge_ids.shape[0]
+    while lower < upper: 
+        middle = (lower + upper) // 2 
+        if edge_ids[middle] < grid_edge: 
+            lower = middle + 1
+        else: 
+            upper = middle
+
+    return lower
+
+@ti.func
+def get_graph_edge_after(
+        edge_ids: ti.template(), 
+        grid_edge: int, 
+        position: int) -> ti.math.ivec2: 
+    '''
+    Gives the index in a compact graph of a grid edge, by browsing edge_ids 
+    from a position which is not after the edge. When the grid edges are 
+    browsed in increasing order, e.g. along a row of the grid, the position 
+    returned for an edge is the start of the search of the next one. 
+
+    Parameters 
+    -------
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. 
+
+    grid_edge: int 
+
+        1D edge index in the grid 
+
+    position: int 
+
+        position in edge_ids from which the edge is searched 
+
+        
+    Returns
+    -------
+
+    ti.math.ivec2 
+
+        x: index of the edge in the graph, -1 if there is no point on the edge 
+        y: position of the first edge which is not lower than grid_edge 
+    '''
+    is_searching = True
+    while is_searching: 
+        is_searching = False
+        #the operators are not short-circuited in the Taichi scope 
+        if position < edge_ids.shape[0]: 
+            if edge_ids[position] < grid_edge: 
+                position += 1
+                is_searching = True
+
+    result = -1
+    if position < edge_ids.shape[0]: 
+        if edge_ids[position] == grid_edge: 
+            result = position
+
+    return ti.math.ivec2(result, 
+                         position)
+
+@ti.func
+def get_graph_neighbour_edge(
+        shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
+        edge: int, 
+        neighbour: int, 
+        distance_from_edge: int) -> int: 
+    '''
+    Gives the index in the graph of a neighbour of an edge of the graph, 
+    see get_neighbour_edge. 
+
+    Parameters 
+    -------
+
+    shape: ti.math.ivec2
+
+        2D shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, sorted in increasing order. None if the graph is arranged 
+        according to the grid edges. 
+
+    edge: int 
+
+        index of the reference edge in the graph 
+
+    neighbour: int 
+
+        number of the neighbour, between 0 and 2 * (2 * distance_from_edge + 1)**2
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+        
+    Returns
+    -------
+
+    int 
+
+        index of the neighbour in the graph, -1 if the neighbour is outside 
+        the grid or, in a compact graph, if there is no point on it 
+    '''
+    return get_graph_edge(edge_ids, 
+                          get_neighbour_edge(shape, 
+                                             edge_1d_to_3d_index(shape, 
+                                                                 get_grid_edge(edge_ids, 
+                                                                               edge)), 
+                                             neighbour, 
+                                             distance_from_edge))
@@ -0,0 +1,565 @@
+import taichi as ti
+import numpy as np
+
+from cglib.calc import compute_neighbours_energies, energy_to_key, patching_energy_with_lengths
+from cglib.index import edge_1d_to_3d_index, get_grid_edge, get_graph_neighbour_edge
+from cglib.union_find import init_union_find, get_cycle, flatten_cycle_index
+from cglib.stitch import stitch_two_cycles, stitch_all_cycles_with_neighbourhood, NO_KEY, ORDER_MASK
+from cglib.graph import compute_cycles, compute_segment_lengths
+from cglib.fields import count_cycles, fill_final_cycles
+
+
+
+'''
+This module contains a stitching algorithm which chooses all the stitchings at once.
+The best candidate of each edge is computed in a single parallel pass over the
+neighbours, and the candidates are sorted by patching energy. The cycles are the
+vertices of a graph whose edges are the candidates, and the stitchings are the
+edges of its minimum spanning tree, found with the Kruskal algorithm.
+
+A stitching only changes the next edge of the two stitched edges, so the other
+candidates stay valid as long as each edge is stitched at most once. The cycles
+which are not connected by the tree are stitched with the greedy algorithm.
+
+'''
+
+
+
+@ti.func
+def compute_edge_candidate(
+        points: ti.template(),
+        next_edge: ti.template(),
+        segment_length: ti.template(),
+        energy_function: ti.template(),
+        cycle_index: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        current_edge_1d_index: int,
+        distance_from_edge: int) -> ti.i64:
+    '''
+    Give the key of the neighbour of an edge in another cycle with the
+    minimal patching energy.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points
+        and the lengths of their segments, such as patching_energy_with_lengths.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    current_edge_1d_index: int
+
+        1D index of the edge, which must have a point.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+
+    Returns
+    -------
+
+    ti.i64
+
+        minimal key, ordered by energy, then by neighbour.
+        NO_KEY if the edge has no candidate.
+    '''
+    k = distance_from_edge*2 + 1
+    minimal_key = ti.i64(NO_KEY)
+
+    #the neighbours are browsed in the order of their number, and the first
+    #one with the minimal energy is kept
+    minimum = compute_neighbours_energies(points,
+                                          next_edge,
+                                          segment_length,
+                                          energy_function,
+                                          cycle_index,
+                                          None,
+                                          None,
+                                          False,
+                                          shape,
+                                          edge_ids,
+                                          current_edge_1d_index,
+                                          distance_from_edge)
+
+    if minimum.x != ti.math.inf:
+        edge_I_3d_index = edge_1d_to_3d_index(shape,
+                                              get_grid_edge(edge_ids,
+                                                            current_edge_1d_index))
+        edge_J_3d_index = edge_1d_to_3d_index(shape,
+                                              get_grid_edge(edge_ids,
+                                                            int(minimum.y)))
+        neighbour = ((edge_J_3d_index.x - edge_I_3d_index.x + distance_from_edge) * k\
+                     + edge_J_3d_index.y - edge_I_3d_index.y + distance_from_edge) * 2\
+                    + edge_J_3d_index.z
+        minimal_key = energy_to_key(minimum.x,
+                                    neighbour)
+
+    return minimal_key
+
+@ti.kernel
+def compute_edges_candidates(
+        points: ti.template(),
+        next_edge: ti.template(),
+        segment_length: ti.template(),
+        energy_function: ti.template(),
+        cycle_index: ti.template(),
+        candidate_keys: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        distance_from_edge: int):
+    '''
+    Compute in parallel, for each edge of the graph, the key of its neighbour
+    in another cycle with the minimal patching energy.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points
+        and the lengths of their segments, such as patching_energy_with_lengths.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge, ordered by energy,
+        then by neighbour. NO_KEY if the edge has no candidate.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge in candidate_keys:
+
+        candidate_keys[edge] = ti.i64(NO_KEY)
+
+        #most edges have no point, so the neighbours are browsed by edge
+        if cycle_index[edge] != -1:
+            candidate_keys[edge] = compute_edge_candidate(points,
+                                                          next_edge,
+                                                          segment_length,
+                                                          energy_function,
+                                                          cycle_index,
+                                                          shape,
+                                                          edge_ids,
+                                                          edge,
+                                                          distance_from_edge)
+
+@ti.kernel
+def apply_spanning_tree(
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        points: ti.template(),
+        segment_length: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template(),
+        candidate_edges: ti.template(),
+        nb_candidates: int,
+        candidate_keys: ti.template(),
+        is_stitched: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        distance_from_edge: int,
+        cycle_parent: ti.template(),
+        cycle_size: ti.template(),
+        cycle_label: ti.template()) -> int:
+    '''
+    Browse the candidates by increasing energy, and stitch the two cycles of a
+    candidate if they are not connected yet and if none of its edges has
+    already been stitched (Kruskal algorithm). The cycle of each edge is
+    given by the cycle forest.
+
+    Parameters
+    -------
+
+    previous_edge: ti.template
+
+        field containing the previous edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the element of the cycle forest of each edge,
+        arranged according to 1D indexes of the grid edges.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+        The starting edge is arbitrarily defined.
+
+    candidate_edges: ti.template
+
+        1D field containing the 1D index of the edges which have a candidate,
+        sorted by energy.
+
+    nb_candidates: int
+
+        number of candidates to browse in candidate_edges.
+
+    candidate_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge.
+
+    is_stitched: ti.template
+
+        1D field containing 1 if the next edge of an edge has been changed.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    cycle_parent, cycle_size, cycle_label: ti.template
+
+        fields of the cycle forest.
+
+
+    Returns
+    -------
+
+    int
+
+        number of stitchings
+    '''
+    nb_stitchings = 0
+
+    ti.loop_config(serialize=True)
+    for position in range(nb_candidates):
+
+        edge_I_1d_index = candidate_edges[position]
+        edge_J_1d_index = get_graph_neighbour_edge(shape,
+                                                   edge_ids,
+                                                   edge_I_1d_index,
+                                                   ti.cast(candidate_keys[edge_I_1d_index] & ti.i64(ORDER_MASK), int),
+                                                   distance_from_edge)
+
+        #the operators are not short-circuited in the Taichi scope
+        if is_stitched[edge_I_1d_index] == 0:
+            if is_stitched[edge_J_1d_index] == 0:
+                if get_cycle(cycle_index,
+                             cycle_parent,
+                             cycle_label,
+                             edge_I_1d_index,
+                             True) != get_cycle(cycle_index,
+                                                cycle_parent,
+                                                cycle_label,
+                                                edge_J_1d_index,
+                                                True):
+                    stitch_two_cycles(previous_edge,
+                                      next_edge,
+                                      points,
+                                      segment_length,
+                                      cycle_index,
+                                      cycles,
+                                      ti.math.ivec2(edge_I_1d_index,
+                                                    edge_J_1d_index),
+                                      cycle_parent,
+                                      cycle_size,
+                                      cycle_label,
+                                      True)
+                    is_stitched[edge_I_1d_index] = 1
+                    is_stitched[edge_J_1d_index] = 1
+                    nb_stitchings += 1
+
+    return nb_stitchings
+
+def relabel_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template()) -> ti.template():
+    '''
+    Compute the cycles of the graph again from the adjacency, so that the
+    cycles are numbered from 0 without removed cycles.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+
+    Returns
+    -------
+
+    ti.template
+
+        1D vector field containing only the cycles whose length is not 0
+    '''
+    cycle_index.fill(-1)
+    cycles.fill(0)
+    compute_cycles(next_edge,
+                   cycle_index,
+                   cycles)
+
+    final_cycles = ti.Vector.field(n = 2,
+                                   dtype = int,
+                                   shape = count_cycles(cycles))
+    fill_final_cycles(cycles,
+                      final_cycles)
+
+    return final_cycles
+
+def stitch_all_cycles_with_spanning_tree(
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template(),
+        shape: ti.math.ivec2,
+        distance_from_edge: int,
+        energy_function = patching_energy_with_lengths,
+        edge_ids = None,
+        **greedy_options) -> int:
+    '''
+    Stitch all the cycles of a graph with the minimum spanning tree of the
+    candidates, then stitch the remaining cycles with the greedy algorithm.
+    At the end, the cycle is the first element of cycles.
+
+    Parameters
+    -------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to the edges of the grid.
+
+    previous_edge: ti.template
+
+        field containing the previous edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+        The starting edge is arbitrarily defined.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid (useful to compute neighbours)
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    energy_function: ti.func
+
+        patching energy of two edges, computed from their points and the
+        lengths of their segments. patching_energy_with_lengths by default.
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, given by to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    greedy_options:
+
+        options of stitch_all_cycles_with_neighbourhood, used for the
+        remaining cycles.
+
+
+    Returns
+    -------
+
+    int
+
+        number of stitchings chosen by the spanning tree
+    '''
+    segment_length = ti.field(dtype = float,
+                              shape = points.shape)
+    compute_segment_lengths(points,
+                            next_edge,
+                            segment_length)
+
+    candidate_keys = ti.field(dtype = ti.i64,
+                              shape = points.shape)
+    compute_edges_candidates(points,
+                             next_edge,
+                             segment_length,
+                             energy_function,
+                             cycle_index,
+                             candidate_keys,
+                             shape,
+                             edge_ids,
+                             distance_from_edge)
+
+    #sort the candidates by energy, then by edge
+    keys = candidate_keys.to_numpy()
+    edges = np.nonzero(keys != NO_KEY)[0]
+    sorted_edges = edges[np.argsort(keys[edges] >> 32,
+                                    kind = 'stable')]
+
+    nb_stitchings = 0
+    if sorted_edges.shape[0] > 0:
+
+        candidate_edges = ti.field(dtype = int,
+                                   shape = sorted_edges.shape[0])
+        candidate_edges.from_numpy(sorted_edges.astype(np.int32))
+        is_stitched = ti.field(dtype = int,
+                               shape = points.shape)
+
+        cycle_parent = ti.field(dtype = int,
+                                shape = cycles.shape)
+        cycle_size = ti.field(dtype = int,
+                              shape = cycles.shape)
+        cycle_label = ti.field(dtype = int,
+                               shape = cycles.shape)
+        init_union_find(cycle_parent,
+                        cycle_size,
+                        cycle_label)
+
+        nb_stitchings = apply_spanning_tree(previous_edge,
+                                            next_edge,
+                                            points,
+                                            segment_length,
+                                            cycle_index,
+                                            cycles,
+                                            candidate_edges,
+                                            sorted_edges.shape[0],
+                                            candidate_keys,
+                                            is_stitched,
+                                            shape,
+                                            edge_ids,
+                                            distance_from_edge,
+                                            cycle_parent,
+                                            cycle_size,
+                                            cycle_label)
+        flatten_cycle_index(cycle_index,
+                            cycle_parent,
+                            cycle_label)
+
+    #the cycles which are not connected by the tree
+    remaining_cycles = relabel_cycles(next_edge,
+                                      cycle_index,
+                                      cycles)
+    if remaining_cycles.shape[0] > 1:
+        stitch_all_cycles_with_neighbourhood(points,
+                                             previous_edge,
+                                             next_edge,
+                                             cycle_index,
+                                             remaining_cycles,
+                                             shape,
+                                             distance_from_edge,
+                                             energy_function = energy_function,
+                                             edge_ids = edge_ids,
+                                             **greedy_options)
+        relabel_cycles(next_edge,
+                       cycle_index,
+                       cycles)
+
+    return nb_stitchings
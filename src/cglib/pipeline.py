@@ -0,0 +1,338 @@
+import taichi as ti
+import time
+
+from cglib.type import numpy_to_field, numpy_to_memmap, data_structure_to_numpy, data_structure_to_paths, data_structure_to_svg
+from cglib.graph import to_graph, to_compact_graph
+from cglib.tiles import to_tiled_graph
+from cglib.pyramid import build_pyramid, to_compact_graph_with_pyramid
+from cglib.stitch import stitch_all_cycles_with_neighbourhood
+from cglib.check import check_closure, check_if_one_cycle
+from cglib.artifacts import write_artifact
+
+
+
+'''
+This module runs the extraction, the stitching and the export of the
+isocontours of a scalar field in a single process, as tools/contour.py,
+tools/stitch.py and tools/tosvg.py do one after the other:
+
+    - the fields of the graph given by the extraction are stitched in place,
+      without being saved and read again between the stages,
+    - the shape of the grid is kept from the extraction, so the field is not
+      read again for the stitching,
+    - Taichi is initialised once, and the kernels are compiled once.
+
+The runtime of each stage is given in a summary, after a ti.sync so that the
+kernels launched by a stage are counted in this stage.
+
+'''
+
+
+
+EXPORTS = ("npz", "paths", "svg")
+
+def record_stage(
+        timings: dict,
+        stage: str,
+        start: float) -> float:
+    '''
+    Store the runtime of a stage, once its kernels are done.
+
+    Parameters
+    -------
+
+    timings: dict
+
+        runtime of each stage in seconds.
+
+    stage: str
+
+        name of the stage.
+
+    start: float
+
+        time.perf_counter at the start of the stage.
+
+
+    Returns
+    -------
+
+    float
+
+        time.perf_counter at the end of the stage.
+    '''
+    ti.sync()
+    end = time.perf_counter()
+    timings[stage] = end - start
+    return end
+
+def export_graph(
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template(),
+        file_name: str,
+        edge_ids: ti.template(),
+        exports: tuple,
+        precision: int):
+    '''
+    Export a graph in each of the given formats. The .npz files are
+    replaced at once, see write_artifact.
+
+    Parameters
+    -------
+
+    points, previous_edge, next_edge, cycle_index, cycles, edge_ids: ti.template
+
+        fields describing the graph, see data_structure_to_numpy.
+
+    file_name: str
+
+        name of the output files, without extension.
+
+    exports: tuple
+
+        formats of the export, among EXPORTS:
+
+            - npz: data/np/<file_name>.npz, see data_structure_to_numpy,
+            - paths: data/np/<file_name>_paths.npz, see data_structure_to_paths,
+            - svg: data/svg_files/<file_name>.svg, see data_structure_to_svg.
+
+    precision: int
+
+        number of decimals of the coordinates of the SVG file.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    if "npz" in exports:
+        write_artifact(None,
+                       "data/np",
+                       file_name,
+                       lambda temporary_name: data_structure_to_numpy(points,
+                                                                      previous_edge,
+                                                                      next_edge,
+                                                                      cycle_index,
+                                                                      cycles,
+                                                                      temporary_name,
+                                                                      edge_ids))
+    if "paths" in exports:
+        write_artifact(None,
+                       "data/np",
+                       file_name + "_paths",
+                       lambda temporary_name: data_structure_to_paths(points,
+                                                                      next_edge,
+                                                                      cycles,
+                                                                      temporary_name))
+    if "svg" in exports:
+        data_structure_to_svg(points,
+                              next_edge,
+                              cycles,
+                              file_name,
+                              precision)
+
+def run_pipeline(
+        file_path: str,
+        output_name: str,
+        stitch: bool = True,
+        neighbours: int = 5,
+        isovalue: float = 0.,
+        compact: bool = False,
+        use_pointer_jumping: bool = False,
+        tile_size: int = None,
+        use_pyramid: bool = False,
+        stitching_algorithm = stitch_all_cycles_with_neighbourhood,
+        exports: tuple = ("npz",),
+        precision: int = 6,
+        **stitching_options) -> dict:
+    '''
+    Extract the isocontours of the scalar field of an .npy file, export them,
+    then stitch them and export the cycle, in the same process. The files are
+    the ones of the tools: <output_name>_contour and <output_name>_cycle.
+
+    Parameters
+    -------
+
+    file_path: str
+
+        path to the .npy file containing the scalar field.
+
+    output_name: str
+
+        prefix of the names of the output files.
+
+    stitch: bool
+
+        if False, the isocontours are only extracted and exported.
+
+    neighbours: int
+
+        distance from the reference edge to compute the neighbours
+        of the stitching, 5 by default.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+    compact: bool
+
+        if True, the graph is given by to_compact_graph instead of to_graph.
+
+    use_pointer_jumping: bool
+
+        if True, the cycles are labelled in parallel by pointer jumping,
+        see to_graph.
+
+    tile_size: int
+
+        if not None, the field is memory-mapped and the graph is given by
+        to_tiled_graph with tiles of this size.
+
+    use_pyramid: bool
+
+        if True, the graph is given by to_compact_graph_with_pyramid, which
+        only visits the blocks of cells straddling the isovalue. The time
+        of the construction of the pyramid is given as the pyramid stage.
+
+    stitching_algorithm: function
+
+        stitch_all_cycles_with_neighbourhood by default,
+        or stitch_all_cycles_with_spanning_tree, stitch_all_cycles_by_rounds.
+
+    exports: tuple
+
+        formats of the export of the graphs, see export_graph.
+
+    precision: int
+
+        number of decimals of the coordinates of the SVG files.
+
+    stitching_options:
+
+        options of the stitching algorithm, such as use_heap or use_cache.
+
+
+    Returns
+    -------
+
+    dict
+
+        summary of the run:
+
+            - shape: shape of the grid, with its border,
+            - nb_cycles: number of isocontours,
+            - closed: True if the isocontours are closed,
+            - one_cycle: True if the stitching gives one cycle, None without stitching,
+            - timings: runtime of each stage in seconds, and total.
+    '''
+    timings = {}
+    start = time.perf_counter()
+    first_start = start
+
+    #get the scalar field, which is read by tiles in the tiled extraction
+    edge_ids = None
+    if tile_size is None:
+        grid = numpy_to_field(file_path)
+        shape = grid.shape
+        start = record_stage(timings,
+                             "load",
+                             start)
+    else:
+        field_array = numpy_to_memmap(file_path)
+        shape = (field_array.shape[0] + 2,
+                 field_array.shape[1] + 2)
+
+    #extract the isocontours
+    if tile_size is not None:
+        points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_tiled_graph(file_path,
+                                                                                        tile_size,
+                                                                                        use_pointer_jumping,
+                                                                                        isovalue)
+    elif use_pyramid:
+        pyramid = build_pyramid(grid)
+        start = record_stage(timings,
+                             "pyramid",
+                             start)
+        points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_compact_graph_with_pyramid(grid,
+                                                                                                       pyramid,
+                                                                                                       use_pointer_jumping,
+                                                                                                       isovalue)
+    elif compact:
+        points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_compact_graph(grid,
+                                                                                          use_pointer_jumping,
+                                                                                          isovalue)
+    else:
+        points, previous_edge, next_edge, cycle_index, cycles = to_graph(grid,
+                                                                         use_pointer_jumping,
+                                                                         isovalue)
+    start = record_stage(timings,
+                         "contour",
+                         start)
+
+    closed = check_closure(next_edge,
+                           cycles) == 1
+    nb_cycles = cycles.shape[0]
+    start = record_stage(timings,
+                         "check contour",
+                         start)
+
+    export_graph(points,
+                 previous_edge,
+                 next_edge,
+                 cycle_index,
+                 cycles,
+                 output_name + "_contour",
+                 edge_ids,
+                 exports,
+                 precision)
+    start = record_stage(timings,
+                         "export contour",
+                         start)
+
+    #stitch the isocontours in place
+    one_cycle = None
+    if stitch:
+        stitching_algorithm(points,
+                            previous_edge,
+                            next_edge,
+                            cycle_index,
+                            cycles,
+                            ti.math.ivec2(shape[0],
+                                          shape[1]),
+                            neighbours,
+                            edge_ids = edge_ids,
+                            **stitching_options)
+        start = record_stage(timings,
+                             "stitch",
+                             start)
+
+        one_cycle = check_if_one_cycle(next_edge,
+                                       cycles) == 1
+        start = record_stage(timings,
+                             "check cycle",
+                             start)
+
+        export_graph(points,
+                     previous_edge,
+                     next_edge,
+                     cycle_index,
+                     cycles,
+                     output_name + "_cycle",
+                     edge_ids,
+                     exports,
+                     precision)
+        start = record_stage(timings,
+                             "export cycle",
+                             start)
+
+    timings["total"] = start - first_start
+
+    return {"shape": list(shape),
+            "nb_cycles": nb_cycles,
+            "closed": closed,
+            "one_cycle": one_cycle,
+            "timings": timings}
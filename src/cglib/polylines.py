@@ -1,16 +1,21 @@
 import taichi as ti 
+import numpy as np
+
+from cglib.fields import exclusive_scan_array
 
 
 
 @ti.kernel
 def compute_lines(
-        lines: ti.template(), 
+        lines: ti.types.ndarray(dtype = ti.math.vec2, ndim = 1), 
         points: ti.template(), 
         next_edge: ti.template(), 
-        cycles: ti.template()): 
+        cycles: ti.template(), 
+        is_line_strip: int): 
     
     '''
-    Compute the polylines described by the graph. 
+    Compute the polylines described by the graph, walking the cycles one 
+    after the other. 
 
     Parameters 
     ----------
@@ -30,9 +35,14 @@ def compute_lines(
         1D vector fields containing the length and starting edge of each cycle. 
         The starting edge is arbitrarily defined. 
         
-    lines
+    lines: ti.types.ndarray
 
-        field containing the data of the polylines
+        1D array of 2D vectors containing the points of the polylines. 
+
+    is_line_strip: int 
+
+        1 for the line-strip layout, 0 for the segment-pair layout, 
+        see graph_to_polylines. 
 
 
     Returns
@@ -53,21 +63,383 @@ def compute_lines(
         ti.loop_config(serialize=True)
         for _ in range(cycle.y): 
 
-            lines[line_index] = points[point_index]
-            lines[line_index +1] = points[next_edge[point_index]]
-            line_index += 2 
+            if is_line_strip == 1: 
+                lines[line_index] = points[point_index]
+                line_index += 1 
+            else: 
+                lines[line_index] = points[point_index]
+                lines[line_index +1] = points[next_edge[point_index]]
+                line_index += 2 
 
 
             next_point = next_edge[point_index]
             point_index = next_point
 
+        #the first point closes the line strip, and the NaN separates it 
+        #from the next one 
+        if is_line_strip == 1 and cycle.y != 0: 
+            lines[line_index] = points[cycle.x]
+            line_index += 2 
+
+@ti.kernel
+def fill_line_sizes(
+        cycles: ti.template(), 
+        is_line_strip: int, 
+        line_sizes: ti.types.ndarray()): 
+    '''
+    Compute the number of vertices of the polyline of each cycle. 
+
+    Parameters 
+    ----------
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+
+    is_line_strip: int 
+
+        1 for the line-strip layout, 0 for the segment-pair layout, 
+        see graph_to_polylines. 
+
+    line_sizes: ti.types.ndarray
+
+        1D array containing the number of vertices of each cycle. 
+
+
+    Returns
+    -------
+
+    None    
+    '''
+    for cycle_number in cycles: 
+        length = cycles[cycle_number].y
+        size = 2 * length
+        if is_line_strip == 1 and length != 0: 
+            size = length + 2
+        line_sizes[cycle_number] = size
+
+@ti.kernel
+def collect_active_edges(
+        next_edge: ti.template(), 
+        active_edges: ti.types.ndarray()) -> int: 
+    '''
+    List the edges with a point, in any order. 
+
+    Parameters 
+    ----------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    active_edges: ti.types.ndarray
+
+        1D array of the size of next_edge, containing the edges with a point. 
+
+
+    Returns
+    -------
+
+    int 
+
+        number of edges with a point. 
+    '''
+    nb_active_edges = 0
+    for edge_index in next_edge: 
+        if next_edge[edge_index] != 0: 
+            active_edges[ti.atomic_add(nb_active_edges, 1)] = edge_index
+
+    return nb_active_edges
+
+@ti.kernel
+def init_edge_ranks(
+        next_edge: ti.template(), 
+        cycles: ti.template(), 
+        active_edges: ti.types.ndarray(), 
+        nb_active_edges: int, 
+        jump_edge: ti.types.ndarray(), 
+        edge_distance: ti.types.ndarray(), 
+        start_cycle: ti.types.ndarray()) -> int: 
+    '''
+    Initialise the pointer jumping: each edge points to its next edge, 
+    except the starting edge of each cycle, which points to itself. 
+
+    Parameters 
+    ----------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+
+    active_edges: ti.types.ndarray
+
+        1D array containing the edges with a point, see collect_active_edges. 
+
+    nb_active_edges: int 
+
+        number of edges with a point. 
+
+    jump_edge: ti.types.ndarray
+
+        1D array containing the edge to which each edge points. 
+
+    edge_distance: ti.types.ndarray
+
+        1D array containing the number of edges from each edge 
+        to the edge to which it points. 
+
+    start_cycle: ti.types.ndarray
+
+        1D array containing the cycle of each starting edge, 
+        -1 for the other edges. 
+
+
+    Returns
+    -------
+
+    int 
+
+        length of the longest cycle. 
+    '''
+    for position in range(nb_active_edges): 
+        edge_index = active_edges[position]
+        jump_edge[edge_index] = next_edge[edge_index]
+        edge_distance[edge_index] = 1
+        start_cycle[edge_index] = -1
+
+    max_length = 0
+    for cycle_number in cycles: 
+        cycle = cycles[cycle_number]
+        if cycle.y != 0: 
+            jump_edge[cycle.x] = cycle.x
+            edge_distance[cycle.x] = 0
+            start_cycle[cycle.x] = cycle_number
+            ti.atomic_max(max_length, cycle.y)
+
+    return max_length
+
+@ti.kernel
+def jump_edge_ranks(
+        active_edges: ti.types.ndarray(), 
+        nb_active_edges: int, 
+        jump_edge: ti.types.ndarray(), 
+        edge_distance: ti.types.ndarray(), 
+        new_jump_edge: ti.types.ndarray(), 
+        new_edge_distance: ti.types.ndarray()): 
+    '''
+    Make one round of pointer jumping. If each edge points to the edge 2^k 
+    further, or to the starting edge of its cycle if it is closer, the 
+    new arrays hold the same for 2^(k+1) edges after the round. 
+
+    Parameters 
+    ----------
+
+    active_edges: ti.types.ndarray
+
+        1D array containing the edges with a point, see collect_active_edges. 
+
+    nb_active_edges: int 
+
+        number of edges with a point. 
+
+    jump_edge, edge_distance: ti.types.ndarray
+
+        pointers and distances of the previous round, see init_edge_ranks. 
+
+    new_jump_edge, new_edge_distance: ti.types.ndarray
+
+        pointers and distances after the round. 
+
+
+    Returns
+    -------
+
+    None    
+    '''
+    for position in range(nb_active_edges): 
+        edge_index = active_edges[position]
+        jump = jump_edge[edge_index]
+        new_edge_distance[edge_index] = edge_distance[edge_index]\
+                                        + edge_distance[jump]
+        new_jump_edge[edge_index] = jump_edge[jump]
+
+@ti.kernel
+def scatter_lines(
+        lines: ti.types.ndarray(dtype = ti.math.vec2, ndim = 1), 
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        cycles: ti.template(), 
+        active_edges: ti.types.ndarray(), 
+        nb_active_edges: int, 
+        jump_edge: ti.types.ndarray(), 
+        edge_distance: ti.types.ndarray(), 
+        start_cycle: ti.types.ndarray(), 
+        line_offsets: ti.types.ndarray(), 
+        is_line_strip: int): 
+    '''
+    Write the points of each edge at its rank in the polyline of its cycle. 
+    After the pointer jumping, each edge points to the starting edge of its 
+    cycle, and its rank is given by its distance to this edge. 
+
+    Parameters 
+    ----------
+
+    lines: ti.types.ndarray
+
+        1D array of 2D vectors containing the points of the polylines. 
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to 1D indexes of the grid edges. 
+    
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+
+    active_edges, nb_active_edges, jump_edge, edge_distance, start_cycle: 
+
+        see init_edge_ranks. 
+
+    line_offsets: ti.types.ndarray
+
+        exclusive prefix sum of the number of vertices of the cycles. 
+
+    is_line_strip: int 
+
+        1 for the line-strip layout, 0 for the segment-pair layout. 
+
+
+    Returns
+    -------
+
+    None    
+    '''
+    for position in range(nb_active_edges): 
+        edge_index = active_edges[position]
+        cycle_number = start_cycle[jump_edge[edge_index]]
+
+        #the edges of the cycles which are not in cycles are not drawn 
+        if cycle_number != -1: 
+            length = cycles[cycle_number].y
+            rank = (length - edge_distance[edge_index]) % length
+            offset = line_offsets[cycle_number]
+
+            if is_line_strip == 1: 
+                lines[offset + rank] = points[edge_index]
+                if rank == 0: 
+                    lines[offset + length] = points[edge_index]
+            else: 
+                lines[offset + 2 * rank] = points[edge_index]
+                lines[offset + 2 * rank + 1] = points[next_edge[edge_index]]
+
+def build_lines_in_parallel(
+        lines: np.ndarray, 
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        cycles: ti.template(), 
+        line_offsets: np.ndarray, 
+        is_line_strip: int): 
+
+    '''
+    Write the polylines of a graph in parallel: the rank of each edge in its cycle 
+    is given by pointer jumping, then the points are scattered to their rank. 
+
+    Parameters 
+    ----------
+
+    lines: np.ndarray
+
+        2D array containing the coordinates of the points of the polylines. 
+
+    points, next_edge, cycles: ti.template
+
+        fields describing the graph, see graph_to_polylines. 
+
+    line_offsets: np.ndarray
+
+        exclusive prefix sum of the number of vertices of the cycles. 
+
+    is_line_strip: int 
+
+        1 for the line-strip layout, 0 for the segment-pair layout. 
+
+
+    Returns
+    -------
+
+    None    
+    '''
+    #rank of each edge in its cycle, the arrays are indexed by the edges 
+    active_edges = np.empty(next_edge.shape[0], 
+                            dtype = np.int32)
+    nb_active_edges = collect_active_edges(next_edge, 
+                                           active_edges)
+
+    jump_edge = np.empty(next_edge.shape[0], 
+                         dtype = np.int32)
+    edge_distance = np.empty(next_edge.shape[0], 
+                             dtype = np.int32)
+    start_cycle = np.empty(next_edge.shape[0], 
+                           dtype = np.int32)
+    new_jump_edge = np.empty(next_edge.shape[0], 
+                             dtype = np.int32)
+    new_edge_distance = np.empty(next_edge.shape[0], 
+                                 dtype = np.int32)
+
+    max_length = init_edge_ranks(next_edge, 
+                                 cycles, 
+                                 active_edges, 
+                                 nb_active_edges, 
+                                 jump_edge, 
+                                 edge_distance, 
+                                 start_cycle)
+    for _ in range(max_length.bit_length()): 
+        jump_edge_ranks(active_edges, 
+                        nb_active_edges, 
+                        jump_edge, 
+                        edge_distance, 
+                        new_jump_edge, 
+                        new_edge_distance)
+        jump_edge, new_jump_edge = new_jump_edge, jump_edge
+        edge_distance, new_edge_distance = new_edge_distance, edge_distance
+
+    scatter_lines(lines, 
+                  points, 
+                  next_edge, 
+                  cycles, 
+                  active_edges, 
+                  nb_active_edges, 
+                  jump_edge, 
+                  edge_distance, 
+                  start_cycle, 
+                  line_offsets, 
+                  is_line_strip)
+
 def graph_to_polylines(
         points: ti.template(), 
         next_edge: ti.template(), 
-        cycles: ti.template()) -> ti.template(): 
+        cycles: ti.template(), 
+        is_line_strip: bool = False, 
+        parallel: bool = False) -> ti.template(): 
 
     '''
     Returns the polylines of a graph in a field that can be used by the Taichi visualisation tool. 
+    The offset of each cycle in the field is given by a prefix sum of the lengths of the cycles. 
+    By default, the cycles are walked one after the other. In parallel, the rank of each edge 
+    in its cycle is given by pointer jumping, in O(log L) rounds for a cycle of length L, and 
+    the points are written at their rank. 
 
     Parameters 
     ----------
@@ -86,6 +458,18 @@ def graph_to_polylines(
 
         1D vector fields containing the length and starting edge of each cycle. 
         The starting edge is arbitrarily defined. 
+
+    is_line_strip: bool 
+
+        if False, the polylines are given as pairs of points, one per segment, 
+        as expected by canvas.lines. If True, the points of each cycle are 
+        given in order, followed by the first point and by a NaN separator, 
+        which takes half of the memory. 
+
+    parallel: bool 
+
+        if True, the polylines are built by pointer jumping. The result is the same. 
+        It only pays off with several cores, the serial walk is faster on a single one. 
         
 
     Returns
@@ -95,14 +479,44 @@ def graph_to_polylines(
 
         field containing the data of the polylines
     '''
+    is_line_strip = int(is_line_strip)
+
+    #offset of each cycle in the polylines 
+    line_sizes = np.zeros(cycles.shape[0], 
+                          dtype = np.int32)
+    fill_line_sizes(cycles, 
+                    is_line_strip, 
+                    line_sizes)
+    line_offsets = np.zeros(cycles.shape[0] + 1, 
+                            dtype = np.int32)
+    exclusive_scan_array(line_sizes, 
+                         line_offsets)
+    lines_shape = max(int(line_offsets[-1]), 1)
+
+    #the points are written to an array, so that the kernels are compiled for 
+    #the fields of the graph only, and not for each output field 
+    line_array = np.full((lines_shape, 2), 
+                         np.nan, 
+                         dtype = np.float32)
+
+    if not parallel: 
+        compute_lines(line_array, 
+                      points, 
+                      next_edge,
+                      cycles, 
+                      is_line_strip)
+
+    else: 
+        build_lines_in_parallel(line_array, 
+                                points, 
+                                next_edge, 
+                                cycles, 
+                                line_offsets, 
+                                is_line_strip)
 
     lines = ti.Vector.field(dtype = float, 
                             n = 2, 
-                            shape = points.shape) 
-    lines.fill(ti.math.nan)
-    compute_lines(lines, 
-                  points, 
-                  next_edge,
-                  cycles)
+                            shape = lines_shape) 
+    lines.from_numpy(line_array)
     
     return lines
\ No newline at end of file
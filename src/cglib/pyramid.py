@@ -0,0 +1,876 @@
+import taichi as ti
+import numpy as np
+
+from cglib.index import index2d_to_edge_index
+from cglib.implicit import get_grid_value
+from cglib.fields import exclusive_scan_array
+from cglib.graph import compute_cell_graph, get_owned_edges, split_levels, label_cycles
+
+
+
+'''
+This module contains an extraction of the isocontours which only visits the
+cells close to the contours. A min/max pyramid is built over the grid, as a
+mipmap:
+
+    - the level 0 contains the minimal and the maximal values of the corners
+      of each block of block_size x block_size cells,
+    - each next level contains the bounds of 2 x 2 blocks of the previous one,
+      up to a level of at most 2 x 2 blocks.
+
+A block whose interval [min, max] does not contain an isovalue has no crossed
+cell, since all its corners are on the same side of the isovalue. The blocks
+of the top level which straddle an isovalue are refined level by level, and
+compute_graph is only run on the cells of the straddling blocks of the level 0.
+The cycles are flooded from the edges of these cells, then numbered in the
+order of their edge with the minimal index, so the graph is the one given by
+to_graphs.
+
+The pyramid does not depend on the isovalues, so it is built once for a grid
+and used for any isovalue and any number of extractions. The cost of the
+extraction is given by the number of straddling blocks, i.e. by the length of
+the contours times block_size, instead of the area of the grid:
+
+    - to_compact_graph_with_pyramid gives the compact graph of to_compact_graph,
+      whose fields only contain the edges of the straddling blocks with a point,
+    - to_graphs_with_pyramid gives the graphs of to_graphs, whose fields are
+      still allocated and cleared according to the grid edges.
+
+'''
+
+
+
+@ti.func
+def is_block_crossed(
+        block_bounds: ti.math.vec2,
+        isovalues: ti.types.ndarray()) -> int:
+    '''
+    Check if the interval of values of a block contains one of the isovalues,
+    with the convention of get_cell_configuration.
+
+    Parameters
+    -------
+
+    block_bounds: ti.math.vec2
+
+        minimal and maximal values of the corners of the block.
+
+    isovalues: ti.types.ndarray
+
+        1D array containing the isovalue of each level.
+
+
+    Returns
+    -------
+
+    int
+
+        1 if a cell of the block may be crossed by an isocontour, 0 otherwise.
+    '''
+    is_crossed = 0
+    for level in range(isovalues.shape[0]):
+        if block_bounds.x < isovalues[level] and block_bounds.y >= isovalues[level]:
+            is_crossed = 1
+    return is_crossed
+
+@ti.kernel
+def compute_block_bounds(
+        grid: ti.template(),
+        block_size: int,
+        block_bounds: ti.template()):
+    '''
+    Compute the minimal and maximal values of the corners of the cells of
+    each block, i.e. the level 0 of the pyramid.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    block_size: int
+
+        number of rows and columns of cells of a block.
+
+    block_bounds: ti.template
+
+        2D vector field containing the minimal and maximal values of each block.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_block, y_block in block_bounds:
+        minimum = ti.math.inf
+        maximum = -ti.math.inf
+
+        #the last row and column of points are the corners of the last cells
+        x_end = ti.min((x_block + 1) * block_size, grid.shape[0] - 1)
+        y_end = ti.min((y_block + 1) * block_size, grid.shape[1] - 1)
+        for x_index in range(x_block * block_size, x_end + 1):
+            for y_index in range(y_block * block_size, y_end + 1):
+                value = get_grid_value(grid,
+                                       ti.math.ivec2(x_index, y_index))
+                minimum = ti.min(minimum, value)
+                maximum = ti.max(maximum, value)
+
+        block_bounds[x_block, y_block] = ti.math.vec2(minimum,
+                                                      maximum)
+
+@ti.kernel
+def reduce_block_bounds(
+        block_bounds: ti.template(),
+        parent_bounds: ti.template()):
+    '''
+    Compute the next level of the pyramid, each block of which contains
+    2 x 2 blocks of the previous level.
+
+    Parameters
+    -------
+
+    block_bounds: ti.template
+
+        2D vector field containing the minimal and maximal values of each
+        block of the previous level.
+
+    parent_bounds: ti.template
+
+        2D vector field containing the minimal and maximal values of each
+        block of the next level.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for x_parent, y_parent in parent_bounds:
+        minimum = ti.math.inf
+        maximum = -ti.math.inf
+        for x_child, y_child in ti.static(ti.ndrange(2, 2)):
+            child = ti.math.ivec2(2 * x_parent + x_child,
+                                  2 * y_parent + y_child)
+            if child.x < block_bounds.shape[0] and child.y < block_bounds.shape[1]:
+                minimum = ti.min(minimum, block_bounds[child].x)
+                maximum = ti.max(maximum, block_bounds[child].y)
+
+        parent_bounds[x_parent, y_parent] = ti.math.vec2(minimum,
+                                                         maximum)
+
+@ti.kernel
+def refine_blocks(
+        block_bounds: ti.template(),
+        isovalues: ti.types.ndarray(),
+        parent_blocks: ti.types.ndarray(),
+        child_blocks: ti.types.ndarray(),
+        nb_child_blocks: ti.types.ndarray()):
+    '''
+    List the blocks of a level of the pyramid which straddle an isovalue,
+    among the children of the straddling blocks of the next level.
+
+    Parameters
+    -------
+
+    block_bounds: ti.template
+
+        2D vector field containing the minimal and maximal values of each
+        block of the level.
+
+    isovalues: ti.types.ndarray
+
+        1D array containing the isovalue of each level.
+
+    parent_blocks: ti.types.ndarray
+
+        2D array containing the 2D index of the straddling blocks of the
+        next level.
+
+    child_blocks: ti.types.ndarray
+
+        2D array containing the 2D index of the straddling blocks of the level,
+        in any order. Its size is 4 times the number of parent blocks.
+
+    nb_child_blocks: ti.types.ndarray
+
+        1D array of size 1 containing the number of straddling blocks.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position in range(parent_blocks.shape[0]):
+        for x_child, y_child in ti.static(ti.ndrange(2, 2)):
+            child = ti.math.ivec2(2 * parent_blocks[position, 0] + x_child,
+                                  2 * parent_blocks[position, 1] + y_child)
+            if child.x < block_bounds.shape[0] and child.y < block_bounds.shape[1]:
+                if is_block_crossed(block_bounds[child],
+                                    isovalues) == 1:
+                    slot = ti.atomic_add(nb_child_blocks[0], 1)
+                    child_blocks[slot, 0] = child.x
+                    child_blocks[slot, 1] = child.y
+
+@ti.kernel
+def compute_blocks_graph(
+        grid: ti.template(),
+        isovalues: ti.types.ndarray(),
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        edge_ids: ti.template(),
+        block_size: int,
+        blocks: ti.types.ndarray(),
+        block_edges: ti.types.ndarray()):
+    '''
+    Compute the points and the adjacency of the cells of some blocks of the
+    level 0 of the pyramid, as compute_graph, and list the edges of these cells.
+
+    Parameters
+    -------
+
+    grid, points, previous_edge, next_edge, edge_ids: ti.template
+
+        see compute_graph.
+
+    isovalues: ti.types.ndarray
+
+        1D array containing the isovalue of each level.
+
+    block_size: int
+
+        number of rows and columns of cells of a block.
+
+    blocks: ti.types.ndarray
+
+        2D array containing the 2D index of the blocks.
+
+    block_edges: ti.types.ndarray
+
+        1D array containing the 1D index of the four edges of each cell of
+        the blocks, -1 for the cells outside the grid.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    shape = ti.math.ivec2(grid.shape[0],
+                          grid.shape[1])
+    for position, cell_number in ti.ndrange(blocks.shape[0], block_size * block_size):
+        cell = ti.math.ivec2(blocks[position, 0] * block_size + cell_number // block_size,
+                             blocks[position, 1] * block_size + cell_number % block_size)
+        slot = 4 * (position * block_size * block_size + cell_number)
+
+        if cell.x < shape.x - 1 and cell.y < shape.y - 1:
+            compute_cell_graph(grid,
+                               isovalues,
+                               points,
+                               previous_edge,
+                               next_edge,
+                               edge_ids,
+                               ti.math.ivec2(0, 0),
+                               grid.shape,
+                               cell)
+            edge_indexes = index2d_to_edge_index(cell,
+                                                 shape)
+            for edge_number in ti.static(range(4)):
+                block_edges[slot + edge_number] = edge_indexes[edge_number]
+        else:
+            for edge_number in ti.static(range(4)):
+                block_edges[slot + edge_number] = -1
+
+@ti.kernel
+def count_blocks_active_edges(
+        grid: ti.template(),
+        isovalue: float,
+        block_size: int,
+        blocks: ti.types.ndarray(),
+        edge_count: ti.types.ndarray()):
+    '''
+    Count the edges carrying a point which are owned by each cell of some
+    blocks of the level 0 of the pyramid, as count_active_edges.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    isovalue: float
+
+        value of the isocontours.
+
+    block_size: int
+
+        number of rows and columns of cells of a block.
+
+    blocks: ti.types.ndarray
+
+        2D array containing the 2D index of the blocks.
+
+    edge_count: ti.types.ndarray
+
+        1D array containing the number of edges owned by each cell of the
+        blocks, 0 for the cells outside the grid.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for position, cell_number in ti.ndrange(blocks.shape[0], block_size * block_size):
+        cell = ti.math.ivec2(blocks[position, 0] * block_size + cell_number // block_size,
+                             blocks[position, 1] * block_size + cell_number % block_size)
+
+        count = 0
+        if cell.x < grid.shape[0] - 1 and cell.y < grid.shape[1] - 1:
+            owned_edges = get_owned_edges(grid,
+                                          isovalue,
+                                          cell)
+            for edge_number in ti.static(range(4)):
+                if owned_edges[edge_number] != -1:
+                    count += 1
+
+        edge_count[position * block_size * block_size + cell_number] = count
+
+@ti.kernel
+def fill_blocks_edge_ids(
+        grid: ti.template(),
+        isovalue: float,
+        block_size: int,
+        blocks: ti.types.ndarray(),
+        edge_offsets: ti.types.ndarray(),
+        edge_ids: ti.types.ndarray()):
+    '''
+    Write the grid 1D index of the edges owned by each cell of some blocks
+    of the level 0 of the pyramid in its output slots, as fill_edge_ids.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    isovalue: float
+
+        value of the isocontours.
+
+    block_size: int
+
+        number of rows and columns of cells of a block.
+
+    blocks: ti.types.ndarray
+
+        2D array containing the 2D index of the blocks.
+
+    edge_offsets: ti.types.ndarray
+
+        exclusive prefix sum of the number of edges owned by each cell of
+        the blocks, see count_blocks_active_edges.
+
+    edge_ids: ti.types.ndarray
+
+        1D array containing the grid 1D index of each edge of the graph.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    edge_ids[0] = -1
+    for position, cell_number in ti.ndrange(blocks.shape[0], block_size * block_size):
+        cell = ti.math.ivec2(blocks[position, 0] * block_size + cell_number // block_size,
+                             blocks[position, 1] * block_size + cell_number % block_size)
+
+        if cell.x < grid.shape[0] - 1 and cell.y < grid.shape[1] - 1:
+            owned_edges = get_owned_edges(grid,
+                                          isovalue,
+                                          cell)
+            slot = edge_offsets[position * block_size * block_size + cell_number] + 1
+            for edge_number in ti.static(range(4)):
+                if owned_edges[edge_number] != -1:
+                    edge_ids[slot] = owned_edges[edge_number]
+                    slot += 1
+
+@ti.kernel
+def compute_candidate_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        candidate_edges: ti.types.ndarray(),
+        candidate_cycles: ti.types.ndarray()) -> int:
+    '''
+    Compute the cycles of the graph as compute_cycles, browsing only the
+    candidate edges instead of all the edges. The candidate edges are not
+    sorted, so the cycles are numbered in the order of their discovery, and
+    their starting edge is their edge with the minimal index.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_edges: ti.types.ndarray
+
+        1D array containing the edges which may have a point, -1 for no edge.
+        All the edges with a point must be listed.
+
+    candidate_cycles: ti.types.ndarray
+
+        2D array containing the starting edge and the length of each cycle.
+
+
+    Returns
+    -------
+
+    int
+
+        number of cycles
+    '''
+    cycle_number = 0
+    ti.loop_config(serialize = True)
+    for position in range(candidate_edges.shape[0]):
+        first_edge = candidate_edges[position]
+        if first_edge != -1:
+            if cycle_index[first_edge] == -1 and next_edge[first_edge] != 0:
+
+                current_edge = first_edge
+                minimal_edge = first_edge
+                cycle_length = 0
+                while True:
+                    cycle_index[current_edge] = cycle_number
+                    minimal_edge = ti.min(minimal_edge, current_edge)
+                    cycle_length += 1
+                    current_edge = next_edge[current_edge]
+                    if current_edge == first_edge:
+                        break
+
+                candidate_cycles[cycle_number, 0] = minimal_edge
+                candidate_cycles[cycle_number, 1] = cycle_length
+                cycle_number += 1
+
+    return cycle_number
+
+@ti.kernel
+def renumber_cycles(
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        candidate_cycles: ti.types.ndarray(),
+        cycle_order: ti.types.ndarray(),
+        cycles: ti.template()):
+    '''
+    Number the cycles in the order of their starting edge, i.e. in the order
+    in which compute_cycles discovers them.
+
+    Parameters
+    -------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_cycles: ti.types.ndarray
+
+        2D array containing the starting edge and the length of each cycle,
+        given by compute_candidate_cycles.
+
+    cycle_order: ti.types.ndarray
+
+        1D array containing the cycles of candidate_cycles sorted by
+        starting edge.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for cycle_number in cycles:
+        first_edge = candidate_cycles[cycle_order[cycle_number], 0]
+        cycles[cycle_number] = ti.math.ivec2(first_edge,
+                                             candidate_cycles[cycle_order[cycle_number], 1])
+
+        current_edge = first_edge
+        while True:
+            cycle_index[current_edge] = cycle_number
+            current_edge = next_edge[current_edge]
+            if current_edge == first_edge:
+                break
+
+def build_pyramid(
+        grid: ti.template(),
+        block_size: int = 8) -> tuple[int, list]:
+    '''
+    Build the min/max pyramid of a grid.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    block_size: int
+
+        number of rows and columns of cells of a block of the level 0.
+
+
+    Returns
+    -------
+
+    tuple[int, list]
+
+        - block_size
+        - the 2D vector field of each level, from the level 0 to the top,
+          containing the minimal and maximal values of each block.
+    '''
+    nb_blocks = ((grid.shape[0] - 2) // block_size + 1,
+                 (grid.shape[1] - 2) // block_size + 1)
+    block_bounds = ti.Vector.field(n = 2,
+                                   dtype = float,
+                                   shape = nb_blocks)
+    compute_block_bounds(grid,
+                         block_size,
+                         block_bounds)
+    levels = [block_bounds]
+
+    while nb_blocks[0] > 2 or nb_blocks[1] > 2:
+        nb_blocks = ((nb_blocks[0] + 1) // 2,
+                     (nb_blocks[1] + 1) // 2)
+        parent_bounds = ti.Vector.field(n = 2,
+                                        dtype = float,
+                                        shape = nb_blocks)
+        reduce_block_bounds(levels[-1],
+                            parent_bounds)
+        levels.append(parent_bounds)
+
+    return block_size, levels
+
+def find_crossed_blocks(
+        pyramid: tuple[int, list],
+        isovalues: np.ndarray) -> np.ndarray:
+    '''
+    Give the blocks of the level 0 of the pyramid which straddle an isovalue,
+    refining the straddling blocks from the top of the pyramid.
+
+    Parameters
+    -------
+
+    pyramid: tuple[int, list]
+
+        min/max pyramid of the grid, see build_pyramid.
+
+    isovalues: np.ndarray
+
+        1D array containing the isovalue of each level.
+
+
+    Returns
+    -------
+
+    np.ndarray
+
+        2D array containing the 2D index of the straddling blocks.
+    '''
+    levels = pyramid[1]
+
+    #the virtual parent of the top level, whose 2 x 2 children are its blocks
+    blocks = np.zeros((1, 2),
+                      dtype = np.int32)
+    nb_blocks = np.zeros(1,
+                         dtype = np.int32)
+    for block_bounds in reversed(levels):
+        child_blocks = np.zeros((4 * blocks.shape[0], 2),
+                                dtype = np.int32)
+        nb_blocks[0] = 0
+        if blocks.shape[0] > 0:
+            refine_blocks(block_bounds,
+                          isovalues,
+                          blocks,
+                          child_blocks,
+                          nb_blocks)
+        blocks = child_blocks[:nb_blocks[0]]
+
+    return blocks
+
+def to_graphs_with_pyramid(
+        grid: ti.template(),
+        pyramid: tuple[int, list],
+        isovalues: list[float]) -> list[tuple]:
+    '''
+    Extract the isocontours of several isovalues from the scalar field as
+    to_graphs, visiting only the blocks of the pyramid which straddle an
+    isovalue. The graphs are the ones given by to_graphs.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    pyramid: tuple[int, list]
+
+        min/max pyramid of the grid, see build_pyramid.
+
+    isovalues: list[float]
+
+        isovalue of each level.
+
+
+    Returns
+    -------
+
+    list[tuple]
+
+        the graph of each level, in the order of isovalues, see to_graph.
+    '''
+    nb_levels = len(isovalues)
+    block_size = pyramid[0]
+
+    #initialise the fields of the graph
+    edge_fields_shape = grid.shape[0]*(grid.shape[1]+1)\
+            + grid.shape[1]*(grid.shape[0]+1)\
+            - 1
+
+    #the isovalues are not a field, so that the kernels are compiled once
+    level_values = np.array(isovalues,
+                            dtype = np.float32)
+
+    points = ti.Vector.field(n = 2,
+                             dtype = float,
+                             shape = nb_levels * edge_fields_shape)
+    previous_edge = ti.field(dtype = int,
+                             shape = nb_levels * edge_fields_shape)
+    next_edge = ti.field(dtype = int,
+                         shape = nb_levels * edge_fields_shape)
+    cycle_index = ti.field(dtype = int,
+                           shape = nb_levels * edge_fields_shape)
+    cycle_index.fill(-1)
+
+    # get the adjacency and the points of the straddling blocks
+    blocks = find_crossed_blocks(pyramid,
+                                 level_values)
+    block_edges = np.zeros(4 * block_size * block_size * max(blocks.shape[0], 1),
+                           dtype = np.int32)
+    if blocks.shape[0] > 0:
+        compute_blocks_graph(grid,
+                             level_values,
+                             points,
+                             previous_edge,
+                             next_edge,
+                             None,
+                             block_size,
+                             blocks,
+                             block_edges)
+
+    # get the cycles of the graph, numbered in the order of compute_cycles
+    candidate_edges = (block_edges[None, :]
+                       + edge_fields_shape * np.arange(nb_levels, dtype = np.int32)[:, None]).ravel()
+    candidate_edges[np.tile(block_edges, nb_levels) == -1] = -1
+    candidate_cycles = np.zeros((candidate_edges.shape[0], 2),
+                                dtype = np.int32)
+    nb_cycles = compute_candidate_cycles(next_edge,
+                                         cycle_index,
+                                         candidate_edges,
+                                         candidate_cycles)
+
+    final_cycles = ti.Vector.field(n = 2,
+                                   dtype = int,
+                                   shape = nb_cycles)
+    if nb_cycles > 0:
+        renumber_cycles(next_edge,
+                        cycle_index,
+                        candidate_cycles,
+                        np.argsort(candidate_cycles[:nb_cycles, 0]).astype(np.int32),
+                        final_cycles)
+
+    if nb_levels == 1:
+        return [(points, previous_edge, next_edge, cycle_index, final_cycles)]
+
+    return split_levels(points,
+                        previous_edge,
+                        next_edge,
+                        cycle_index,
+                        final_cycles,
+                        nb_levels)
+
+def to_graph_with_pyramid(
+        grid: ti.template(),
+        pyramid: tuple[int, list],
+        isovalue: float = 0.) -> tuple[ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template()]:
+    '''
+    Extract the isocontours from the scalar field as to_graph, visiting only
+    the blocks of the pyramid which straddle the isovalue.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    pyramid: tuple[int, list]
+
+        min/max pyramid of the grid, see build_pyramid.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
+
+        fields describing the graph, see to_graph.
+    '''
+    return to_graphs_with_pyramid(grid,
+                                  pyramid,
+                                  [isovalue])[0]
+
+def to_compact_graph_with_pyramid(
+        grid: ti.template(),
+        pyramid: tuple[int, list],
+        use_pointer_jumping: bool = False,
+        isovalue: float = 0.) -> tuple[ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template()]:
+    '''
+    Extract the isocontours from the scalar field as to_compact_graph,
+    visiting only the blocks of the pyramid which straddle the isovalue.
+    The edges owned by the cells of these blocks are counted, their output
+    slots are given by a prefix sum, and the points and their adjacency are
+    written in the compact fields. No field has the size of the grid, so
+    once the pyramid is built, the cost is given by the length of the
+    contours. The graph is the one given by to_compact_graph.
+
+    Parameters
+    -------
+
+    grid: ti.template
+
+        the 2D field containing the scalar field values, or an ImplicitField.
+
+    pyramid: tuple[int, list]
+
+        min/max pyramid of the grid, see build_pyramid.
+
+    use_pointer_jumping: bool
+
+        if True, the cycles are labelled in parallel by pointer jumping,
+        instead of flooding them one by one. The result is the same.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
+
+        fields describing the graph, see to_compact_graph.
+    '''
+    block_size = pyramid[0]
+
+    #the isovalues are not a field, so that the kernels are compiled once
+    level_values = np.array([isovalue],
+                            dtype = np.float32)
+    blocks = find_crossed_blocks(pyramid,
+                                 level_values)
+    nb_cells = blocks.shape[0] * block_size * block_size
+
+    # count the edges with a point and give them an output slot
+    edge_count = np.zeros(nb_cells,
+                          dtype = np.int32)
+    edge_offsets = np.zeros(nb_cells + 1,
+                            dtype = np.int32)
+    if blocks.shape[0] > 0:
+        count_blocks_active_edges(grid,
+                                  isovalue,
+                                  block_size,
+                                  blocks,
+                                  edge_count)
+        exclusive_scan_array(edge_count,
+                             edge_offsets)
+    edge_fields_shape = int(edge_offsets[nb_cells]) + 1
+
+    # the map between the compact edges and the grid edges, sorted so that
+    # the edges are browsed in the same order as in the grid
+    edge_id_array = np.full(edge_fields_shape,
+                            -1,
+                            dtype = np.int32)
+    if blocks.shape[0] > 0:
+        fill_blocks_edge_ids(grid,
+                             isovalue,
+                             block_size,
+                             blocks,
+                             edge_offsets,
+                             edge_id_array)
+    edge_ids = ti.field(dtype = int,
+                        shape = edge_fields_shape)
+    edge_ids.from_numpy(np.sort(edge_id_array))
+
+    points = ti.Vector.field(n = 2,
+                             dtype = float,
+                             shape = edge_fields_shape)
+    previous_edge = ti.field(dtype = int,
+                             shape = edge_fields_shape)
+    next_edge = ti.field(dtype = int,
+                         shape = edge_fields_shape)
+
+    # get the adjacency and the points of the straddling blocks
+    if blocks.shape[0] > 0:
+        block_edges = np.zeros(4 * nb_cells,
+                               dtype = np.int32)
+        compute_blocks_graph(grid,
+                             level_values,
+                             points,
+                             previous_edge,
+                             next_edge,
+                             edge_ids,
+                             block_size,
+                             blocks,
+                             block_edges)
+
+    # get the cycles of the graph
+    cycle_index, final_cycles = label_cycles(next_edge,
+                                             use_pointer_jumping)
+
+    return points, previous_edge, next_edge, cycle_index, final_cycles, edge_ids
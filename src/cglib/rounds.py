@@ -0,0 +1,416 @@
+import taichi as ti
+import numpy as np
+
+from cglib.union_find import init_union_find, flatten_cycle_index
+from cglib.stitch import stitch_all_cycles_with_neighbourhood, NO_KEY, ENERGY_MASK, ORDER_MASK
+from cglib.calc import patching_energy_with_lengths
+from cglib.index import edge_1d_to_3d_index, get_neighbour_edge, get_grid_edge, get_graph_edge
+from cglib.graph import compute_segment_lengths
+from cglib.mst import compute_edge_candidate, compute_edges_candidates, apply_spanning_tree, relabel_cycles
+
+
+
+'''
+This module contains a stitching algorithm which stitches several pairs of cycles
+in each round, instead of one pair per iteration:
+
+    - each cycle proposes its best partner, computed in parallel for all the edges,
+    - the proposals are browsed by increasing energy, and a proposal is kept if its
+      two cycles are not connected yet in this round and if its two edges have not
+      been stitched yet in this round,
+    - all the kept proposals are stitched in the same round.
+
+The best proposal of all the cycles is always kept, and most cycles are stitched
+in each round, so the number of rounds is about log2 of the number of cycles.
+The cycles without neighbours are stitched with the greedy algorithm at the end.
+
+'''
+
+
+
+@ti.kernel
+def propose_partners(
+        cycle_index: ti.template(),
+        candidate_keys: ti.template(),
+        cycle_keys: ti.template()):
+    '''
+    Give to each cycle the key of the candidate of its edges with the minimal
+    energy. The order of the key is replaced by the 1D index of the edge.
+
+    Parameters
+    -------
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge, given by
+        compute_edges_candidates.
+
+    cycle_keys: ti.template
+
+        1D i64 field containing the minimal key of each cycle, NO_KEY
+        if the cycle has no candidate.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for cycle_number in cycle_keys:
+        cycle_keys[cycle_number] = ti.i64(NO_KEY)
+
+    for edge in candidate_keys:
+        key = candidate_keys[edge]
+        if key != ti.i64(NO_KEY):
+            ti.atomic_min(cycle_keys[cycle_index[edge]],
+                          (key & ti.i64(ENERGY_MASK)) | ti.cast(edge, ti.i64))
+
+@ti.kernel
+def update_edges_candidates(
+        points: ti.template(),
+        next_edge: ti.template(),
+        segment_length: ti.template(),
+        energy_function: ti.template(),
+        cycle_index: ti.template(),
+        candidate_keys: ti.template(),
+        is_stitched: ti.template(),
+        is_changed: ti.template(),
+        shape: ti.math.ivec2,
+        edge_ids: ti.template(),
+        distance_from_edge: int):
+    '''
+    Compute again the candidates which may have changed during the last round.
+    The energy of two edges only changes when one of them is stitched, and the
+    other candidates can only be excluded, so the candidate of an edge is still
+    the best one if it is not in the same cycle and if no neighbour has been
+    stitched.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points
+        and the lengths of their segments, such as patching_energy_with_lengths.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    candidate_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge, ordered by energy,
+        then by neighbour. NO_KEY if the edge has no candidate.
+
+    is_stitched: ti.template
+
+        1D field containing 1 if the edge has been stitched during the last round.
+
+    is_changed: ti.template
+
+        1D field containing 1 if a neighbour of the edge has been stitched
+        during the last round.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, see to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    k = distance_from_edge*2 + 1
+
+    for edge in is_changed:
+        is_changed[edge] = is_stitched[edge]
+
+    #the neighbourhoods are symmetric inside the grid
+    for edge in is_stitched:
+        if is_stitched[edge] == 1:
+            edge_3d_index = edge_1d_to_3d_index(shape,
+                                                get_grid_edge(edge_ids,
+                                                              edge))
+            for neighbour in range(k * k * 2):
+                neighbour_edge = get_graph_edge(edge_ids,
+                                                get_neighbour_edge(shape,
+                                                                   edge_3d_index,
+                                                                   neighbour,
+                                                                   distance_from_edge))
+                if neighbour_edge != -1:
+                    is_changed[neighbour_edge] = 1
+
+    for edge in candidate_keys:
+        if cycle_index[edge] != -1:
+
+            edge_3d_index = edge_1d_to_3d_index(shape,
+                                                get_grid_edge(edge_ids,
+                                                              edge))
+
+            #the last edges of the grid are not the neighbours of their neighbours
+            if edge_3d_index.x >= shape.x or edge_3d_index.y >= shape.y:
+                is_changed[edge] = 1
+
+            key = candidate_keys[edge]
+            if key != ti.i64(NO_KEY):
+                candidate = get_graph_edge(edge_ids,
+                                           get_neighbour_edge(shape,
+                                                              edge_3d_index,
+                                                              ti.cast(key & ti.i64(ORDER_MASK), int),
+                                                              distance_from_edge))
+                if cycle_index[candidate] == cycle_index[edge]:
+                    is_changed[edge] = 1
+
+            if is_changed[edge] == 1:
+                candidate_keys[edge] = compute_edge_candidate(points,
+                                                              next_edge,
+                                                              segment_length,
+                                                              energy_function,
+                                                              cycle_index,
+                                                              shape,
+                                                              edge_ids,
+                                                              edge,
+                                                              distance_from_edge)
+
+def stitch_all_cycles_by_rounds(
+        points: ti.template(),
+        previous_edge: ti.template(),
+        next_edge: ti.template(),
+        cycle_index: ti.template(),
+        cycles: ti.template(),
+        shape: ti.math.ivec2,
+        distance_from_edge: int,
+        exact_order: bool = False,
+        energy_function = patching_energy_with_lengths,
+        edge_ids = None,
+        **greedy_options) -> int:
+    '''
+    Stitch all the cycles of a graph by rounds of independent stitchings, then
+    stitch the remaining cycles with the greedy algorithm. At the end, the
+    cycle is the first element of cycles.
+
+    Parameters
+    -------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to the edges of the grid.
+
+    previous_edge: ti.template
+
+        field containing the previous edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle.
+        The starting edge is arbitrarily defined.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid (useful to compute neighbours)
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    exact_order: bool
+
+        if True, no round is made and the cycles are stitched with the greedy
+        algorithm, in the exact order of stitch_all_cycles_with_neighbourhood.
+
+    energy_function: ti.func
+
+        patching energy of two edges, computed from their points and the
+        lengths of their segments. patching_energy_with_lengths by default.
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact
+        graph, given by to_compact_graph. None if the graph is arranged
+        according to 1D indexes of the grid edges.
+
+    greedy_options:
+
+        options of stitch_all_cycles_with_neighbourhood, used for the
+        remaining cycles.
+
+
+    Returns
+    -------
+
+    int
+
+        number of rounds
+    '''
+    if exact_order:
+        stitch_all_cycles_with_neighbourhood(points,
+                                             previous_edge,
+                                             next_edge,
+                                             cycle_index,
+                                             cycles,
+                                             shape,
+                                             distance_from_edge,
+                                             energy_function = energy_function,
+                                             edge_ids = edge_ids,
+                                             **greedy_options)
+        return 0
+
+    segment_length = ti.field(dtype = float,
+                              shape = points.shape)
+    compute_segment_lengths(points,
+                            next_edge,
+                            segment_length)
+
+    candidate_keys = ti.field(dtype = ti.i64,
+                              shape = points.shape)
+    cycle_keys = ti.field(dtype = ti.i64,
+                          shape = cycles.shape)
+    proposal_edges = ti.field(dtype = int,
+                              shape = cycles.shape)
+    is_stitched = ti.field(dtype = int,
+                           shape = points.shape)
+    is_changed = ti.field(dtype = int,
+                          shape = points.shape)
+
+    cycle_parent = ti.field(dtype = int,
+                            shape = cycles.shape)
+    cycle_size = ti.field(dtype = int,
+                          shape = cycles.shape)
+    cycle_label = ti.field(dtype = int,
+                           shape = cycles.shape)
+
+    compute_edges_candidates(points,
+                             next_edge,
+                             segment_length,
+                             energy_function,
+                             cycle_index,
+                             candidate_keys,
+                             shape,
+                             edge_ids,
+                             distance_from_edge)
+
+    nb_rounds = 0
+    nb_stitchings = 1
+    while nb_stitchings > 0:
+
+        if nb_rounds > 0:
+            update_edges_candidates(points,
+                                    next_edge,
+                                    segment_length,
+                                    energy_function,
+                                    cycle_index,
+                                    candidate_keys,
+                                    is_stitched,
+                                    is_changed,
+                                    shape,
+                                    edge_ids,
+                                    distance_from_edge)
+        propose_partners(cycle_index,
+                         candidate_keys,
+                         cycle_keys)
+
+        #sort the proposals by energy, then by edge
+        keys = cycle_keys.to_numpy()
+        keys = np.sort(keys[keys != NO_KEY])
+        nb_stitchings = 0
+
+        if keys.shape[0] > 0:
+
+            sorted_edges = np.zeros(cycles.shape[0],
+                                    dtype = np.int32)
+            sorted_edges[:keys.shape[0]] = keys & ORDER_MASK
+            proposal_edges.from_numpy(sorted_edges)
+
+            #the forest is only used in a round, the cycle of each edge
+            #is given by cycle_index between two rounds
+            init_union_find(cycle_parent,
+                            cycle_size,
+                            cycle_label)
+            is_stitched.fill(0)
+
+            nb_stitchings = apply_spanning_tree(previous_edge,
+                                                next_edge,
+                                                points,
+                                                segment_length,
+                                                cycle_index,
+                                                cycles,
+                                                proposal_edges,
+                                                keys.shape[0],
+                                                candidate_keys,
+                                                is_stitched,
+                                                shape,
+                                                edge_ids,
+                                                distance_from_edge,
+                                                cycle_parent,
+                                                cycle_size,
+                                                cycle_label)
+            flatten_cycle_index(cycle_index,
+                                cycle_parent,
+                                cycle_label)
+            nb_rounds += 1
+
+    #the cycles without neighbours
+    remaining_cycles = relabel_cycles(next_edge,
+                                      cycle_index,
+                                      cycles)
+    if remaining_cycles.shape[0] > 1:
+        stitch_all_cycles_with_neighbourhood(points,
+                                             previous_edge,
+                                             next_edge,
+                                             cycle_index,
+                                             remaining_cycles,
+                                             shape,
+                                             distance_from_edge,
+                                             energy_function = energy_function,
+                                             edge_ids = edge_ids,
+                                             **greedy_options)
+        relabel_cycles(next_edge,
+                       cycle_index,
+                       cycles)
+
+    return nb_rounds
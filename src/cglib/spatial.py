@@ -0,0 +1,472 @@
+import taichi as ti
+
+from cglib.fields import exclusive_scan
+from cglib.union_find import get_cycle
+
+
+
+'''
+This module contains a spatial hash of the edges of a graph: the domain is
+divided in square buckets, and the edges whose point is in a bucket are
+stored contiguously. It is used by the stitching algorithm to find the
+nearest edges of another cycle without computing the energy of all the edges.
+
+    - bucket_start: 1D field containing, for each bucket, the position of its
+      first edge in bucket_edges. The last value is the number of edges.
+    - bucket_edges: 1D field containing the 1D index of the edges, sorted by bucket.
+
+'''
+
+
+
+@ti.func
+def get_buckets_shape(
+        shape: ti.math.ivec2,
+        bucket_size: int) -> ti.math.ivec2:
+    '''
+    Give the number of buckets along each axis.
+
+    Parameters
+    -------
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+
+    Returns
+    -------
+
+    ti.math.ivec2
+
+        number of buckets along x and y
+    '''
+    return (shape + bucket_size - 1) // bucket_size
+
+@ti.func
+def point_to_bucket(
+        point: ti.math.vec2,
+        shape: ti.math.ivec2,
+        bucket_size: int) -> ti.math.ivec2:
+    '''
+    Give the 2D index of the bucket containing a point.
+
+    Parameters
+    -------
+
+    point: ti.math.vec2
+
+        cartesian coordinates of the point.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+
+    Returns
+    -------
+
+    ti.math.ivec2
+
+        2D index of the bucket
+    '''
+    cell_count = ti.math.max(shape.x,
+                             shape.y)
+    buckets_shape = get_buckets_shape(shape,
+                                      bucket_size)
+
+    bucket = ti.math.ivec2(int(point.x * cell_count) // bucket_size,
+                           int(point.y * cell_count) // bucket_size)
+
+    return ti.math.clamp(bucket,
+                         0,
+                         buckets_shape - 1)
+
+@ti.kernel
+def count_edges_in_buckets(
+        points: ti.template(),
+        cycle_index: ti.template(),
+        bucket_count: ti.template(),
+        shape: ti.math.ivec2,
+        bucket_size: int):
+    '''
+    Count the number of edges with a point in each bucket.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    bucket_count: ti.template
+
+        1D field containing the number of edges of each bucket.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    buckets_shape = get_buckets_shape(shape,
+                                      bucket_size)
+
+    for edge in cycle_index:
+        if cycle_index[edge] != -1:
+            bucket = point_to_bucket(points[edge],
+                                     shape,
+                                     bucket_size)
+            ti.atomic_add(bucket_count[bucket.x * buckets_shape.y + bucket.y], 1)
+
+@ti.kernel
+def fill_buckets(
+        points: ti.template(),
+        cycle_index: ti.template(),
+        bucket_start: ti.template(),
+        bucket_cursor: ti.template(),
+        bucket_edges: ti.template(),
+        shape: ti.math.ivec2,
+        bucket_size: int):
+    '''
+    Store the edges contiguously by bucket.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    bucket_start: ti.template
+
+        1D field containing the position of the first edge of each bucket.
+
+    bucket_cursor: ti.template
+
+        1D field containing the number of edges already stored in each bucket.
+
+    bucket_edges: ti.template
+
+        1D field containing the 1D index of the edges, sorted by bucket.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    buckets_shape = get_buckets_shape(shape,
+                                      bucket_size)
+
+    for edge in cycle_index:
+        if cycle_index[edge] != -1:
+            bucket = point_to_bucket(points[edge],
+                                     shape,
+                                     bucket_size)
+            bucket_1d_index = bucket.x * buckets_shape.y + bucket.y
+            position = ti.atomic_add(bucket_cursor[bucket_1d_index], 1)
+            bucket_edges[bucket_start[bucket_1d_index] + position] = edge
+
+def build_spatial_hash(
+        points: ti.template(),
+        cycle_index: ti.template(),
+        shape: ti.math.ivec2,
+        bucket_size: int) -> tuple[ti.template(),
+                                   ti.template()]:
+    '''
+    Build the spatial hash of the edges of a graph. It does not depend
+    on the adjacency, so it can be built once before the stitching.
+
+    Parameters
+    -------
+
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges.
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
+
+        fields describing the spatial hash
+            - bucket_start
+            - bucket_edges
+    '''
+    nb_buckets = ((shape[0] + bucket_size - 1) // bucket_size)\
+                    * ((shape[1] + bucket_size - 1) // bucket_size)
+
+    bucket_count = ti.field(dtype = int,
+                            shape = nb_buckets)
+    bucket_start = ti.field(dtype = int,
+                            shape = nb_buckets + 1)
+
+    count_edges_in_buckets(points,
+                           cycle_index,
+                           bucket_count,
+                           shape,
+                           bucket_size)
+    exclusive_scan(bucket_count,
+                   bucket_start)
+
+    #the counts are not needed anymore, they are used as cursors
+    bucket_count.fill(0)
+    bucket_edges = ti.field(dtype = int,
+                            shape = max(bucket_start[nb_buckets], 1))
+    fill_buckets(points,
+                 cycle_index,
+                 bucket_start,
+                 bucket_count,
+                 bucket_edges,
+                 shape,
+                 bucket_size)
+
+    return bucket_start, bucket_edges
+
+@ti.func
+def find_minimal_energy_in_rings(
+        points: ti.template(),
+        next_edge: ti.template(),
+        segment_length: ti.template(),
+        energy_function: ti.template(),
+        cycle_index: ti.template(),
+        cycle_parent: ti.template(),
+        cycle_label: ti.template(),
+        use_union_find: ti.template(),
+        bucket_start: ti.template(),
+        bucket_edges: ti.template(),
+        shape: ti.math.ivec2,
+        bucket_size: int,
+        current_edge_1d_index: int,
+        energy_to_beat: float,
+        max_segment_length: float) -> ti.math.vec2:
+    '''
+    For a given edge of the graph, find the edge of another cycle with the
+    minimal patching energy. The buckets are browsed by rings around the
+    bucket of the edge, and the search stops when the next ring cannot
+    contain an energy lower than the minimal energy found, or than
+    energy_to_beat. The result is the same as compute_minimal_energy.
+
+    The search is stopped with a lower bound of patching_energy_with_lengths,
+    so another energy function must not be lower than the standard one.
+
+    Parameters
+    -------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph,
+        arranged according to 1D indexes of the grid edges.
+
+    next_edge : ti.template
+
+        field containing the next edge of an edge in a cycle,
+        arranged according to the edges of the grid.
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and
+        the point of its next edge, arranged according to 1D indexes of the
+        grid edges.
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points
+        and the lengths of their segments, such as patching_energy_with_lengths.
+
+    cycle_index : ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to the edges of the grid.
+
+    cycle_parent : ti.template
+
+        1D field containing the parent of each element of the cycle forest.
+        Only used if use_union_find is True.
+
+    cycle_label : ti.template
+
+        1D field containing, for each root of the cycle forest, the index
+        of the cycle. Only used if use_union_find is True.
+
+    use_union_find : ti.template
+
+        if True, the cycle of an edge is found with the cycle forest.
+
+    bucket_start : ti.template
+
+        1D field containing the position of the first edge of each bucket.
+
+    bucket_edges : ti.template
+
+        1D field containing the 1D index of the edges, sorted by bucket.
+
+    shape : ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_size : int
+
+        width of a bucket, defined as a number of cells of the grid.
+
+    current_edge_1d_index : int
+
+        1D index of the reference edge which will be used to calcultate the energies.
+
+    energy_to_beat : float
+
+        minimal energy already found with other reference edges.
+
+    max_segment_length : float
+
+        upper bound of the distance between the point of an edge and
+        the point of its next edge.
+
+
+    Returns
+    -------
+
+    ti.math.vec2:
+
+        x: minimal energy for the current edge
+        y: 1D index of the edge which has the minimal energy with the current edge
+    '''
+    edge_I = ti.math.ivec2(current_edge_1d_index,
+                           next_edge[current_edge_1d_index])
+    i_1 = points[edge_I.x]
+    i_2 = points[edge_I.y]
+    length_I = segment_length[edge_I.x]
+    edge_I_cycle = get_cycle(cycle_index,
+                             cycle_parent,
+                             cycle_label,
+                             current_edge_1d_index,
+                             use_union_find)
+
+    buckets_shape = get_buckets_shape(shape,
+                                      bucket_size)
+    center = point_to_bucket(i_1,
+                             shape,
+                             bucket_size)
+    bucket_width = bucket_size / ti.math.max(shape.x, shape.y)
+    maximal_ring = ti.math.max(buckets_shape.x,
+                               buckets_shape.y)
+
+    minimal_energy = ti.math.inf
+    minimal_energy_edge = 0
+
+    ring = 0
+    is_searching = True
+    while is_searching:
+
+        #browse the buckets whose distance to the center is the ring
+        for x_count in range(2 * ring + 1):
+
+            x_bucket = center.x - ring + x_count
+            y_step = 2 * ring
+            y_count = 2
+            if x_count == 0 or x_count == 2 * ring:
+                y_step = 1
+                y_count = 2 * ring + 1
+            if ring == 0:
+                y_count = 1
+
+            for y_step_count in range(y_count):
+
+                y_bucket = center.y - ring + y_step_count * y_step
+
+                if x_bucket >= 0 and x_bucket < buckets_shape.x\
+                        and y_bucket >= 0 and y_bucket < buckets_shape.y:
+
+                    bucket_1d_index = x_bucket * buckets_shape.y + y_bucket
+
+                    for position in range(bucket_start[bucket_1d_index],
+                                          bucket_start[bucket_1d_index + 1]):
+
+                        edge_J_1d_index = bucket_edges[position]
+                        edge_J_cycle = get_cycle(cycle_index,
+                                                 cycle_parent,
+                                                 cycle_label,
+                                                 edge_J_1d_index,
+                                                 use_union_find)
+
+                        if edge_J_cycle != edge_I_cycle:
+                            energy = energy_function(i_1,
+                                                     i_2,
+                                                     points[edge_J_1d_index],
+                                                     points[next_edge[edge_J_1d_index]],
+                                                     length_I,
+                                                     segment_length[edge_J_1d_index])
+
+                            #same tie-breaking as compute_minimal_energy
+                            if energy < minimal_energy\
+                                    or (energy == minimal_energy
+                                        and edge_J_1d_index < minimal_energy_edge):
+                                minimal_energy = energy
+                                minimal_energy_edge = edge_J_1d_index
+
+        #the energy is at least twice the distance between the points,
+        #minus the lengths of the two segments
+        lower_bound = 2. * (ring * bucket_width
+                            - length_I
+                            - max_segment_length)
+
+        if lower_bound > ti.math.min(minimal_energy, energy_to_beat)\
+                or ring >= maximal_ring:
+            is_searching = False
+
+        ring += 1
+
+    return ti.math.vec2(minimal_energy,
+                        minimal_energy_edge)
@@ -0,0 +1,192 @@
+import taichi as ti
+import numpy as np
+import time
+
+from cglib.calc import patching_energy_with_lengths
+from cglib.fields import copy_field_interior, count_cycles
+from cglib.graph import compute_graph, compute_cycles, compute_segment_lengths
+from cglib.stitch import compiled_stitching_algorithm_with_neighbours
+from cglib.type import data_structure_to_numpy
+
+
+
+'''
+This module contains the extraction and the stitching of the isocontours of a
+stack of scalar fields, such as the slices of a volume for layered fabrication.
+All the layers have the same shape, so the fields of a graph are allocated
+once for the whole stack, with the size of the graph of a layer:
+
+    - the layer is read in place from the stack, which may be memory-mapped,
+      and written in the grid with its border,
+    - the fields are cleared, and compute_graph and compute_cycles give the
+      graph of the layer,
+    - the cycles of the layer are the first elements of cycles, which are
+      stitched in place.
+
+The kernels are therefore compiled once for the whole stack, and each layer
+only costs one launch of each kernel, instead of the initialisation, the
+compilation and the allocations of a process per layer.
+
+'''
+
+
+
+def stack_to_graphs(
+        stack: np.ndarray,
+        output_name: str,
+        distance_from_edge: int = None,
+        isovalue: float = 0.,
+        energy_function = patching_energy_with_lengths) -> float:
+    '''
+    Extract the isocontours of each layer of a stack and save them as the
+    graph of contour.py, data/np/<output_name>_<layer>_contour.npz. If
+    distance_from_edge is given, the isocontours of each layer are also
+    stitched with the greedy algorithm of stitch_all_cycles_with_neighbourhood
+    and saved as the cycle of stitch.py, data/np/<output_name>_<layer>_cycle.npz.
+
+    Parameters
+    -------
+
+    stack: np.ndarray
+
+        3D array of shape (layers, W, H), see numpy_to_stack.
+
+    output_name: str
+
+        prefix of the names of the output files.
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+        The layers are not stitched if None.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+    energy_function: ti.func
+
+        patching energy of two edges, computed from their points and the
+        lengths of their segments. patching_energy_with_lengths by default.
+
+
+    Returns
+    -------
+
+    float
+
+        number of layers processed per second, including the compilation
+        of the kernels and the writing of the files.
+    '''
+    start = time.perf_counter()
+
+    nb_layers = stack.shape[0]
+    layer_digits = len(str(max(nb_layers - 1, 0)))
+    shape = (stack.shape[1] + 2,
+             stack.shape[2] + 2)
+
+    #the fields shared by all the layers
+    grid = ti.field(dtype = float,
+                    shape = shape)
+    edge_fields_shape = shape[0]*(shape[1]+1)\
+            + shape[1]*(shape[0]+1)\
+            - 1
+
+    level_values = ti.field(dtype = float,
+                            shape = 1)
+    level_values[0] = isovalue
+
+    points = ti.Vector.field(n = 2,
+                             dtype = float,
+                             shape = edge_fields_shape)
+    previous_edge = ti.field(dtype = int,
+                             shape = edge_fields_shape)
+    next_edge = ti.field(dtype = int,
+                         shape = edge_fields_shape)
+    cycle_index = ti.field(dtype = int,
+                           shape = edge_fields_shape)
+    cycles = ti.Vector.field(n = 2,
+                             dtype = int,
+                             shape = edge_fields_shape)
+    segment_length = ti.field(dtype = float,
+                              shape = edge_fields_shape)
+
+    for layer in range(nb_layers):
+
+        #the layer is arranged as the array of numpy_to_field, and copied
+        #in C order if the stack is stored in Fortran order, see numpy_to_field
+        copy_field_interior(np.ascontiguousarray(stack[layer].reshape(stack.shape[2],
+                                                                      stack.shape[1])),
+                            grid)
+
+        points.fill(0.)
+        previous_edge.fill(0)
+        next_edge.fill(0)
+        cycle_index.fill(-1)
+        cycles.fill(0)
+
+        compute_graph(grid,
+                      level_values,
+                      points,
+                      previous_edge,
+                      next_edge,
+                      None,
+                      ti.math.ivec2(0, 0),
+                      grid.shape)
+        compute_cycles(next_edge,
+                       cycle_index,
+                       cycles)
+        nb_cycles = count_cycles(cycles)
+
+        layer_name = output_name + "_" + str(layer).zfill(layer_digits)
+        data_structure_to_numpy(points,
+                                previous_edge,
+                                next_edge,
+                                cycle_index,
+                                cycles,
+                                layer_name + "_contour",
+                                nb_cycles = nb_cycles)
+
+        if distance_from_edge is not None:
+            compute_segment_lengths(points,
+                                    next_edge,
+                                    segment_length)
+            #the stitching shares the fields of the stack, so the kernel is called
+            #without the wrapper, which would create fields for each layer
+            compiled_stitching_algorithm_with_neighbours(points = points,
+                                                         previous_edge = previous_edge,
+                                                         next_edge = next_edge,
+                                                         segment_length = segment_length,
+                                                         energy_function = energy_function,
+                                                         cycle_index = cycle_index,
+                                                         cycles = cycles,
+                                                         nb_cycles = nb_cycles,
+                                                         shape = ti.math.ivec2(shape[0], shape[1]),
+                                                         edge_ids = None,
+                                                         distance_from_edge = distance_from_edge,
+                                                         heap = None,
+                                                         heap_position = None,
+                                                         use_heap = False,
+                                                         cycle_parent = None,
+                                                         cycle_size = None,
+                                                         cycle_label = None,
+                                                         use_union_find = False,
+                                                         bucket_start = None,
+                                                         bucket_edges = None,
+                                                         bucket_size = max(distance_from_edge, 1),
+                                                         use_spatial_hash = False,
+                                                         candidate_energy = None,
+                                                         candidate_edge = None,
+                                                         is_cached = None,
+                                                         cache_counters = None,
+                                                         use_cache = False)
+            data_structure_to_numpy(points,
+                                    previous_edge,
+                                    next_edge,
+                                    cycle_index,
+                                    cycles,
+                                    layer_name + "_cycle",
+                                    nb_cycles = nb_cycles)
+
+    ti.sync()
+    return nb_layers / (time.perf_counter() - start)
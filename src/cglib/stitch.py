@@ -1,8 +1,19 @@
 import taichi as ti 
 import tqdm
 
-from cglib.fields import reset_energies, find_minimum_in_field 
-from cglib.calc import compute_all_energies, compute_neighbours_energies
+from cglib.calc import compute_minimal_energy, compute_neighbours_energies, compute_neighbour_energy, euclidean_distance, energy_to_key, patching_energy_with_lengths
+from cglib.index import get_graph_neighbour_edge
+from cglib.graph import compute_segment_lengths
+from cglib.heap import build_cycle_heap, update_cycle_heap
+from cglib.union_find import init_union_find, get_cycle, union_cycles, flatten_cycle_index
+from cglib.spatial import build_spatial_hash, find_minimal_energy_in_rings
+from cglib.cache import get_edge_candidate, invalidate_candidates
+
+
+#keys of the parallel version, see energy_to_key 
+NO_KEY = 0x7FFFFFFFFFFFFFFF
+ENERGY_MASK = -0x100000000
+ORDER_MASK = 0xFFFFFFFF
 
 
 
@@ -10,9 +21,15 @@ from cglib.calc import compute_all_energies, compute_neighbours_energies
 def stitch_two_cycles(
         previous_edge: ti.template(), 
         next_edge: ti.template(), 
+        points: ti.template(), 
+        segment_length: ti.template(), 
         cycle_index: ti.template(), 
         cycles: ti.template(), 
-        minimal_energy_edges: ti.math.ivec2):
+        minimal_energy_edges: ti.math.ivec2, 
+        cycle_parent: ti.template(), 
+        cycle_size: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template()) -> ti.math.ivec2:
     
         
     '''
@@ -31,6 +48,17 @@ def stitch_two_cycles(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    points: ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to 1D indexes of the grid edges. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
     cycle_index: ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
@@ -44,16 +72,47 @@ def stitch_two_cycles(
     minimal_energy_edges: ti.math.ivec2
 
         vector of 1D index of the two edges whose adjacency must be changed. 
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_size: ti.template
+
+        1D field containing the number of elements of each tree of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label: ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the trees of the two cycles are merged in the cycle forest, 
+        instead of changing the cycle index of all the edges of the new cycle. 
         
 
     Returns
     -------
 
-    None
+    ti.math.ivec2
+
+        x: index of the cycle which has been kept
+        y: index of the cycle which has been removed
     '''
 
-    cycle_1_index = cycle_index[minimal_energy_edges.x]
-    cycle_2_index = cycle_index[minimal_energy_edges.y]
+    cycle_1_index = get_cycle(cycle_index, 
+                              cycle_parent, 
+                              cycle_label, 
+                              minimal_energy_edges.x, 
+                              use_union_find)
+    cycle_2_index = get_cycle(cycle_index, 
+                              cycle_parent, 
+                              cycle_label, 
+                              minimal_energy_edges.y, 
+                              use_union_find)
 
     #change next_edge and previous_edge
     edge_I = ti.math.ivec2(minimal_energy_edges.x, 
@@ -68,13 +127,26 @@ def stitch_two_cycles(
     next_edge[edge_J.x] = edge_I.y
     previous_edge[edge_J.y] = edge_I.x 
 
+    #only the segments of the two edges have changed
+    segment_length[edge_I.x] = euclidean_distance(points[edge_I.x] - points[edge_J.y])
+    segment_length[edge_J.x] = euclidean_distance(points[edge_J.x] - points[edge_I.y])
+
     #change cycle_index
-    point = next_edge[minimal_energy_edges.x] 
-    while point != minimal_energy_edges.x: 
+    if ti.static(use_union_find): 
         #we keep the first cycle index
-        cycle_index[point] = cycle_1_index 
-        next_point = next_edge[point]
-        point = next_point
+        union_cycles(cycle_parent, 
+                     cycle_size, 
+                     cycle_label, 
+                     cycle_index[minimal_energy_edges.x], 
+                     cycle_index[minimal_energy_edges.y], 
+                     cycle_1_index)
+    else: 
+        point = next_edge[minimal_energy_edges.x] 
+        while point != minimal_energy_edges.x: 
+            #we keep the first cycle index
+            cycle_index[point] = cycle_1_index 
+            next_point = next_edge[point]
+            point = next_point
 
     #change cycles
     new_cycle = ti.math.ivec2(cycles[cycle_1_index].x, 
@@ -82,6 +154,9 @@ def stitch_two_cycles(
     cycles[cycle_1_index] = new_cycle
     cycles[cycle_2_index] = ti.math.ivec2(0, 0)
 
+    return ti.math.ivec2(cycle_1_index, 
+                         cycle_2_index)
+
 @ti.func
 def find_minimal_cycle(
         cycles: ti.template(), 
@@ -126,9 +201,10 @@ def find_minimal_cycle(
 def find_edges_with_minimum_energy(
         points: ti.template(), 
         next_edge: ti.template(),  
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(), 
         cycles: ti.template(), 
-        energies: ti.template(), 
         minimal_cycle_index: int) -> ti.math.ivec2: 
         
         
@@ -150,6 +226,17 @@ def find_edges_with_minimum_energy(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index: ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
@@ -188,13 +275,15 @@ def find_edges_with_minimum_energy(
     for _ in range(minimal_cycle.y): 
         
         
-        reset_energies(energies)
-        compute_all_energies(points, 
-                             next_edge, 
-                             cycle_index, 
-                             energies, 
-                             start_point_index)
-        min_and_index = find_minimum_in_field(energies)
+        min_and_index = compute_minimal_energy(points, 
+                                               next_edge, 
+                                               segment_length, 
+                                               energy_function, 
+                                               cycle_index, 
+                                               None, 
+                                               None, 
+                                               False, 
+                                               start_point_index)
         
         if min_and_index.x < minimal_energy: 
             minimal_energy = min_and_index.x
@@ -212,13 +301,14 @@ def compiled_stitching_algorithm(
         points: ti.template(), 
         previous_edge: ti.template(), 
         next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(), 
-        cycles: ti.template(), 
-        energies: ti.template()): 
+        cycles: ti.template()): 
 
     '''
     Stitch all the cycles of a graph. This is the compiled function called in an non-compiled
-    one because we need to create the "energies" field. 
+    one, which is the version of the algorithm to be called from the Python scope. 
 
     Parameters 
     -------
@@ -238,6 +328,17 @@ def compiled_stitching_algorithm(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index: ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
@@ -248,11 +349,6 @@ def compiled_stitching_algorithm(
         1D vector fields containing the length and starting edge of each cycle. 
         The starting edge is arbitrarily defined. 
 
-    energies : ti.template
-
-        Fields containing the value of the patching energy with the reference edge, 
-        arranged according to the edges of the grid. 
-        
 
     Returns
     -------
@@ -268,22 +364,30 @@ def compiled_stitching_algorithm(
                                                  nb_cycles)
         minimal_energy_edges = find_edges_with_minimum_energy(points, 
                                                               next_edge, 
+                                                              segment_length, 
+                                                              energy_function, 
                                                               cycle_index,
                                                               cycles, 
-                                                              energies, 
                                                               minimal_cycle_index)
         stitch_two_cycles(previous_edge, 
                           next_edge,
+                          points, 
+                          segment_length, 
                           cycle_index, 
                           cycles, 
-                          minimal_energy_edges)
+                          minimal_energy_edges, 
+                          None, 
+                          None, 
+                          None, 
+                          False)
         
 def stitch_all_cycles(
         points: ti.template(), 
         previous_edge: ti.template(), 
         next_edge: ti.template(), 
         cycle_index: ti.template(), 
-        cycles: ti.template()): 
+        cycles: ti.template(), 
+        energy_function = patching_energy_with_lengths): 
     
     '''
     Version of the algorithm to be called from the Python scope.
@@ -316,37 +420,223 @@ def stitch_all_cycles(
         1D vector fields containing the length and starting edge of each cycle. 
         The starting edge is arbitrarily defined. 
 
+    energy_function: ti.func
+
+        patching energy of two edges, computed from their points and the 
+        lengths of their segments. patching_energy_with_lengths by default. 
+
 
     Returns
     -------
 
     None    
     '''
+    segment_length = ti.field(dtype = float, 
+                              shape = points.shape)
+    compute_segment_lengths(points, 
+                            next_edge, 
+                            segment_length)
 
-    energies = ti.field(dtype= float, 
-                        shape = points.shape)
     compiled_stitching_algorithm(points, 
                                  previous_edge, 
                                  next_edge, 
+                                 segment_length, 
+                                 energy_function, 
                                  cycle_index, 
-                                 cycles, 
-                                 energies)
+                                 cycles)
 
 
 '''
 OPTIMISED VERSION 
 '''
 
+@ti.func
+def find_edges_with_minimum_energy_without_neighbours(
+        points: ti.template(), 
+        next_edge: ti.template(),  
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template(), 
+        minimal_cycle_index: int, 
+        shape: ti.math.ivec2, 
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        bucket_start: ti.template(), 
+        bucket_edges: ti.template(), 
+        bucket_size: int, 
+        max_segment_length: float, 
+        use_spatial_hash: ti.template()) -> ti.math.ivec2: 
+    
+    '''
+    Find an edge in the minimal cycle and an edge outside this cycle such 
+    that the patching energy of these two edges is minimal, when no edge 
+    of the minimal cycle has neighbours in another cycle. All the edges 
+    of the graph are considered. 
+
+    Parameters 
+    ------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to the edges of the grid. 
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs, 
+        arranged according to 1D indexes of the grid edges.  
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+        The starting edge is arbitrarily defined. 
+
+    minimal_cycle_index : int 
+
+        index of the minimal cycle
+    
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label: ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
+    bucket_start: ti.template
+
+        1D field containing the position of the first edge of each bucket 
+        of the spatial hash. Only used if use_spatial_hash is True. 
+
+    bucket_edges: ti.template
+
+        1D field containing the 1D index of the edges, sorted by bucket. 
+        Only used if use_spatial_hash is True. 
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid. 
+
+    max_segment_length: float
+
+        upper bound of the distance between the point of an edge and 
+        the point of its next edge. 
+
+    use_spatial_hash: ti.template
+
+        if True, the buckets of the spatial hash are browsed by rings around 
+        each edge, instead of computing the energy of all the edges. 
+        
+    Returns
+    ------
+
+    ti.math.ivec2: 
+
+        int vector containing 1D index of the the edges to stitch
+    '''
+
+    minimal_cycle = cycles[minimal_cycle_index]
+    current_edge_1d_index = minimal_cycle.x
+
+    minimal_energy = ti.math.inf
+    minimal_energy_edges = ti.math.ivec2(0, 0)
+
+    end_point_index = 0
+
+    ti.loop_config(serialize=True)
+    for _ in range(minimal_cycle.y): 
+        
+        min_and_index = ti.math.vec2(ti.math.inf, 0)
+        if ti.static(use_spatial_hash): 
+            min_and_index = find_minimal_energy_in_rings(points, 
+                                                         next_edge, 
+                                                         segment_length, 
+                                                         energy_function, 
+                                                         cycle_index, 
+                                                         cycle_parent, 
+                                                         cycle_label, 
+                                                         use_union_find, 
+                                                         bucket_start, 
+                                                         bucket_edges, 
+                                                         shape, 
+                                                         bucket_size, 
+                                                         current_edge_1d_index, 
+                                                         minimal_energy, 
+                                                         max_segment_length)
+        else: 
+            min_and_index = compute_minimal_energy(points, 
+                                                   next_edge, 
+                                                   segment_length, 
+                                                   energy_function, 
+                                                   cycle_index, 
+                                                   cycle_parent, 
+                                                   cycle_label, 
+                                                   use_union_find, 
+                                                   current_edge_1d_index)
+        
+        if min_and_index.x < minimal_energy: 
+            minimal_energy = min_and_index.x
+            minimal_energy_edges = ti.math.ivec2(current_edge_1d_index, 
+                                                 min_and_index.y)
+
+        end_point_index = next_edge[current_edge_1d_index]
+        current_edge_1d_index = end_point_index
+
+    return minimal_energy_edges
+
 @ti.func
 def find_edges_with_minimum_energy_with_neighbours(
         points: ti.template(), 
         next_edge: ti.template(),  
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(), 
         cycles: ti.template(), 
-        energies: ti.template(), 
         minimal_cycle_index: int, 
         shape: ti.math.ivec2, 
-        distance_from_edge: int) -> ti.math.ivec2: 
+        edge_ids: ti.template(), 
+        distance_from_edge: int, 
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        bucket_start: ti.template(), 
+        bucket_edges: ti.template(), 
+        bucket_size: int, 
+        max_segment_length: float, 
+        use_spatial_hash: ti.template(), 
+        candidate_energy: ti.template(), 
+        candidate_edge: ti.template(), 
+        is_cached: ti.template(), 
+        cache_counters: ti.template(), 
+        use_cache: ti.template()) -> ti.math.ivec2: 
     
     '''
     Find an edge in the minimal cycle and an edge outside this cycle such 
@@ -369,6 +659,17 @@ def find_edges_with_minimum_energy_with_neighbours(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index: ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
@@ -387,9 +688,64 @@ def find_edges_with_minimum_energy_with_neighbours(
 
         shape of the scalar field grid
         
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
     distance_from_edge: int
 
         distance from the reference edge to compute the neighbours.
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label: ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
+    bucket_start: ti.template
+
+        1D field containing the position of the first edge of each bucket 
+        of the spatial hash. Only used if use_spatial_hash is True. 
+
+    bucket_edges: ti.template
+
+        1D field containing the 1D index of the edges, sorted by bucket. 
+        Only used if use_spatial_hash is True. 
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid. 
+
+    max_segment_length: float
+
+        upper bound of the distance between the point of an edge and 
+        the point of its next edge. 
+
+    use_spatial_hash: ti.template
+
+        if True and if we didn't find neighbours, the buckets of the spatial 
+        hash are browsed by rings around each edge, instead of computing the 
+        energy of all the edges. 
+
+    candidate_energy, candidate_edge, is_cached, cache_counters: ti.template
+
+        fields of the cache of the best candidate of each edge. 
+        Only used if use_cache is True. 
+
+    use_cache: ti.template
+
+        if True, the best candidate of an edge is read from the cache 
+        when it is still valid. 
         
     Returns
     ------
@@ -414,12 +770,37 @@ def find_edges_with_minimum_energy_with_neighbours(
     ti.loop_config(serialize=True)
     for _ in range(minimal_cycle.y): 
         
-        min_and_index = compute_neighbours_energies(points, 
-                                                    next_edge, 
-                                                    cycle_index, 
-                                                    shape, 
-                                                    current_edge_1d_index, 
-                                                    distance_from_edge)
+        min_and_index = ti.math.vec2(ti.math.inf, 0)
+        if ti.static(use_cache): 
+            min_and_index = get_edge_candidate(points, 
+                                               next_edge, 
+                                               segment_length, 
+                                               energy_function, 
+                                               cycle_index, 
+                                               cycle_parent, 
+                                               cycle_label, 
+                                               use_union_find, 
+                                               shape, 
+                                               edge_ids, 
+                                               current_edge_1d_index, 
+                                               distance_from_edge, 
+                                               candidate_energy, 
+                                               candidate_edge, 
+                                               is_cached, 
+                                               cache_counters)
+        else: 
+            min_and_index = compute_neighbours_energies(points, 
+                                                        next_edge, 
+                                                        segment_length, 
+                                                        energy_function, 
+                                                        cycle_index, 
+                                                        cycle_parent, 
+                                                        cycle_label, 
+                                                        use_union_find, 
+                                                        shape, 
+                                                        edge_ids, 
+                                                        current_edge_1d_index, 
+                                                        distance_from_edge)
 
         if (min_and_index.x < minimal_energy)\
               and (min_and_index.x != ti.math.inf): 
@@ -433,24 +814,22 @@ def find_edges_with_minimum_energy_with_neighbours(
     
     #if we didn't find neighbours, use the classic method 
     if minimal_energy == ti.math.inf: 
-        ti.loop_config(serialize=True)
-        for _ in range(minimal_cycle.y): 
-            
-            reset_energies(energies)
-            compute_all_energies(points, 
-                                 next_edge, 
-                                 cycle_index, 
-                                 energies, 
-                                 current_edge_1d_index)
-            min_and_index = find_minimum_in_field(energies)
-            
-            if min_and_index.x < minimal_energy: 
-                minimal_energy = min_and_index.x
-                minimal_energy_edges = ti.math.ivec2(current_edge_1d_index, 
-                                                     min_and_index.y)
-
-            end_point_index = next_edge[current_edge_1d_index]
-            current_edge_1d_index = end_point_index
+        minimal_energy_edges = find_edges_with_minimum_energy_without_neighbours(points, 
+                                                                                 next_edge, 
+                                                                                 segment_length, 
+                                                                                 energy_function, 
+                                                                                 cycle_index, 
+                                                                                 cycles, 
+                                                                                 minimal_cycle_index, 
+                                                                                 shape, 
+                                                                                 cycle_parent, 
+                                                                                 cycle_label, 
+                                                                                 use_union_find, 
+                                                                                 bucket_start, 
+                                                                                 bucket_edges, 
+                                                                                 bucket_size, 
+                                                                                 max_segment_length, 
+                                                                                 use_spatial_hash)
 
     return minimal_energy_edges
 
@@ -459,16 +838,35 @@ def compiled_stitching_algorithm_with_neighbours(
         points: ti.template(), 
         previous_edge: ti.template(),
         next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
         cycle_index: ti.template(), 
         cycles: ti.template(), 
-        energies: ti.template(), 
+        nb_cycles: int, 
         shape: ti.math.ivec2, 
-        distance_from_edge: int): 
+        edge_ids: ti.template(), 
+        distance_from_edge: int, 
+        heap: ti.template(), 
+        heap_position: ti.template(), 
+        use_heap: ti.template(), 
+        cycle_parent: ti.template(), 
+        cycle_size: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        bucket_start: ti.template(), 
+        bucket_edges: ti.template(), 
+        bucket_size: int, 
+        use_spatial_hash: ti.template(), 
+        candidate_energy: ti.template(), 
+        candidate_edge: ti.template(), 
+        is_cached: ti.template(), 
+        cache_counters: ti.template(), 
+        use_cache: ti.template()): 
 
     '''
     Stitch all the cycles of a graph. This is the compiled 
-    function called in an non-compiled one because we need to 
-    create the "energies" field. This version uses the optimisation.
+    function called in an non-compiled one, which creates the 
+    optional fields. This version uses the optimisation.
 
     Parameters 
     ------
@@ -488,6 +886,17 @@ def compiled_stitching_algorithm_with_neighbours(
         field containing the next edge of an edge in a cycle, 
         arranged according to 1D indexes of the grid edges. 
 
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
     cycle_index: ti.template
 
         Fields containing the index of the cycle to which each edge belongs, 
@@ -498,45 +907,166 @@ def compiled_stitching_algorithm_with_neighbours(
         1D vector fields containing the length and starting edge of each cycle. 
         The starting edge is arbitrarily defined. 
 
-    energies : ti.template
+    nb_cycles: int 
+
+        number of cycles, stored in the first elements of cycles. The other 
+        elements are not read, so that the fields can be larger than the graph. 
+        Only cycles.shape[0] is supported with use_heap. 
 
-        Fields containing the value of the patching energy with the reference edge, 
-        arranged according to the edges of the grid. 
-    
     shape: ti.math.ivec2
 
         shape of the scalar field grid (useful to compute neighbours)
 
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
     distance_from_edge: int
 
         distance from the reference edge to compute the neighbours.
 
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree. 
+        Only used if use_heap is True. 
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap. 
+        Only used if use_heap is True. 
+
+    use_heap: ti.template
+
+        if True, the minimal cycle is given by a heap updated after each 
+        stitching, instead of browsing all the cycles. 
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_size: ti.template
+
+        1D field containing the number of elements of each tree of the cycle forest. 
+        Only used if use_union_find is True. 
+
+    cycle_label: ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of each edge is given by the cycle forest, 
+        instead of changing cycle_index after each stitching. 
+
+    bucket_start: ti.template
+
+        1D field containing the position of the first edge of each bucket 
+        of the spatial hash. Only used if use_spatial_hash is True. 
+
+    bucket_edges: ti.template
+
+        1D field containing the 1D index of the edges, sorted by bucket. 
+        Only used if use_spatial_hash is True. 
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid. 
+
+    use_spatial_hash: ti.template
+
+        if True, the spatial hash is used when an edge of the minimal cycle 
+        has no neighbour in another cycle. 
+
+    candidate_energy, candidate_edge, is_cached, cache_counters: ti.template
+
+        fields of the cache of the best candidate of each edge. 
+        Only used if use_cache is True. 
+
+    use_cache: ti.template
+
+        if True, the best candidate of each edge is cached, and the cache is 
+        invalidated around the stitched edges after each stitching. 
+
     Returns
     ------
 
     None    
     '''
-    nb_cycles = cycles.shape[0]
-
+    #the points of an edge and of its next edge are in the same cell, 
+    #until the stitching creates longer segments 
+    max_segment_length = ti.math.sqrt(2.) / ti.math.max(shape.x, shape.y)
+
+    heap_size = 0 
+    if ti.static(use_heap): 
+        heap_size = build_cycle_heap(heap, 
+                                     heap_position, 
+                                     cycles)
     
     ti.loop_config(serialize= True)
     for _ in range(nb_cycles - 1): 
 
-        minimal_cycle_index = find_minimal_cycle(cycles, 
-                                                 nb_cycles)
+        minimal_cycle_index = 0 
+        if ti.static(use_heap): 
+            minimal_cycle_index = heap[0]
+        else: 
+            minimal_cycle_index = find_minimal_cycle(cycles, 
+                                                     nb_cycles)
         minimal_energy_edges = find_edges_with_minimum_energy_with_neighbours(points, 
                                                                                 next_edge, 
+                                                                                segment_length, 
+                                                                                energy_function, 
                                                                                 cycle_index, 
                                                                                 cycles, 
-                                                                                energies, 
                                                                                 minimal_cycle_index, 
                                                                                 shape, 
-                                                                                distance_from_edge)
-        stitch_two_cycles(previous_edge, 
-                          next_edge, 
-                          cycle_index, 
-                          cycles, 
-                          minimal_energy_edges)
+                                                                                edge_ids, 
+                                                                                distance_from_edge, 
+                                                                                cycle_parent, 
+                                                                                cycle_label, 
+                                                                                use_union_find, 
+                                                                                bucket_start, 
+                                                                                bucket_edges, 
+                                                                                bucket_size, 
+                                                                                max_segment_length, 
+                                                                                use_spatial_hash, 
+                                                                                candidate_energy, 
+                                                                                candidate_edge, 
+                                                                                is_cached, 
+                                                                                cache_counters, 
+                                                                                use_cache)
+        merged_cycles = stitch_two_cycles(previous_edge, 
+                                          next_edge, 
+                                          points, 
+                                          segment_length, 
+                                          cycle_index, 
+                                          cycles, 
+                                          minimal_energy_edges, 
+                                          cycle_parent, 
+                                          cycle_size, 
+                                          cycle_label, 
+                                          use_union_find)
+
+        if ti.static(use_cache): 
+            invalidate_candidates(is_cached, 
+                                  shape, 
+                                  edge_ids, 
+                                  minimal_energy_edges, 
+                                  distance_from_edge)
+        
+        if ti.static(use_heap): 
+            heap_size = update_cycle_heap(heap, 
+                                          heap_position, 
+                                          cycles, 
+                                          heap_size, 
+                                          merged_cycles)
+
+        max_segment_length = ti.math.max(max_segment_length, 
+                                         segment_length[minimal_energy_edges.x], 
+                                         segment_length[minimal_energy_edges.y])
         
 def stitch_all_cycles_with_neighbourhood(
         points: ti.template(), 
@@ -545,10 +1075,17 @@ def stitch_all_cycles_with_neighbourhood(
         cycle_index: ti.template(), 
         cycles: ti.template(), 
         shape: ti.math.ivec2, 
-        distance_from_edge: int): 
+        distance_from_edge: int, 
+        use_heap: bool = False, 
+        use_union_find: bool = False, 
+        use_spatial_hash: bool = False, 
+        parallel: bool = False, 
+        use_cache: bool = False, 
+        energy_function = patching_energy_with_lengths, 
+        edge_ids = None) -> tuple[int, int]: 
     '''
     Version of the algorithm to be called from the Python scope.
-    It uses the optimisation. We need to create the "energies" field, so this 
+    It uses the optimisation. We need to create the optional fields, so this 
     function is a wrapper for the compiled function.
 
     Parameters 
@@ -586,19 +1123,920 @@ def stitch_all_cycles_with_neighbourhood(
     distance_from_edge: int
 
         distance from the reference edge to compute the neighbours.
+
+    use_heap: bool
+
+        if True, the minimal cycle is kept in a binary heap updated after 
+        each stitching, instead of browsing all the cycles at each iteration. 
+        The stitching order is the same. 
+
+    use_union_find: bool 
+
+        if True, the cycle of each edge is tracked with a disjoint-set forest, 
+        so that a stitching does not browse the new cycle to change cycle_index. 
+        cycle_index is updated once at the end. 
+
+    use_spatial_hash: bool 
+
+        if True, the edges are stored in a spatial hash, whose buckets are 
+        browsed by rings when an edge of the minimal cycle has no neighbour, 
+        instead of computing the energy of all the edges of the graph. 
+        The width of a bucket is distance_from_edge cells. 
+
+    parallel: bool 
+
+        if True, each iteration is launched from the Python scope and the energies 
+        of all the edges of the minimal cycle with their neighbours are computed 
+        in parallel. The minimal cycle is given by a heap. The result is the same. 
+
+    use_cache: bool 
+
+        if True, the best candidate of each edge is cached until a stitching 
+        changes its neighbourhood. The numbers of hits and misses are 
+        returned. The result is the same. Not used if parallel is True. 
+
+    energy_function: ti.func
+
+        patching energy of two edges, computed from their points and the 
+        lengths of their segments. patching_energy_with_lengths by default. 
+        The spatial hash assumes that it is not lower than the default one. 
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, given by to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
         
     Returns
     ------
 
-    None    
+    tuple[int, int]
+
+        numbers of hits and misses of the candidate cache, 
+        None if the cache is not used. 
+    '''
+    segment_length = ti.field(dtype = float, 
+                              shape = points.shape)
+    compute_segment_lengths(points, 
+                            next_edge, 
+                            segment_length)
+
+    heap = None 
+    heap_position = None 
+    if use_heap and not parallel: 
+        heap = ti.field(dtype = int, 
+                        shape = cycles.shape)
+        heap_position = ti.field(dtype = int, 
+                                 shape = cycles.shape)
+        
+    cycle_parent = None 
+    cycle_size = None 
+    cycle_label = None 
+    if use_union_find: 
+        cycle_parent = ti.field(dtype = int, 
+                                shape = cycles.shape)
+        cycle_size = ti.field(dtype = int, 
+                              shape = cycles.shape)
+        cycle_label = ti.field(dtype = int, 
+                               shape = cycles.shape)
+        init_union_find(cycle_parent, 
+                        cycle_size, 
+                        cycle_label)
+
+    bucket_size = max(distance_from_edge, 1)
+    bucket_start = None 
+    bucket_edges = None 
+    if use_spatial_hash: 
+        bucket_start, bucket_edges = build_spatial_hash(points, 
+                                                        cycle_index, 
+                                                        shape, 
+                                                        bucket_size)
+
+    candidate_energy = None 
+    candidate_edge = None 
+    is_cached = None 
+    cache_counters = None 
+    if use_cache and not parallel: 
+        candidate_energy = ti.field(dtype = float, 
+                                    shape = points.shape)
+        candidate_edge = ti.field(dtype = int, 
+                                  shape = points.shape)
+        is_cached = ti.field(dtype = int, 
+                             shape = points.shape)
+        cache_counters = ti.field(dtype = int, 
+                                  shape = 2)
+
+    if parallel: 
+        parallel_stitching_algorithm_with_neighbours(points, 
+                                                     previous_edge, 
+                                                     next_edge, 
+                                                     segment_length, 
+                                                     energy_function, 
+                                                     cycle_index, 
+                                                     cycles, 
+                                                     shape, 
+                                                     edge_ids, 
+                                                     distance_from_edge, 
+                                                     cycle_parent, 
+                                                     cycle_size, 
+                                                     cycle_label, 
+                                                     use_union_find, 
+                                                     bucket_start, 
+                                                     bucket_edges, 
+                                                     bucket_size, 
+                                                     use_spatial_hash)
+    else: 
+        compiled_stitching_algorithm_with_neighbours(points, 
+                                                     previous_edge, 
+                                                     next_edge, 
+                                                     segment_length, 
+                                                     energy_function, 
+                                                     cycle_index, 
+                                                     cycles, 
+                                                     cycles.shape[0], 
+                                                     shape, 
+                                                     edge_ids, 
+                                                     distance_from_edge, 
+                                                     heap, 
+                                                     heap_position, 
+                                                     use_heap, 
+                                                     cycle_parent, 
+                                                     cycle_size, 
+                                                     cycle_label, 
+                                                     use_union_find, 
+                                                     bucket_start, 
+                                                     bucket_edges, 
+                                                     bucket_size, 
+                                                     use_spatial_hash, 
+                                                     candidate_energy, 
+                                                     candidate_edge, 
+                                                     is_cached, 
+                                                     cache_counters, 
+                                                     use_cache and not parallel)
+    
+    cache_hits_and_misses = None 
+    if use_cache and not parallel: 
+        cache_hits_and_misses = (cache_counters[0], 
+                                 cache_counters[1])
+
+    if use_union_find: 
+        flatten_cycle_index(cycle_index, 
+                            cycle_parent, 
+                            cycle_label)
+
+    return cache_hits_and_misses
+
+'''
+PARALLEL VERSION 
+'''
+
+@ti.kernel
+def init_parallel_stitching(
+        cycles: ti.template(), 
+        heap: ti.template(), 
+        heap_position: ti.template(), 
+        heap_size: ti.template(), 
+        max_segment_length: ti.template(), 
+        shape: ti.math.ivec2): 
     '''
-    energies = ti.field(dtype= float, 
-                        shape = points.shape)
-    compiled_stitching_algorithm_with_neighbours(points, 
-                                                 previous_edge, 
-                                                 next_edge, 
-                                                 cycle_index, 
-                                                 cycles, 
-                                                 energies, 
-                                                 shape, 
-                                                 distance_from_edge)
\ No newline at end of file
+    Initialise the state of the parallel version of the stitching algorithm, 
+    which is kept in fields between the kernels of each iteration. 
+
+    Parameters 
+    ------
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+        The starting edge is arbitrarily defined. 
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree. 
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap. 
+
+    heap_size: ti.template
+
+        0D field containing the number of cycles in the heap. 
+
+    max_segment_length: ti.template
+
+        0D field containing an upper bound of the distance between the point 
+        of an edge and the point of its next edge. 
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    Returns
+    ------
+
+    None    
+    '''
+    heap_size[None] = build_cycle_heap(heap, 
+                                       heap_position, 
+                                       cycles)
+    max_segment_length[None] = ti.math.sqrt(2.) / ti.math.max(shape.x, shape.y)
+
+@ti.kernel
+def flatten_minimal_cycle(
+        next_edge: ti.template(), 
+        cycles: ti.template(), 
+        heap: ti.template(), 
+        cycle_edges: ti.template(), 
+        cycle_length: ti.template()): 
+    '''
+    Store the edges of the minimal cycle contiguously, in the order of the cycle, 
+    so that they can be browsed in parallel. 
+
+    Parameters 
+    ------
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+        The starting edge is arbitrarily defined. 
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree. 
+
+    cycle_edges: ti.template
+
+        1D field containing the 1D index of the edges of the minimal cycle. 
+
+    cycle_length: ti.template
+
+        0D field containing the length of the minimal cycle. 
+
+    Returns
+    ------
+
+    None    
+    '''
+    minimal_cycle = cycles[heap[0]]
+    current_edge_1d_index = minimal_cycle.x
+
+    ti.loop_config(serialize=True)
+    for position in range(minimal_cycle.y): 
+        cycle_edges[position] = current_edge_1d_index
+        current_edge_1d_index = next_edge[current_edge_1d_index]
+
+    cycle_length[None] = minimal_cycle.y
+
+@ti.kernel
+def compute_candidates_energies(
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
+        cycle_index: ti.template(), 
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        cycle_edges: ti.template(), 
+        cycle_length: ti.template(), 
+        edge_keys: ti.template(), 
+        shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
+        distance_from_edge: int): 
+    '''
+    Compute in parallel the patching energies between all the edges of the minimal 
+    cycle and all their neighbours, and keep for each edge the key of the minimal 
+    energy. The key is ordered by energy, then by neighbour, like the loops of 
+    compute_neighbours_energies. 
+
+    Parameters 
+    ------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to the edges of the grid. 
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs, 
+        arranged according to 1D indexes of the grid edges.  
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the cycle forest. 
+        Only used if use_union_find is True. The paths compressed by the 
+        threads lead to the same roots, so the result does not depend on 
+        the order of the threads. 
+
+    cycle_label: ti.template
+
+        1D field containing, for each root of the cycle forest, the index 
+        of the cycle. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
+    cycle_edges: ti.template
+
+        1D field containing the 1D index of the edges of the minimal cycle. 
+
+    cycle_length: ti.template
+
+        0D field containing the length of the minimal cycle. 
+
+    edge_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge of the minimal cycle. 
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    Returns
+    ------
+
+    None    
+    '''
+    k = distance_from_edge*2 + 1
+    length = cycle_length[None]
+
+    for position in range(length): 
+        edge_keys[position] = ti.i64(NO_KEY)
+
+    for position, neighbour in ti.ndrange(length, k * k * 2): 
+
+        energy = compute_neighbour_energy(points, 
+                                          next_edge, 
+                                          segment_length, 
+                                          energy_function, 
+                                          cycle_index, 
+                                          cycle_parent, 
+                                          cycle_label, 
+                                          use_union_find, 
+                                          shape, 
+                                          edge_ids, 
+                                          cycle_edges[position], 
+                                          neighbour, 
+                                          distance_from_edge)
+        if energy != ti.math.inf: 
+            ti.atomic_min(edge_keys[position], 
+                          energy_to_key(energy, 
+                                        neighbour))
+
+@ti.kernel
+def compute_global_candidates_energies(
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
+        cycle_index: ti.template(), 
+        cycle_parent: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template(), 
+        cycle_edges: ti.template(), 
+        cycle_length: ti.template(), 
+        edge_keys: ti.template(), 
+        shape: ti.math.ivec2, 
+        bucket_start: ti.template(), 
+        bucket_edges: ti.template(), 
+        bucket_size: int, 
+        max_segment_length: ti.template(), 
+        use_spatial_hash: ti.template()): 
+    '''
+    Compute in parallel the patching energies between all the edges of the minimal 
+    cycle and all the edges of the other cycles, when no edge of the minimal cycle 
+    has a neighbour. The energies are reduced to the minimal key of each edge in 
+    the same loop, so they are never stored. The key is ordered by energy, then by 
+    1D index of the other edge, like compute_minimal_energy. 
+
+    Parameters 
+    ------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to the edges of the grid. 
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges from their points 
+        and the lengths of their segments, such as patching_energy_with_lengths. 
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs, 
+        arranged according to 1D indexes of the grid edges.  
+
+    cycle_parent, cycle_label: ti.template
+
+        fields of the cycle forest. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of an edge is found with the cycle forest. 
+
+    cycle_edges: ti.template
+
+        1D field containing the 1D index of the edges of the minimal cycle. 
+
+    cycle_length: ti.template
+
+        0D field containing the length of the minimal cycle. 
+
+    edge_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge of the minimal cycle. 
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid
+
+    bucket_start, bucket_edges: ti.template
+
+        fields of the spatial hash. Only used if use_spatial_hash is True. 
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid. 
+
+    max_segment_length: ti.template
+
+        0D field containing an upper bound of the distance between the point 
+        of an edge and the point of its next edge. 
+
+    use_spatial_hash: ti.template
+
+        if True, each edge of the minimal cycle browses the buckets of the 
+        spatial hash by rings, instead of computing the energy of all the edges. 
+
+    Returns
+    ------
+
+    None    
+    '''
+    length = cycle_length[None]
+
+    for position in range(length): 
+        edge_keys[position] = ti.i64(NO_KEY)
+
+    if ti.static(use_spatial_hash): 
+        for position in range(length): 
+            min_and_index = find_minimal_energy_in_rings(points, 
+                                                         next_edge, 
+                                                         segment_length, 
+                                                         energy_function, 
+                                                         cycle_index, 
+                                                         cycle_parent, 
+                                                         cycle_label, 
+                                                         use_union_find, 
+                                                         bucket_start, 
+                                                         bucket_edges, 
+                                                         shape, 
+                                                         bucket_size, 
+                                                         cycle_edges[position], 
+                                                         ti.math.inf, 
+                                                         max_segment_length[None])
+            if min_and_index.x != ti.math.inf: 
+                edge_keys[position] = energy_to_key(min_and_index.x, 
+                                                    int(min_and_index.y))
+    else: 
+        for position, index in ti.ndrange(length, cycle_index.shape[0]): 
+
+            current_edge_1d_index = cycle_edges[position]
+            index_cycle = get_cycle(cycle_index, 
+                                    cycle_parent, 
+                                    cycle_label, 
+                                    index, 
+                                    use_union_find)
+            
+            #if there is a point belonging to another cycle
+            if index_cycle != -1: 
+                if index_cycle != get_cycle(cycle_index, 
+                                            cycle_parent, 
+                                            cycle_label, 
+                                            current_edge_1d_index, 
+                                            use_union_find): 
+                    energy = energy_function(points[current_edge_1d_index], 
+                                             points[next_edge[current_edge_1d_index]], 
+                                             points[index], 
+                                             points[next_edge[index]], 
+                                             segment_length[current_edge_1d_index], 
+                                             segment_length[index])
+                    ti.atomic_min(edge_keys[position], 
+                                  energy_to_key(energy, 
+                                                index))
+
+@ti.kernel
+def reduce_candidates_energies(
+        cycle_length: ti.template(), 
+        edge_keys: ti.template(), 
+        minimal_key: ti.template()): 
+    '''
+    Find in parallel the edge of the minimal cycle with the minimal key. The 
+    order of the key is replaced by the position of the edge in the cycle, so 
+    that the ties are broken as in the compiled version. 
+
+    Parameters 
+    ------
+
+    cycle_length: ti.template
+
+        0D field containing the length of the minimal cycle. 
+
+    edge_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge of the minimal cycle. 
+
+    minimal_key: ti.template
+
+        0D i64 field containing the minimal key, NO_KEY if no edge has a candidate. 
+
+    Returns
+    ------
+
+    None    
+    '''
+    minimal_key[None] = ti.i64(NO_KEY)
+
+    for position in range(cycle_length[None]): 
+        key = edge_keys[position]
+        if key != ti.i64(NO_KEY): 
+            ti.atomic_min(minimal_key[None], 
+                          (key & ti.i64(ENERGY_MASK)) | ti.cast(position, ti.i64))
+
+@ti.kernel
+def stitch_minimal_cycle(
+        points: ti.template(), 
+        previous_edge: ti.template(),
+        next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template(), 
+        shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
+        distance_from_edge: int, 
+        cycle_edges: ti.template(), 
+        edge_keys: ti.template(), 
+        minimal_key: ti.template(), 
+        is_neighbour: int, 
+        heap: ti.template(), 
+        heap_position: ti.template(), 
+        heap_size: ti.template(), 
+        max_segment_length: ti.template(), 
+        cycle_parent: ti.template(), 
+        cycle_size: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: ti.template()): 
+    '''
+    Stitch the minimal cycle with the edge given by the minimal key. 
+
+    Parameters 
+    ------
+
+    points : ti.template
+
+        field containing the coordinates of all the points in the graph, 
+        arranged according to the edges of the grid.
+
+    previous_edge: ti.template
+
+        field containing the previous edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    segment_length: ti.template
+
+        field containing the distance between the point of each edge and 
+        the point of its next edge, arranged according to 1D indexes of the 
+        grid edges. 
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs, 
+        arranged according to 1D indexes of the grid edges.  
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+        The starting edge is arbitrarily defined. 
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid (useful to compute neighbours)
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    cycle_edges: ti.template
+
+        1D field containing the 1D index of the edges of the minimal cycle. 
+
+    edge_keys: ti.template
+
+        1D i64 field containing the minimal key of each edge of the minimal cycle. 
+
+    minimal_key: ti.template
+
+        0D i64 field containing the minimal key, given by reduce_candidates_energies. 
+
+    is_neighbour: int
+
+        1 if the order of the keys is a neighbour, 0 if it is the 1D index of an edge. 
+
+    heap: ti.template
+
+        1D field containing the index of the cycles, arranged as a binary tree. 
+
+    heap_position: ti.template
+
+        1D field containing the position of each cycle in the heap. 
+
+    heap_size: ti.template
+
+        0D field containing the number of cycles in the heap. 
+
+    max_segment_length: ti.template
+
+        0D field containing an upper bound of the distance between the point 
+        of an edge and the point of its next edge. 
+
+    cycle_parent, cycle_size, cycle_label: ti.template
+
+        fields of the cycle forest. Only used if use_union_find is True. 
+
+    use_union_find: ti.template
+
+        if True, the cycle of each edge is given by the cycle forest. 
+
+    Returns
+    ------
+
+    None    
+    '''
+    minimal_energy_edges = ti.math.ivec2(0, 0)
+    if minimal_key[None] != ti.i64(NO_KEY): 
+        position = ti.cast(minimal_key[None] & ti.i64(ORDER_MASK), int)
+        order = ti.cast(edge_keys[position] & ti.i64(ORDER_MASK), int)
+        current_edge_1d_index = cycle_edges[position]
+        minimal_energy_edges = ti.math.ivec2(current_edge_1d_index, 
+                                             order)
+        if is_neighbour: 
+            minimal_energy_edges.y = get_graph_neighbour_edge(shape, 
+                                                              edge_ids, 
+                                                              current_edge_1d_index, 
+                                                              order, 
+                                                              distance_from_edge)
+
+    merged_cycles = stitch_two_cycles(previous_edge, 
+                                      next_edge, 
+                                      points, 
+                                      segment_length, 
+                                      cycle_index, 
+                                      cycles, 
+                                      minimal_energy_edges, 
+                                      cycle_parent, 
+                                      cycle_size, 
+                                      cycle_label, 
+                                      use_union_find)
+    heap_size[None] = update_cycle_heap(heap, 
+                                        heap_position, 
+                                        cycles, 
+                                        heap_size[None], 
+                                        merged_cycles)
+    max_segment_length[None] = ti.math.max(max_segment_length[None], 
+                                           segment_length[minimal_energy_edges.x], 
+                                           segment_length[minimal_energy_edges.y])
+
+def parallel_stitching_algorithm_with_neighbours(
+        points: ti.template(), 
+        previous_edge: ti.template(), 
+        next_edge: ti.template(), 
+        segment_length: ti.template(), 
+        energy_function: ti.template(), 
+        cycle_index: ti.template(), 
+        cycles: ti.template(), 
+        shape: ti.math.ivec2, 
+        edge_ids: ti.template(), 
+        distance_from_edge: int, 
+        cycle_parent: ti.template(), 
+        cycle_size: ti.template(), 
+        cycle_label: ti.template(), 
+        use_union_find: bool, 
+        bucket_start: ti.template(), 
+        bucket_edges: ti.template(), 
+        bucket_size: int, 
+        use_spatial_hash: bool): 
+    '''
+    Stitch all the cycles of a graph. Each iteration is made of kernels launched 
+    from the Python scope, so that the energies of all the edges of the minimal 
+    cycle with all their neighbours are computed in parallel. If no edge has a 
+    neighbour, the energies with all the edges of the graph are computed in 
+    parallel. The minimal cycle is given by a heap. The stitched edges are the 
+    same as in the compiled version. 
+
+    Parameters 
+    ------
+
+    points, previous_edge, next_edge, cycle_index, cycles: ti.template
+
+        fields describing the graph. 
+
+    segment_length: ti.template
+
+        field containing the length of the segment of each edge, 
+        updated at each stitching. 
+
+    energy_function: ti.template
+
+        ti.func giving the patching energy of two edges, such as 
+        patching_energy_with_lengths. 
+
+    shape: ti.math.ivec2
+
+        shape of the scalar field grid (useful to compute neighbours)
+
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, see to_compact_graph. None if the graph is arranged 
+        according to 1D indexes of the grid edges. 
+
+    distance_from_edge: int
+
+        distance from the reference edge to compute the neighbours.
+
+    cycle_parent, cycle_size, cycle_label: ti.template
+
+        fields of the cycle forest. Only used if use_union_find is True. 
+
+    use_union_find: bool
+
+        if True, the cycle of each edge is given by the cycle forest. 
+
+    bucket_start, bucket_edges: ti.template
+
+        fields of the spatial hash. Only used if use_spatial_hash is True. 
+
+    bucket_size: int
+
+        width of a bucket, defined as a number of cells of the grid. 
+
+    use_spatial_hash: bool
+
+        if True, the spatial hash is used when no edge of the minimal cycle 
+        has a neighbour in another cycle. 
+
+    Returns
+    ------
+
+    None    
+    '''
+    heap = ti.field(dtype = int, 
+                    shape = cycles.shape)
+    heap_position = ti.field(dtype = int, 
+                             shape = cycles.shape)
+    heap_size = ti.field(dtype = int, 
+                         shape = ())
+    max_segment_length = ti.field(dtype = float, 
+                                  shape = ())
+    cycle_edges = ti.field(dtype = int, 
+                           shape = points.shape)
+    cycle_length = ti.field(dtype = int, 
+                            shape = ())
+    edge_keys = ti.field(dtype = ti.i64, 
+                         shape = points.shape)
+    minimal_key = ti.field(dtype = ti.i64, 
+                           shape = ())
+
+    init_parallel_stitching(cycles, 
+                            heap, 
+                            heap_position, 
+                            heap_size, 
+                            max_segment_length, 
+                            shape)
+
+    for _ in tqdm.tqdm(range(cycles.shape[0] - 1)): 
+
+        flatten_minimal_cycle(next_edge, 
+                              cycles, 
+                              heap, 
+                              cycle_edges, 
+                              cycle_length)
+        compute_candidates_energies(points, 
+                                    next_edge, 
+                                    segment_length, 
+                                    energy_function, 
+                                    cycle_index, 
+                                    cycle_parent, 
+                                    cycle_label, 
+                                    use_union_find, 
+                                    cycle_edges, 
+                                    cycle_length, 
+                                    edge_keys, 
+                                    shape, 
+                                    edge_ids, 
+                                    distance_from_edge)
+        reduce_candidates_energies(cycle_length, 
+                                   edge_keys, 
+                                   minimal_key)
+        
+        #if we didn't find neighbours, use the classic method 
+        is_neighbour = minimal_key[None] != NO_KEY
+        if not is_neighbour: 
+            compute_global_candidates_energies(points, 
+                                               next_edge, 
+                                               segment_length, 
+                                               energy_function, 
+                                               cycle_index, 
+                                               cycle_parent, 
+                                               cycle_label, 
+                                               use_union_find, 
+                                               cycle_edges, 
+                                               cycle_length, 
+                                               edge_keys, 
+                                               shape, 
+                                               bucket_start, 
+                                               bucket_edges, 
+                                               bucket_size, 
+                                               max_segment_length, 
+                                               use_spatial_hash)
+            reduce_candidates_energies(cycle_length, 
+                                       edge_keys, 
+                                       minimal_key)
+
+        stitch_minimal_cycle(points, 
+                             previous_edge, 
+                             next_edge, 
+                             segment_length, 
+                             cycle_index, 
+                             cycles, 
+                             shape, 
+                             edge_ids, 
+                             distance_from_edge, 
+                             cycle_edges, 
+                             edge_keys, 
+                             minimal_key, 
+                             int(is_neighbour), 
+                             heap, 
+                             heap_position, 
+                             heap_size, 
+                             max_segment_length, 
+                             cycle_parent, 
+                             cycle_size, 
+                             cycle_label, 
+                             use_union_find)
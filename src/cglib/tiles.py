@@ -0,0 +1,278 @@
+import taichi as ti
+import numpy as np
+
+from cglib.graph import compute_graph, label_cycles
+from cglib.type import numpy_to_memmap, get_field_tile
+from cglib.implicit import ImplicitField, evaluate_field_tile
+
+
+
+'''
+This module contains an extraction of the isocontours for fields which do not
+fit in memory. The .npy file is memory-mapped, and the cells of the field are
+split into tiles of bounded size:
+
+    - the values of a tile and of the next row and column of points are read
+      from the file, so that two neighbouring tiles share one row or column,
+    - compute_graph gives the graph of the tile, arranged according to the
+      edges of the tile, with the points computed in the whole field,
+    - the edges of the tile are converted to 1D indexes of the grid edges of
+      the whole field, and only the points, next edges and previous edges
+      which were found are kept.
+
+The contours crossing the seams of the tiles are joined by these global edge
+indexes: the point of an edge is computed by the cell owning it, see
+get_owned_edges, and its next and previous edges by the cells on both sides
+of the edge, which may belong to different tiles. The kept edges then form the
+same compact graph as to_compact_graph, whose cycles are computed at the end.
+
+The memory used during the extraction is given by the tile size, the fields
+only contain the edges with a point. The tiles of an ImplicitField are
+evaluated instead of being read, so its grid is never stored. The 1D indexes of the edges are stored
+in 32-bit integers as in the rest of the library, so the field must have less
+than 2^31 edges, i.e. about 32000 x 32000 values.
+
+'''
+
+
+
+def get_field_edges(
+        tile_edges: np.ndarray,
+        tile_shape: tuple[int, int],
+        tile_origin: tuple[int, int],
+        field_shape: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Convert 1D indexes of the grid edges of a tile to 1D indexes of the grid
+    edges of the whole field, see index2d_to_edge_index.
+
+    Parameters
+    -------
+
+    tile_edges: np.ndarray
+
+        1D indexes of edges of the tile.
+
+    tile_shape: tuple[int, int]
+
+        2D shape of the tile, including the row and the column shared with
+        the next tiles.
+
+    tile_origin: tuple[int, int]
+
+        2D index of the first point of the tile in the field.
+
+    field_shape: tuple[int, int]
+
+        2D shape of the field, with its border.
+
+
+    Returns
+    -------
+
+    tuple[np.ndarray, np.ndarray]
+
+        - the 1D indexes of the edges in the field, as int64,
+        - True for the edges owned by a cell of the tile, False for the
+          edges of the first row and column of the tile which are owned
+          by the previous tiles.
+    '''
+    tile_edges = tile_edges.astype(np.int64)
+    first_vertical_edge = tile_shape[1] * (tile_shape[0] + 1)
+    is_horizontal = tile_edges < first_vertical_edge
+    vertical_edges = tile_edges - first_vertical_edge
+
+    x = np.where(is_horizontal,
+                 tile_edges // tile_shape[1],
+                 vertical_edges // (tile_shape[1] + 1)) + tile_origin[0]
+    y = np.where(is_horizontal,
+                 tile_edges % tile_shape[1],
+                 vertical_edges % (tile_shape[1] + 1)) + tile_origin[1]
+
+    field_edges = np.where(is_horizontal,
+                           x * field_shape[1] + y,
+                           field_shape[1] * (field_shape[0] + 1) + x * (field_shape[1] + 1) + y)
+
+    #the top and left edges of a tile are owned by the previous tiles,
+    #except in the first row and column of the field
+    is_owned = np.where(is_horizontal,
+                        (x != tile_origin[0]) | (tile_origin[0] == 0),
+                        (y != tile_origin[1]) | (tile_origin[1] == 0))
+
+    return field_edges, is_owned
+
+def to_tiled_graph(
+        file_path: str,
+        tile_size: int = 1024,
+        use_pointer_jumping: bool = False,
+        isovalue: float = 0.) -> tuple[ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template(),
+                                       ti.template()]:
+    '''
+    Extract the isocontours of the scalar field of an .npy file, or of an
+    implicit field, tile by tile, and arrange them in the form of a compact graph. The graph is the one
+    given by to_compact_graph on the whole field.
+
+    Parameters
+    -------
+
+    file_path: str
+
+        path to the .npy file containing the scalar field, or an ImplicitField.
+
+    tile_size: int
+
+        number of rows and columns of cells of a tile.
+
+    use_pointer_jumping: bool
+
+        if True, the cycles are labelled in parallel by pointer jumping,
+        instead of flooding them one by one. The result is the same.
+
+    isovalue: float
+
+        value of the isocontours, 0 by default.
+
+
+    Returns
+    -------
+
+    tuple (ti.template)
+
+        fields describing the graph, see to_compact_graph
+            - points
+            - previous_edge
+            - next_edge
+            - cycle_index
+            - cycles
+            - edge_ids
+    '''
+    is_implicit = isinstance(file_path, ImplicitField)
+    if is_implicit:
+        field_shape = file_path.shape
+    else:
+        field_array = numpy_to_memmap(file_path)
+        field_shape = (field_array.shape[0] + 2,
+                       field_array.shape[1] + 2)
+
+    level_values = ti.field(dtype = float,
+                            shape = 1)
+    level_values[0] = isovalue
+
+    #all the tiles have the same shape, so that the fields of a tile are
+    #allocated and compute_graph is compiled once. The last tiles overflow
+    #the field and are filled with the value of the border, which gives no
+    #contour
+    tile_shape = (min(tile_size, field_shape[0] - 1) + 1,
+                  min(tile_size, field_shape[1] - 1) + 1)
+    tile_fields_shape = tile_shape[0]*(tile_shape[1]+1)\
+            + tile_shape[1]*(tile_shape[0]+1)\
+            - 1
+    tile_grid = ti.field(dtype = float,
+                         shape = tile_shape)
+    tile_points = ti.Vector.field(n = 2,
+                                  dtype = float,
+                                  shape = tile_fields_shape)
+    tile_previous_edge = ti.field(dtype = int,
+                                  shape = tile_fields_shape)
+    tile_next_edge = ti.field(dtype = int,
+                              shape = tile_fields_shape)
+
+    point_edges = []
+    point_coordinates = []
+    next_sources = []
+    next_targets = []
+    previous_sources = []
+    previous_targets = []
+
+    #the last row and column of points are not the top left corner of a cell
+    for x_origin in range(0, field_shape[0] - 1, tile_size):
+        for y_origin in range(0, field_shape[1] - 1, tile_size):
+
+            tile_origin = (x_origin, y_origin)
+            if is_implicit:
+                evaluate_field_tile(file_path,
+                                    ti.math.ivec2(x_origin, y_origin),
+                                    tile_grid)
+            else:
+                tile_grid.from_numpy(get_field_tile(field_array,
+                                                    tile_origin,
+                                                    tile_shape))
+            #the edge 0 of a tile may have a point
+            tile_previous_edge.fill(-1)
+            tile_next_edge.fill(-1)
+
+            compute_graph(tile_grid,
+                          level_values,
+                          tile_points,
+                          tile_previous_edge,
+                          tile_next_edge,
+                          None,
+                          ti.math.ivec2(x_origin, y_origin),
+                          field_shape)
+
+            tile_next_edges = tile_next_edge.to_numpy()
+            tile_previous_edges = tile_previous_edge.to_numpy()
+
+            #the adjacency found by the cells of the tile
+            has_next = np.nonzero(tile_next_edges != -1)[0]
+            has_previous = np.nonzero(tile_previous_edges != -1)[0]
+            next_sources.append(get_field_edges(has_next, tile_shape, tile_origin, field_shape)[0])
+            next_targets.append(get_field_edges(tile_next_edges[has_next], tile_shape, tile_origin, field_shape)[0])
+            previous_sources.append(get_field_edges(has_previous, tile_shape, tile_origin, field_shape)[0])
+            previous_targets.append(get_field_edges(tile_previous_edges[has_previous], tile_shape, tile_origin, field_shape)[0])
+
+            #the points of the edges owned by the cells of the tile
+            crossed_edges = np.union1d(has_next,
+                                       has_previous)
+            field_edges, is_owned = get_field_edges(crossed_edges,
+                                                    tile_shape,
+                                                    tile_origin,
+                                                    field_shape)
+            point_edges.append(field_edges[is_owned])
+            point_coordinates.append(tile_points.to_numpy()[crossed_edges[is_owned]])
+
+    #number the edges with a point in the order of their grid 1D index,
+    #the index 0 is kept free as in to_compact_graph
+    all_point_edges = np.concatenate(point_edges)
+    order = np.argsort(all_point_edges)
+    all_point_edges = all_point_edges[order]
+    edge_fields_shape = all_point_edges.shape[0] + 1
+
+    all_points = np.zeros((edge_fields_shape, 2),
+                          dtype = np.float32)
+    all_points[1:] = np.concatenate(point_coordinates)[order]
+
+    all_next_edges = np.zeros(edge_fields_shape,
+                              dtype = np.int32)
+    all_next_edges[np.searchsorted(all_point_edges, np.concatenate(next_sources)) + 1] =\
+        np.searchsorted(all_point_edges, np.concatenate(next_targets)) + 1
+
+    all_previous_edges = np.zeros(edge_fields_shape,
+                                  dtype = np.int32)
+    all_previous_edges[np.searchsorted(all_point_edges, np.concatenate(previous_sources)) + 1] =\
+        np.searchsorted(all_point_edges, np.concatenate(previous_targets)) + 1
+
+    all_edge_ids = np.concatenate(([-1], all_point_edges)).astype(np.int32)
+
+    points = ti.Vector.field(n = 2,
+                             dtype = float,
+                             shape = edge_fields_shape)
+    points.from_numpy(all_points)
+    previous_edge = ti.field(dtype = int,
+                             shape = edge_fields_shape)
+    previous_edge.from_numpy(all_previous_edges)
+    next_edge = ti.field(dtype = int,
+                         shape = edge_fields_shape)
+    next_edge.from_numpy(all_next_edges)
+    edge_ids = ti.field(dtype = int,
+                        shape = edge_fields_shape)
+    edge_ids.from_numpy(all_edge_ids)
+
+    # get the cycles of the graph
+    cycle_index, cycles = label_cycles(next_edge,
+                                       use_pointer_jumping)
+
+    return points, previous_edge, next_edge, cycle_index, cycles, edge_ids
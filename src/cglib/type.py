@@ -1,8 +1,9 @@
 import taichi as ti
 import numpy as np 
-import tqdm
+import struct
+import zipfile
 
-from svgpathtools import Line, Path, paths2svg
+from cglib.fields import copy_field_interior
 
 
 
@@ -10,7 +11,7 @@ def numpy_to_field(file_path: str) -> ti.template():
 
     '''
     Imports an .npy file containing a scalar field and stores its data in a Taichi field. 
-    the file must be located at data/fields. A border of -1 is added to the field.
+    the file must be located at data/fields. A border of 1 is added to the field.
 
     Parameters 
     -------
@@ -28,31 +29,124 @@ def numpy_to_field(file_path: str) -> ti.template():
         field containing the data of the file 
     '''
 
-    imported_arr = np.load(file_path)
-    arr = imported_arr.reshape(imported_arr.shape[1], 
-                               imported_arr.shape[0])
-    arr = arr.astype(np.float32) #convert the array to float32
-    arr = arr.T #transpose the array so that the x and y axis are correctly oriented.
-    
-    
-    # Add a border of -1 to the field, so that the edges of the grid 
+    # the file is memory-mapped and read once by the kernel, which 
+    # transposes the array and converts it to float32. A file stored in 
+    # Fortran order gives a view which is not C-contiguous, that Taichi 
+    # would copy then write back to the read-only file, so it is copied 
+    # in C order first 
+    imported_arr = np.load(file_path, 
+                           mmap_mode = 'r')
+    arr = np.ascontiguousarray(imported_arr.reshape(imported_arr.shape[1], 
+                                                    imported_arr.shape[0]))
+
+    # Add a border of 1 to the field, so that the edges of the grid 
     # are not considered as part of the field. 
-    n, m = arr.shape
-    ones_col = np.ones((n, 1))
-    arr = np.hstack((ones_col, arr))
-    arr = np.hstack((arr, ones_col))
+    f = ti.field(dtype = float, 
+                 shape = (arr.shape[1] + 2, arr.shape[0] + 2))
+    copy_field_interior(arr, 
+                        f)
+    return f 
 
-    n, m = arr.shape
-    ones_row =  np.ones((1, m))
-    arr = np.vstack((ones_row, arr))
-    arr = np.vstack((arr, ones_row))    
+def numpy_to_memmap(file_path: str) -> np.ndarray: 
 
+    '''
+    Memory-map an .npy file containing a scalar field, without reading it. 
+    The array is arranged as in numpy_to_field, without the border, and its 
+    blocks are read with get_field_tile. A file stored in Fortran order 
+    cannot be mapped in this arrangement, and is read in memory. 
 
-    # Create a Taichi field and import the data from the numpy array.
-    f = ti.field(dtype = float, 
-                 shape = arr.shape)
-    f.from_numpy(arr)
-    return f 
+    Parameters 
+    -------
+
+    file_path: str
+
+        path to the .npy file 
+
+        
+    Returns
+    -------
+
+    np.ndarray
+
+        read-only view of the file 
+    '''
+    imported_arr = np.load(file_path, 
+                           mmap_mode = 'r')
+    arr = np.ascontiguousarray(imported_arr.reshape(imported_arr.shape[1], 
+                                                    imported_arr.shape[0]))
+    return arr.T
+
+def numpy_to_stack(file_path: str) -> np.ndarray: 
+
+    '''
+    Memory-map an .npy file containing a stack of scalar fields, without 
+    reading it. The array has the shape (layers, W, H), and each layer is 
+    arranged as the array of an .npy file read by numpy_to_field. 
+
+    Parameters 
+    -------
+
+    file_path: str
+
+        path to the .npy file 
+
+        
+    Returns
+    -------
+
+    np.ndarray
+
+        read-only view of the file 
+    '''
+    return np.load(file_path, 
+                   mmap_mode = 'r')
+
+def get_field_tile(
+        field_array: np.ndarray, 
+        tile_origin: tuple[int, int], 
+        tile_shape: tuple[int, int]) -> np.ndarray: 
+
+    '''
+    Read a block of the field given by numpy_to_memmap, with the border 
+    of 1 added by numpy_to_field. Only the block is read from the file. 
+
+    Parameters 
+    -------
+
+    field_array: np.ndarray 
+
+        field given by numpy_to_memmap 
+
+    tile_origin: tuple[int, int] 
+
+        2D index of the first value of the block in the field with its border 
+
+    tile_shape: tuple[int, int] 
+
+        2D shape of the block 
+
+        
+    Returns
+    -------
+
+    np.ndarray
+
+        float32 array containing the values of the block 
+    '''
+    tile = np.ones(tile_shape, 
+                   dtype = np.float32)
+
+    # the first row and column of the field with its border are the border 
+    x_start = max(tile_origin[0], 1)
+    x_end = min(tile_origin[0] + tile_shape[0], field_array.shape[0] + 1)
+    y_start = max(tile_origin[1], 1)
+    y_end = min(tile_origin[1] + tile_shape[1], field_array.shape[1] + 1)
+
+    if x_start < x_end and y_start < y_end: 
+        tile[x_start - tile_origin[0]:x_end - tile_origin[0], 
+             y_start - tile_origin[1]:y_end - tile_origin[1]] = field_array[x_start - 1:x_end - 1, 
+                                                                            y_start - 1:y_end - 1]
+    return tile 
 
 def data_structure_to_numpy(
         points: ti.template(), 
@@ -60,7 +154,9 @@ def data_structure_to_numpy(
         next_edge: ti.template(), 
         cycle_index: ti.template(), 
         cycles: ti.template(), 
-        file_name: str): 
+        file_name: str, 
+        edge_ids: ti.template() = None, 
+        nb_cycles: int = None): 
     
     '''
     Exports graph data to an .npz file. The output file will be 
@@ -98,6 +194,16 @@ def data_structure_to_numpy(
 
         name of the output file 
 
+    edge_ids: ti.template
+
+        1D field containing the grid 1D index of each edge of a compact 
+        graph, given by to_compact_graph. Not saved if None. 
+
+    nb_cycles: int 
+
+        number of cycles saved, stored in the first elements of cycles. 
+        All the elements of cycles are saved if None. 
+
         
     Returns
     -------
@@ -110,15 +216,154 @@ def data_structure_to_numpy(
     next_edge_array = next_edge.to_numpy(dtype = int)
     previous_edge_array = previous_edge.to_numpy(dtype = int)
     cycle_index_array = cycle_index.to_numpy(dtype= int)
-    cycles_array = cycles.to_numpy(dtype = int)
+    cycles_array = cycles.to_numpy(dtype = int)[:nb_cycles]
     output_file_name = "data/np/" + file_name
 
+    #the map of a compact graph is saved with the graph 
+    compact_arrays = {}
+    if edge_ids is not None: 
+        compact_arrays["edge_ids"] = edge_ids.to_numpy(dtype = int)
+
     np.savez(file=output_file_name, 
              points = points_array, 
              next_edge = next_edge_array, 
              previous_edge = previous_edge_array, 
              cycle_index = cycle_index_array, 
-             cycles = cycles_array)
+             cycles = cycles_array, 
+             **compact_arrays)
+
+class ContourFile: 
+    '''
+    Graph data of an .npz file written by data_structure_to_numpy, read 
+    lazily. np.savez stores the arrays without compression, so each array 
+    is memory-mapped in place in the file instead of being read, and a 
+    field is only created for the arrays which are accessed, then kept. 
+
+    The shapes of the arrays are read from their headers when the file is 
+    opened, without reading their data: 
+
+        - shapes: dictionary containing the shape of each array, 
+        - nb_edges: size of the fields arranged according to the edges, 
+        - nb_cycles: number of elements of cycles. 
+
+    Parameters 
+    -------
+    
+    file_name: str
+
+        name of the .npz file where the data are stored. 
+
+    directory: str
+
+        directory of the file, data/np by default. 
+    '''
+
+    def __init__(
+            self, 
+            file_name: str, 
+            directory: str = "data/np"): 
+        self.file_path = directory + "/" + file_name + ".npz"
+        self.offsets = {}
+        self.headers = {}
+        self.arrays = {}
+        self.fields = {}
+
+        with zipfile.ZipFile(self.file_path) as zip_file, open(self.file_path, "rb") as npz_file: 
+            for info in zip_file.infolist(): 
+                name = info.filename[:-len(".npy")]
+
+                #the compressed arrays are read with np.load
+                if info.compress_type != zipfile.ZIP_STORED: 
+                    self.arrays[name] = np.load(self.file_path)[name]
+                    self.headers[name] = (self.arrays[name].shape, False, self.arrays[name].dtype)
+                    continue
+
+                #the data of an array follow its local file header and its .npy header 
+                npz_file.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", npz_file.read(4))
+                npz_file.seek(info.header_offset + 30 + name_length + extra_length)
+                if np.lib.format.read_magic(npz_file) == (1, 0): 
+                    self.headers[name] = np.lib.format.read_array_header_1_0(npz_file)
+                else: 
+                    self.headers[name] = np.lib.format.read_array_header_2_0(npz_file)
+                self.offsets[name] = npz_file.tell()
+
+        self.shapes = {name: header[0] for name, header in self.headers.items()}
+        self.nb_edges = self.shapes["next_edge"][0]
+        self.nb_cycles = self.shapes["cycles"][0]
+
+    def get_array(
+            self, 
+            name: str) -> np.ndarray: 
+        '''
+        Give an array of the file, memory-mapped on the first access. 
+
+        Parameters 
+        -------
+        
+        name: str
+
+            name of the array: points, previous_edge, next_edge, 
+            cycle_index, cycles or edge_ids. 
+
+            
+        Returns
+        -------
+
+        np.ndarray
+
+            read-only view of the array, None if the file does not contain it. 
+        '''
+        if name not in self.headers: 
+            return None
+
+        if name not in self.arrays: 
+            shape, fortran_order, dtype = self.headers[name]
+            self.arrays[name] = np.memmap(self.file_path, 
+                                          dtype = dtype, 
+                                          mode = "r", 
+                                          offset = self.offsets[name], 
+                                          shape = shape, 
+                                          order = "F" if fortran_order else "C")
+        return self.arrays[name]
+
+    def get_field(
+            self, 
+            name: str) -> ti.template(): 
+        '''
+        Give an array of the file as a field, created on the first access. 
+
+        Parameters 
+        -------
+        
+        name: str
+
+            name of the array: points, previous_edge, next_edge, 
+            cycle_index, cycles or edge_ids. 
+
+            
+        Returns
+        -------
+
+        ti.template
+
+            field containing the array, None if the file does not contain it. 
+        '''
+        if name not in self.headers: 
+            return None
+
+        if name not in self.fields: 
+            array = self.get_array(name)
+            if name == "points" or name == "cycles": 
+                field = ti.Vector.field(n = 2, 
+                                        dtype = float if name == "points" else int, 
+                                        shape = array.shape[0])
+            else: 
+                field = ti.field(dtype = int, 
+                                 shape = array.shape)
+            field.from_numpy(array)
+            self.fields[name] = field
+        return self.fields[name]
 
 def numpy_contour_to_data_structure(file_name: str) -> tuple[ti.template(), 
                                                              ti.template(), 
@@ -128,6 +373,7 @@ def numpy_contour_to_data_structure(file_name: str) -> tuple[ti.template(),
     
     '''
     Imports graph data from an .npz file and stores it in fields. 
+    All the fields are created, see ContourFile to create only some of them. 
 
     Parameters 
     -------
@@ -151,47 +397,144 @@ def numpy_contour_to_data_structure(file_name: str) -> tuple[ti.template(),
     
     '''
 
-    filepath = "data/np/" + file_name + ".npz"
-    npz_file = np.load(filepath)
-    
+    contour_file = ContourFile(file_name)
 
-    points = ti.Vector.field(n=2, 
-                             dtype=float, 
-                             shape=npz_file["previous_edge"].shape) 
-    previous_edge= ti.field(dtype = int, 
-                            shape = npz_file["previous_edge"].shape)
-    next_edge= ti.field(dtype = int, 
-                        shape = npz_file["previous_edge"].shape)
-    cycle_index = ti.field(dtype = int, 
-                           shape = npz_file["previous_edge"].shape) 
-    cycles = ti.Vector.field(n = 2, 
-                             dtype = int, 
-                             shape = npz_file["cycles"].shape[0])
-
-    points.from_numpy(npz_file["points"])
-    previous_edge.from_numpy(npz_file["previous_edge"])
-    next_edge.from_numpy(npz_file["next_edge"])
-    cycle_index.from_numpy(npz_file["cycle_index"])
-    cycles.from_numpy(npz_file["cycles"])
+    points = contour_file.get_field("points")
+    previous_edge = contour_file.get_field("previous_edge")
+    next_edge = contour_file.get_field("next_edge")
+    cycle_index = contour_file.get_field("cycle_index")
+    cycles = contour_file.get_field("cycles")
 
     return points, previous_edge, next_edge, cycle_index, cycles
 
-def data_structure_to_svg(
+def numpy_contour_to_edge_ids(file_name: str) -> ti.template(): 
+    '''
+    Imports the map between the edges of a compact graph and the grid 
+    edges from an .npz file, see to_compact_graph. 
+
+    Parameters 
+    -------
+    
+    file_name
+
+        name of the .npz file where the data are stored. 
+
+        
+    Returns
+    -------
+
+    ti.template 
+    
+        1D field containing the grid 1D index of each edge of the graph, 
+        None if the graph is arranged according to 1D indexes of the grid edges. 
+    '''
+
+    return ContourFile(file_name).get_field("edge_ids")
+
+def order_cycle_edges(
+        next_edge: np.ndarray, 
+        cycles: np.ndarray) -> tuple[np.ndarray, np.ndarray]: 
+    '''
+    Give the edges of each cycle in the order of the cycle, without browsing 
+    the cycles one edge after the other: each cycle is cut before its starting 
+    edge, and the distance of each edge to the end of its cycle is computed 
+    by pointer jumping, in log2 of the length of the longest cycle steps. 
+
+    Parameters 
+    -------
+
+    next_edge: np.ndarray
+
+        array containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    cycles: np.ndarray
+
+        2D array containing the starting edge and the length of each cycle. 
+
+        
+    Returns
+    -------
+
+    np.ndarray
+
+        1D array containing the edges of the cycles, cycle after cycle. 
+
+    np.ndarray
+
+        1D array containing the offset of each cycle in the edges, and the 
+        number of edges at the end. 
+    '''
+
+    #the edges with a point, the other edges have no next edge 
+    edges = np.flatnonzero(next_edge)
+    next_position = np.searchsorted(edges, 
+                                    next_edge[edges])
+    previous_position = np.empty_like(next_position)
+    previous_position[next_position] = np.arange(edges.shape[0])
+
+    #cut each cycle before its starting edge 
+    cycles = cycles[cycles[:, 1] != 0]
+    first_position = np.searchsorted(edges, 
+                                     cycles[:, 0])
+    last_position = previous_position[first_position]
+    next_position[last_position] = last_position
+
+    distance = np.ones(edges.shape[0], 
+                       dtype = np.int64)
+    distance[last_position] = 0
+    for _ in range(int(np.max(cycles[:, 1], initial = 1)).bit_length()): 
+        distance += distance[next_position]
+        next_position = next_position[next_position]
+
+    #next_position is now the last edge of the cycle of each edge 
+    cycle_number = np.full(edges.shape[0], 
+                           -1)
+    cycle_number[last_position] = np.arange(cycles.shape[0])
+    cycle_number = cycle_number[next_position]
+
+    cycle_lengths = distance[first_position] + 1
+    cycle_offsets = np.zeros(cycles.shape[0] + 1, 
+                             dtype = np.int64)
+    np.cumsum(cycle_lengths, 
+              out = cycle_offsets[1:])
+
+    is_in_cycle = cycle_number != -1
+    ordered_edges = np.empty(cycle_offsets[-1], 
+                             dtype = edges.dtype)
+    ordered_edges[cycle_offsets[cycle_number[is_in_cycle] + 1]
+                  - 1
+                  - distance[is_in_cycle]] = edges[is_in_cycle]
+
+    return ordered_edges, cycle_offsets
+
+def data_structure_to_paths(
         points: ti.template(), 
         next_edge: ti.template(), 
         cycles: ti.template(), 
-        output_name: str): 
+        file_name: str, 
+        nb_cycles: int = None): 
     '''
-    Exports graph data to a SVG file. 
+    Exports the points of the graph in the order of the cycles to an .npz 
+    file, without the edges of the grid. The output file will be 
+    data/np/file_name.npz, containing: 
+
+        - xy: 2D float32 array of shape (N, 2), the points of the cycles, 
+          cycle after cycle, each cycle starting at its starting edge, 
+        - offsets: 1D int64 array, the points of the cycle i are 
+          xy[offsets[i]:offsets[i + 1]]. 
+
+    The edges are ordered with order_cycle_edges, and the cycles of length 0, 
+    such as the cycles merged by the stitching, are not saved. 
 
     Parameters 
     -------
-
+    
     points: ti.template
 
         field containing the coordinates of all the points in the graph, 
         arranged according to 1D indexes of the grid edges. 
-    
+
     next_edge: ti.template
 
         field containing the next edge of an edge in a cycle, 
@@ -200,12 +543,16 @@ def data_structure_to_svg(
     cycles: ti.template
 
         1D vector fields containing the length and starting edge of each cycle. 
-        The starting edge is arbitrarily defined. 
 
-    output_name
+    file_name
 
         name of the output file 
 
+    nb_cycles: int 
+
+        number of cycles saved, stored in the first elements of cycles. 
+        All the elements of cycles are saved if None. 
+
         
     Returns
     -------
@@ -213,58 +560,134 @@ def data_structure_to_svg(
     None
     '''
 
-    def vector_to_complex(vec: ti.math.vec2) -> complex: 
-        '''
-        Converts a 2D vector to a complex number.
-        we use a minus sign for the imaginary part, 
-        so that the y axis is oriented downwards.
-        
-        Parameters
-        -------
+    ordered_edges, cycle_offsets = order_cycle_edges(next_edge.to_numpy(), 
+                                                     cycles.to_numpy()[:nb_cycles])
 
-        vec: ti.math.vec2
+    np.savez(file = "data/np/" + file_name, 
+             xy = points.to_numpy()[ordered_edges].astype(np.float32), 
+             offsets = cycle_offsets.astype(np.int64))
 
-            2D vector to convert to a complex number.
+def numpy_to_paths(file_name: str) -> tuple[np.ndarray, np.ndarray]: 
+    '''
+    Imports the points of the cycles from an .npz file written by 
+    data_structure_to_paths, without creating fields. 
 
-        Returns
-        -------
+    Parameters 
+    -------
+    
+    file_name
+
+        name of the .npz file where the data are stored. 
 
-        complex
-            
-                complex number corresponding to the input vector.
-        '''
-        return vec.x - 1j * vec.y
         
+    Returns
+    -------
 
-    paths = []
+    tuple (np.ndarray)
+    
+        - xy: the points of the cycles, cycle after cycle 
+        - offsets: the points of the cycle i are xy[offsets[i]:offsets[i + 1]]
+    '''
 
-    for cycle_number in tqdm.tqdm(range(cycles.shape[0])): 
+    filepath = "data/np/" + file_name + ".npz"
+    npz_file = np.load(filepath)
 
-        cycle = cycles[cycle_number]
-        
-        path_i = Path()
-        start_edge_index = cycle.x
+    return npz_file["xy"], npz_file["offsets"]
 
-        if cycle.y != 0: 
+def data_structure_to_svg(
+        points: ti.template(), 
+        next_edge: ti.template(), 
+        cycles: ti.template(), 
+        output_name: str, 
+        precision: int = 6, 
+        chunk_size: int = 65536): 
+    '''
+    Exports graph data to a SVG file, with a path per cycle. 
+    The fields are read once, the edges of the cycles are ordered with 
+    order_cycle_edges, and the paths are written to the file by chunks 
+    of points. 
 
-            for _ in range(cycle.y): #cycle.t = lenght of the cycle
+    Parameters 
+    -------
 
-                end_edge_index = next_edge[start_edge_index]
-                
-                
-                start_point = points[start_edge_index]
-                end_point = points[end_edge_index]
+    points: ti.template
 
-                line = Line(vector_to_complex(start_point), 
-                            vector_to_complex(end_point))
-                path_i.append(line)
-                start_edge_index = end_edge_index
-            
-            paths.append(path_i)
+        field containing the coordinates of all the points in the graph, 
+        arranged according to 1D indexes of the grid edges. 
+    
+    next_edge: ti.template
+
+        field containing the next edge of an edge in a cycle, 
+        arranged according to 1D indexes of the grid edges. 
+
+    cycles: ti.template
+
+        1D vector fields containing the length and starting edge of each cycle. 
+        The starting edge is arbitrarily defined. 
+
+    output_name
 
-        cycle_number +=1 
+        name of the output file 
+
+    precision: int 
+
+        number of decimals of the coordinates, 6 by default. 
+
+    chunk_size: int 
+
+        maximal number of points formatted at once, 65536 by default. 
+
+        
+    Returns
+    -------
+
+    None
+    '''
 
-    paths2svg.wsvg(paths, 
-                   filename= "data/svg_files/"\
-                        + output_name\
-                        + ".svg")
\ No newline at end of file
+    ordered_edges, cycle_offsets = order_cycle_edges(next_edge.to_numpy(), 
+                                                     cycles.to_numpy())
+
+    #the y axis of the SVG file is oriented downwards 
+    coordinates = points.to_numpy()[ordered_edges]
+    coordinates[:, 1] *= -1
+
+    #the canvas of svgpathtools: a margin of 10% and a width or height of 600px 
+    if coordinates.shape[0] > 0: 
+        minimum = coordinates.min(axis = 0)
+        size = coordinates.max(axis = 0) - minimum
+    else: 
+        minimum = np.zeros(2)
+        size = np.zeros(2)
+    size[size == 0] = 1
+    stroke_width = size.max() * 1e-3
+    minimum = minimum - 0.1 * size - stroke_width / 2
+    size = 1.2 * size + stroke_width
+    width, height = 600, 600
+    if size[0] > size[1]: 
+        height = int(np.ceil(600 * size[1] / size[0]))
+    else: 
+        width = int(np.ceil(600 * size[0] / size[1]))
+
+    point_format = "%." + str(precision) + "f,%." + str(precision) + "f "
+
+    with open("data/svg_files/" + output_name + ".svg", "w") as svg_file: 
+        svg_file.write('<?xml version="1.0" ?>\n'
+                       '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+                       + f'width="{width}px" height="{height}px" '
+                       + f'viewBox="{minimum[0]} {minimum[1]} {size[0]} {size[1]}">\n'
+                       + f'<g fill="none" stroke="#000000" stroke-width="{stroke_width}">\n')
+
+        for cycle_number in range(cycle_offsets.shape[0] - 1): 
+
+            #the points after the first one are joined by lines 
+            svg_file.write('<path d="M')
+            for start in range(cycle_offsets[cycle_number], 
+                               cycle_offsets[cycle_number + 1], 
+                               chunk_size): 
+                end = min(start + chunk_size, 
+                          cycle_offsets[cycle_number + 1])
+                svg_file.write((point_format * (end - start)) 
+                               % tuple(coordinates[start:end].ravel()))
+            svg_file.write('Z"/>\n')
+
+        svg_file.write('</g>\n</svg>\n')
\ No newline at end of file
@@ -0,0 +1,275 @@
+import taichi as ti
+
+
+
+'''
+This module contains a disjoint-set forest of cycles stored in Taichi fields.
+It is used by the stitching algorithm to know the cycle of an edge without
+changing the cycle index of all the edges of a cycle after each stitching.
+The cycle_index field keeps the index of the cycle found by the extraction,
+which is an element of the forest.
+
+    - cycle_parent: 1D field containing the parent of each element of the forest.
+    - cycle_size: 1D field containing the number of elements of each tree.
+    - cycle_label: 1D field containing, for each root, the index of the cycle
+      in the cycles field.
+
+'''
+
+
+
+@ti.kernel
+def init_union_find(
+        cycle_parent: ti.template(),
+        cycle_size: ti.template(),
+        cycle_label: ti.template()):
+    '''
+    Initialise the forest: each cycle is alone in its tree.
+
+    Parameters
+    -------
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    cycle_size: ti.template
+
+        1D field containing the number of elements of each tree.
+
+    cycle_label: ti.template
+
+        1D field containing, for each root, the index of the cycle
+        in the cycles field.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for cycle_number in cycle_parent:
+        cycle_parent[cycle_number] = cycle_number
+        cycle_size[cycle_number] = 1
+        cycle_label[cycle_number] = cycle_number
+
+@ti.func
+def find_root(
+        cycle_parent: ti.template(),
+        element: int) -> int:
+    '''
+    Find the root of the tree of an element, and compress the path
+    from the element to the root.
+
+    Parameters
+    -------
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    element: int
+
+        element whose root we want.
+
+
+    Returns
+    -------
+
+    int
+
+        root of the tree
+    '''
+    root = element
+    while cycle_parent[root] != root:
+        root = cycle_parent[root]
+
+    #path compression
+    current_element = element
+    while current_element != root:
+        next_element = cycle_parent[current_element]
+        cycle_parent[current_element] = root
+        current_element = next_element
+
+    return root
+
+@ti.func
+def find_root_without_compression(
+        cycle_parent: ti.template(),
+        element: int) -> int:
+    '''
+    Find the root of the tree of an element without modifying the forest,
+    so that it can be called in parallel.
+
+    Parameters
+    -------
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    element: int
+
+        element whose root we want.
+
+
+    Returns
+    -------
+
+    int
+
+        root of the tree
+    '''
+    root = element
+    while cycle_parent[root] != root:
+        root = cycle_parent[root]
+
+    return root
+
+@ti.func
+def get_cycle(
+        cycle_index: ti.template(),
+        cycle_parent: ti.template(),
+        cycle_label: ti.template(),
+        edge: int,
+        use_union_find: ti.template()) -> int:
+    '''
+    Give the index of the cycle to which an edge belongs.
+
+    Parameters
+    -------
+
+    cycle_index: ti.template
+
+        Fields containing the index of the cycle to which each edge belongs,
+        arranged according to 1D indexes of the grid edges. With the forest,
+        it is the element of the forest of each edge.
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    cycle_label: ti.template
+
+        1D field containing, for each root, the index of the cycle
+        in the cycles field.
+
+    edge: int
+
+        1D index of the edge.
+
+    use_union_find: ti.template
+
+        if True, the cycle is found with the forest, otherwise
+        cycle_index is used directly.
+
+
+    Returns
+    -------
+
+    int
+
+        index of the cycle, -1 if there is no point on the edge.
+    '''
+    result = cycle_index[edge]
+
+    if ti.static(use_union_find):
+        if result != -1:
+            result = cycle_label[find_root(cycle_parent,
+                                           result)]
+
+    return result
+
+@ti.func
+def union_cycles(
+        cycle_parent: ti.template(),
+        cycle_size: ti.template(),
+        cycle_label: ti.template(),
+        element_1: int,
+        element_2: int,
+        kept_cycle_index: int):
+    '''
+    Merge the trees of two elements, the smallest tree is attached
+    to the root of the largest one.
+
+    Parameters
+    -------
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    cycle_size: ti.template
+
+        1D field containing the number of elements of each tree.
+
+    cycle_label: ti.template
+
+        1D field containing, for each root, the index of the cycle
+        in the cycles field.
+
+    element_1, element_2: int
+
+        elements of the two trees to merge.
+
+    kept_cycle_index: int
+
+        index in the cycles field of the merged cycle.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    root_1 = find_root(cycle_parent,
+                       element_1)
+    root_2 = find_root(cycle_parent,
+                       element_2)
+
+    largest_root = root_1
+    smallest_root = root_2
+    if cycle_size[root_1] < cycle_size[root_2]:
+        largest_root = root_2
+        smallest_root = root_1
+
+    cycle_parent[smallest_root] = largest_root
+    cycle_size[largest_root] += cycle_size[smallest_root]
+    cycle_label[largest_root] = kept_cycle_index
+
+@ti.kernel
+def flatten_cycle_index(
+        cycle_index: ti.template(),
+        cycle_parent: ti.template(),
+        cycle_label: ti.template()):
+    '''
+    Replace the element of the forest of each edge by the index of its cycle,
+    so that cycle_index can be used without the forest.
+
+    Parameters
+    -------
+
+    cycle_index: ti.template
+
+        Fields containing the element of the forest of each edge,
+        arranged according to 1D indexes of the grid edges.
+
+    cycle_parent: ti.template
+
+        1D field containing the parent of each element of the forest.
+
+    cycle_label: ti.template
+
+        1D field containing, for each root, the index of the cycle
+        in the cycles field.
+
+
+    Returns
+    -------
+
+    None
+    '''
+    for edge in cycle_index:
+        if cycle_index[edge] != -1:
+            cycle_index[edge] = cycle_label[find_root_without_compression(cycle_parent,
+                                                                          cycle_index[edge])]
@@ -0,0 +1,55 @@
+import taichi as ti 
+import numpy as np 
+import argparse
+import glob
+
+from cglib.type import numpy_to_field, numpy_to_memmap, get_field_tile
+
+
+
+ti.init(arch = ti.cpu)
+
+
+
+if __name__ == "__main__": 
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_paths", 
+                        help= "Files in .npy format containing the scalar fields to load, all the files of data/ by default.", 
+                        type = str, 
+                        nargs= '*')
+
+    args = parser.parse_args()
+    file_paths = args.input_file_paths
+    if len(file_paths) == 0: 
+        file_paths = sorted(glob.glob('data/*.npy'))
+
+    failed_file_paths = []
+    for file_path in file_paths: 
+
+        #arrange the file as numpy_to_field does, with np.load only 
+        imported_arr = np.load(file_path)
+        expected_values = np.ones((imported_arr.shape[0] + 2, imported_arr.shape[1] + 2), 
+                                  dtype = np.float32)
+        expected_values[1:-1, 1:-1] = imported_arr.reshape(imported_arr.shape[1], 
+                                                           imported_arr.shape[0]).T
+
+        #load the field, and read the memory-mapped field as a single tile 
+        field_values = numpy_to_field(file_path).to_numpy()
+        tile_values = get_field_tile(numpy_to_memmap(file_path), 
+                                     (0, 0), 
+                                     expected_values.shape)
+
+        is_field_valid = np.array_equal(field_values, 
+                                        expected_values)
+        is_tile_valid = np.array_equal(tile_values, 
+                                       expected_values)
+        order = "Fortran" if np.isfortran(imported_arr) else "C"
+        print(f"{file_path} ({order} order): numpy_to_field {'OK' if is_field_valid else 'FAILED'}, "\
+              f"get_field_tile {'OK' if is_tile_valid else 'FAILED'}")
+
+        if not (is_field_valid and is_tile_valid): 
+            failed_file_paths.append(file_path)
+
+    if len(failed_file_paths) > 0: 
+        raise SystemExit("The values of these fields differ from np.load: " + ", ".join(failed_file_paths))
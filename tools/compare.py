@@ -0,0 +1,91 @@
+import taichi as ti
+import time
+import argparse
+import glob
+
+from cglib.type import numpy_to_field
+from cglib.graph import to_graph
+from cglib.stitch import stitch_all_cycles_with_neighbourhood
+from cglib.mst import stitch_all_cycles_with_spanning_tree
+from cglib.check import check_if_one_cycle, compute_path_length
+
+
+
+ti.init(arch = ti.cpu)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_paths",
+                        help= "Files in .npy format containing the scalar fields to stitch, all the files of data/ by default.",
+                        type = str,
+                        nargs= '*')
+    parser.add_argument("--neighbours",
+                        help= "Distance of neighbours to consider when stitching the isocontours.",
+                        type = int,
+                        default = 5)
+
+    args = parser.parse_args()
+    file_paths = args.input_file_paths
+    if len(file_paths) == 0:
+        file_paths = sorted(glob.glob('data/*.npy'))
+    neighbours = args.neighbours
+
+    print(f"{'field':<30}{'cycles':>8}{'greedy length':>15}{'tree length':>15}{'difference':>12}{'greedy time':>13}{'tree time':>11}")
+
+    for file_path in file_paths:
+
+        grid = numpy_to_field(file_path)
+        shape = ti.math.ivec2(grid.shape[0],
+                              grid.shape[1])
+
+
+        #stitch the isocontours with the greedy algorithm
+        points, previous_edge, next_edge, cycle_index, cycles = to_graph(grid)
+        nb_cycles = cycles.shape[0]
+
+        start_greedy = time.perf_counter()
+        stitch_all_cycles_with_neighbourhood(points,
+                                             previous_edge,
+                                             next_edge,
+                                             cycle_index,
+                                             cycles,
+                                             shape,
+                                             neighbours,
+                                             use_heap = True,
+                                             use_union_find = True)
+        end_greedy = time.perf_counter()
+        greedy_length = compute_path_length(points,
+                                            next_edge)
+        greedy_success = check_if_one_cycle(next_edge,
+                                            cycles)
+
+
+        #stitch the isocontours with the minimum spanning tree
+        points, previous_edge, next_edge, cycle_index, cycles = to_graph(grid)
+
+        start_tree = time.perf_counter()
+        stitch_all_cycles_with_spanning_tree(points,
+                                             previous_edge,
+                                             next_edge,
+                                             cycle_index,
+                                             cycles,
+                                             shape,
+                                             neighbours,
+                                             use_heap = True,
+                                             use_union_find = True)
+        end_tree = time.perf_counter()
+        tree_length = compute_path_length(points,
+                                          next_edge)
+        tree_success = check_if_one_cycle(next_edge,
+                                          cycles)
+
+
+        if greedy_success != 1 or tree_success != 1:
+            print(f"WARNING: {file_path} has not been stitched into one cycle.")
+
+        difference = 100 * (tree_length - greedy_length) / greedy_length
+        print(f"{file_path:<30}{nb_cycles:>8}{greedy_length:>15.4f}{tree_length:>15.4f}{difference:>11.3f}%"\
+              f"{end_greedy - start_greedy:>12.2f}s{end_tree - start_tree:>10.2f}s")
@@ -2,12 +2,13 @@ import taichi as ti
 import time
 import argparse
 import logging
-import json
-import os 
 
-from cglib.type import numpy_to_field, data_structure_to_numpy
-from cglib.graph import to_graph
+from cglib.type import numpy_to_field, data_structure_to_numpy, data_structure_to_paths
+from cglib.graph import to_graph, to_compact_graph
+from cglib.tiles import to_tiled_graph
+from cglib.pyramid import build_pyramid, to_compact_graph_with_pyramid
 from cglib.check import check_closure
+from cglib.artifacts import hash_file, get_artifact_key, fetch_artifact, write_artifact, save_field_record
 
 
 
@@ -24,81 +25,151 @@ if __name__ == "__main__":
     parser.add_argument("output_filename",
                         help = "Name of the file in which the isocontours will be saved.",
                         type = str)
+    parser.add_argument("--compact", 
+                        help= "Only store the edges carrying a point, instead of all the edges of the grid.", 
+                        action= "store_true")
+    parser.add_argument("--pointer-jumping", 
+                        help= "Label the cycles in parallel by pointer jumping, instead of flooding them one by one.", 
+                        action= "store_true")
+    parser.add_argument("--isovalue", 
+                        help= "Value of the isocontours, 0 by default.", 
+                        type = float, 
+                        default = 0.)
+    parser.add_argument("--tile-size", 
+                        help= "Extract the isocontours from the memory-mapped file by tiles of this number of rows and columns of cells, and store a compact graph.", 
+                        type = int, 
+                        default = None)
+    parser.add_argument("--pyramid", 
+                        help= "Only visit the blocks of cells whose min/max interval contains the isovalue, found with a min/max pyramid, and store a compact graph.", 
+                        action= "store_true")
+    parser.add_argument("--paths", 
+                        help= "Also save the points of the isocontours in the order of the cycles.", 
+                        action= "store_true")
     
     args = parser.parse_args()
     file_path = args.input_file_path
     output_file_name = args.output_filename
+    compact = args.compact
+    use_pointer_jumping = args.pointer_jumping
+    isovalue = args.isovalue
+    tile_size = args.tile_size
+    use_pyramid = args.pyramid
+    save_paths = args.paths
 
 
-    #save the output file name in a json file
-    with open('data/do_not_delete/output_file_names.json', 'r') as f:
-        data = json.load(f)
-
-    data[file_path] = output_file_name
-
-    with open('data/do_not_delete/output_file_names.json', 'w') as f:
-        json.dump(data, f)
-
-
-    #remove the flag file if it exists
-    try: 
-        flag_file = 'data/do_not_delete/flag_' + output_file_name + '.txt'
-        os.remove(flag_file)
-    except FileNotFoundError:
-        pass
-    
-
-    #run the extraction of the isocontours
+    #run the extraction of the isocontours, unless they are in the cache 
     try: 
-        
-        log_file_name = "data/log/" + output_file_name + ".log"
-        logging.basicConfig(filename=log_file_name, 
-                            filemode='w', 
-                            format='%(message)s', 
-                            level=logging.INFO)
-        logging.info("Extract the isocontours of the scalar field at : " + file_path + ".\n")
-
-        #get the scalar field 
-        print("\nCompilation complete, start execution.\n")
-        start_data = time.perf_counter()
-        grid = numpy_to_field(file_path)
-        end_data = time.perf_counter()
-        print(f"Shape of the field : {grid.shape}")
-        print("\nField imported in : " + str(end_data-start_data) + " seconds.\n")
-        logging.info("Field imported in : " + str(end_data-start_data) + " seconds.")
-
-        #initialise the graph
-        start_data = time.perf_counter()
-        points, previous_edge, next_edge, cycle_index, cycles = to_graph(grid)
-        end_data = time.perf_counter()
-        print("Graph initialised in : " + str(end_data-start_data) + " seconds.\n")
-        logging.info("Graph initialised in : " + str(end_data-start_data) + " seconds.")
-
-        #check if the isocontours are closed
-        start_check = time.perf_counter()
-        test_if_one_cycle = check_closure(next_edge, cycles)
-        end_check = time.perf_counter()
-
-        if test_if_one_cycle == 1:
-            print("The isocontours are all closed, the extraction succeeded.\n")
-        else:
-            print("WARNING: The extraction failed, there are open cycles.\n")
-        print("Check if the cycles are closed took : " + str(end_check-start_check) + " seconds.\n")
-        logging.info(f"Check if the cycles are closed took : {end_check-start_check} seconds.")
-
-
-        #save the graph 
-        start_data = time.perf_counter()
-        data_structure_to_numpy(points, 
-                                previous_edge, 
-                                next_edge, 
-                                cycle_index, 
-                                cycles, 
-                                output_file_name + "_contour")
-        end_data = time.perf_counter()
-        print("Contours data saved in : " + str(end_data-start_data) + " seconds.\n")
-        logging.info("Contours data saved in : " + str(end_data-start_data) + " seconds.\n")
-        logging.info("---------------------------------------------\n")
+        #the pyramid gives the compact graph 
+        contour_parameters = {"isovalue": isovalue, 
+                              "compact": compact or use_pyramid, 
+                              "tile_size": tile_size}
+        contour_key = get_artifact_key(hash_file(file_path), 
+                                       "contour", 
+                                       contour_parameters)
+        paths_key = get_artifact_key(contour_key, 
+                                     "paths", 
+                                     {})
+
+        is_cached = fetch_artifact(contour_key, 
+                                   "data/np/" + output_file_name + "_contour.npz")
+        if save_paths: 
+            is_cached = is_cached and fetch_artifact(paths_key, 
+                                                     "data/np/" + output_file_name + "_contour_paths.npz")
+
+        if is_cached: 
+            print("\nThe isocontours of this field and these parameters were read from the cache.\n")
+        else: 
+            log_file_name = "data/log/" + output_file_name + ".log"
+            logging.basicConfig(filename=log_file_name, 
+                                filemode='w', 
+                                format='%(message)s', 
+                                level=logging.INFO)
+            logging.info("Extract the isocontours of the scalar field at : " + file_path + ".\n")
+
+            #get the scalar field, which is read by tiles in the tiled extraction 
+            print("\nCompilation complete, start execution.\n")
+            if tile_size is None: 
+                start_data = time.perf_counter()
+                grid = numpy_to_field(file_path)
+                end_data = time.perf_counter()
+                print(f"Shape of the field : {grid.shape}")
+                print("\nField imported in : " + str(end_data-start_data) + " seconds.\n")
+                logging.info("Field imported in : " + str(end_data-start_data) + " seconds.")
+
+            #initialise the graph
+            start_data = time.perf_counter()
+            edge_ids = None
+            if tile_size is not None: 
+                points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_tiled_graph(file_path, 
+                                                                                                tile_size, 
+                                                                                                use_pointer_jumping, 
+                                                                                                isovalue)
+            elif use_pyramid: 
+                start_pyramid = time.perf_counter()
+                pyramid = build_pyramid(grid)
+                ti.sync()
+                end_pyramid = time.perf_counter()
+                print("Pyramid built in : " + str(end_pyramid-start_pyramid) + " seconds.\n")
+                logging.info("Pyramid built in : " + str(end_pyramid-start_pyramid) + " seconds.")
+                points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_compact_graph_with_pyramid(grid, 
+                                                                                                               pyramid, 
+                                                                                                               use_pointer_jumping, 
+                                                                                                               isovalue)
+            elif compact: 
+                points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_compact_graph(grid, 
+                                                                                                  use_pointer_jumping, 
+                                                                                                  isovalue)
+            else: 
+                points, previous_edge, next_edge, cycle_index, cycles = to_graph(grid, 
+                                                                                 use_pointer_jumping, 
+                                                                                 isovalue)
+            end_data = time.perf_counter()
+            print("Graph initialised in : " + str(end_data-start_data) + " seconds.\n")
+            logging.info("Graph initialised in : " + str(end_data-start_data) + " seconds.")
+
+            #check if the isocontours are closed
+            start_check = time.perf_counter()
+            test_if_one_cycle = check_closure(next_edge, cycles)
+            end_check = time.perf_counter()
+
+            if test_if_one_cycle == 1:
+                print("The isocontours are all closed, the extraction succeeded.\n")
+            else:
+                print("WARNING: The extraction failed, there are open cycles.\n")
+            print("Check if the cycles are closed took : " + str(end_check-start_check) + " seconds.\n")
+            logging.info(f"Check if the cycles are closed took : {end_check-start_check} seconds.")
+
+
+            #save the graph, and store in the cache the file written by this run 
+            start_data = time.perf_counter()
+            write_artifact(contour_key, 
+                           "data/np", 
+                           output_file_name + "_contour", 
+                           lambda file_name: data_structure_to_numpy(points, 
+                                                                     previous_edge, 
+                                                                     next_edge, 
+                                                                     cycle_index, 
+                                                                     cycles, 
+                                                                     file_name, 
+                                                                     edge_ids))
+            if save_paths: 
+                write_artifact(paths_key, 
+                               "data/np", 
+                               output_file_name + "_contour_paths", 
+                               lambda file_name: data_structure_to_paths(points, 
+                                                                         next_edge, 
+                                                                         cycles, 
+                                                                         file_name))
+            end_data = time.perf_counter()
+            print("Contours data saved in : " + str(end_data-start_data) + " seconds.\n")
+            logging.info("Contours data saved in : " + str(end_data-start_data) + " seconds.\n")
+            logging.info("---------------------------------------------\n")
+
+        #the other tools only find the isocontours once they are saved 
+        save_field_record(file_path, 
+                          output_file_name, 
+                          contour_key, 
+                          contour_parameters)
 
     except FileNotFoundError: 
         print("The file containing the scalar field does not exist. Please put it in data/fields.")
\ No newline at end of file
@@ -0,0 +1,132 @@
+import time
+
+start_init = time.perf_counter()
+
+import taichi as ti
+import argparse
+import json
+
+from cglib.pipeline import run_pipeline, EXPORTS
+from cglib.stitch import stitch_all_cycles_with_neighbourhood
+from cglib.mst import stitch_all_cycles_with_spanning_tree
+from cglib.rounds import stitch_all_cycles_by_rounds
+from cglib.artifacts import save_field_record
+
+
+
+ti.init(arch = ti.cpu)
+
+end_init = time.perf_counter()
+
+
+
+if __name__ == "__main__": 
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_path", 
+                        help= "File in .npy format containing a scalar field whose isocontours we want to extract.", 
+                        type = str)
+    parser.add_argument("output_filename",
+                        help = "Name of the files in which the isocontours and the cycle will be saved.",
+                        type = str)
+    parser.add_argument("neighbours",
+                        help= "Distance of neighbours to consider when stitching the isocontours.",
+                        type = int, 
+                        default = 5, 
+                        nargs= '?')
+    parser.add_argument("--no-stitch", 
+                        help= "Only extract and export the isocontours.", 
+                        action= "store_true")
+    parser.add_argument("--export", 
+                        help= "Formats of the exported graphs among npz, paths and svg, npz by default.", 
+                        choices = EXPORTS, 
+                        nargs= '+', 
+                        default = ["npz"])
+    parser.add_argument("--precision", 
+                        help= "Number of decimals of the coordinates of the SVG files, 6 by default.", 
+                        type = int, 
+                        default = 6)
+    parser.add_argument("--compact", 
+                        help= "Only store the edges carrying a point, instead of all the edges of the grid.", 
+                        action= "store_true")
+    parser.add_argument("--pointer-jumping", 
+                        help= "Label the cycles in parallel by pointer jumping, instead of flooding them one by one.", 
+                        action= "store_true")
+    parser.add_argument("--isovalue", 
+                        help= "Value of the isocontours, 0 by default.", 
+                        type = float, 
+                        default = 0.)
+    parser.add_argument("--tile-size", 
+                        help= "Extract the isocontours from the memory-mapped file by tiles of this number of rows and columns of cells, and store a compact graph.", 
+                        type = int, 
+                        default = None)
+    parser.add_argument("--pyramid", 
+                        help= "Only visit the blocks of cells whose min/max interval contains the isovalue, found with a min/max pyramid, and store a compact graph.", 
+                        action= "store_true")
+    parser.add_argument("--heap", 
+                        help= "Keep the cycles in a heap to find the minimal cycle at each iteration.", 
+                        action= "store_true")
+    parser.add_argument("--union-find", 
+                        help= "Track the cycle of each edge with a disjoint-set forest.", 
+                        action= "store_true")
+    parser.add_argument("--spatial-hash", 
+                        help= "Search the nearest edges in a grid of buckets when an edge has no neighbour in another cycle.", 
+                        action= "store_true")
+    parser.add_argument("--parallel", 
+                        help= "Compute the energies of all the edges of the minimal cycle in parallel.", 
+                        action= "store_true")
+    parser.add_argument("--cache", 
+                        help= "Cache the best candidate of each edge until a stitching changes its neighbourhood.", 
+                        action= "store_true")
+    parser.add_argument("--spanning-tree", 
+                        help= "Choose the stitchings with a minimum spanning tree of the cycles, then stitch the remaining cycles greedily.", 
+                        action= "store_true")
+    parser.add_argument("--rounds", 
+                        help= "Stitch several pairs of cycles in each round, instead of following the exact greedy order.", 
+                        action= "store_true")
+
+    args = parser.parse_args()
+    file_path = args.input_file_path
+    output_file_name = args.output_filename
+
+    stitching_algorithm = stitch_all_cycles_with_neighbourhood
+    if args.spanning_tree: 
+        stitching_algorithm = stitch_all_cycles_with_spanning_tree
+    elif args.rounds: 
+        stitching_algorithm = stitch_all_cycles_by_rounds
+
+
+    #run the stages in this process 
+    try: 
+        print("\nCompilation complete, start execution.\n")
+        summary = run_pipeline(file_path, 
+                               output_file_name, 
+                               stitch = not args.no_stitch, 
+                               neighbours = args.neighbours, 
+                               isovalue = args.isovalue, 
+                               compact = args.compact, 
+                               use_pointer_jumping = args.pointer_jumping, 
+                               tile_size = args.tile_size, 
+                               use_pyramid = args.pyramid, 
+                               stitching_algorithm = stitching_algorithm, 
+                               exports = tuple(args.export), 
+                               precision = args.precision, 
+                               use_heap = args.heap, 
+                               use_union_find = args.union_find, 
+                               use_spatial_hash = args.spatial_hash, 
+                               parallel = args.parallel, 
+                               use_cache = args.cache)
+
+        #record the output file name, for the other tools, once the files are saved 
+        save_field_record(file_path, 
+                          output_file_name)
+
+        summary["timings"] = {"init": end_init - start_init, 
+                              **summary["timings"]}
+        summary = {"field": file_path, 
+                   **summary}
+        print(json.dumps(summary, 
+                         indent = 4))
+
+    except FileNotFoundError: 
+        print("The file containing the scalar field does not exist. Please put it in data/fields.")
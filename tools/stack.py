@@ -0,0 +1,61 @@
+import taichi as ti
+import argparse
+import logging
+
+from cglib.type import numpy_to_stack
+from cglib.stack import stack_to_graphs
+
+
+
+ti.init(arch = ti.cpu)
+
+
+
+if __name__ == "__main__": 
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file_path", 
+                        help= "File in .npy format containing a stack of scalar fields of shape (layers, W, H).", 
+                        type = str)
+    parser.add_argument("output_filename",
+                        help = "Prefix of the names of the files in which the graph of each layer will be saved.",
+                        type = str)
+    parser.add_argument("neighbours",
+                        help= "Distance of neighbours to consider when stitching the isocontours of each layer.",
+                        type = int, 
+                        default = None, 
+                        nargs= '?')
+    parser.add_argument("--isovalue", 
+                        help= "Value of the isocontours, 0 by default.", 
+                        type = float, 
+                        default = 0.)
+
+    args = parser.parse_args()
+    file_path = args.input_file_path
+    output_file_name = args.output_filename
+    neighbours = args.neighbours
+    isovalue = args.isovalue
+
+
+    try: 
+
+        log_file_name = "data/log/" + output_file_name + ".log"
+        logging.basicConfig(filename=log_file_name, 
+                            filemode='w', 
+                            format='%(message)s', 
+                            level=logging.INFO)
+        logging.info("Extract the isocontours of the stack of scalar fields at : " + file_path + ".\n")
+
+        #the stack is memory-mapped and read layer by layer 
+        stack = numpy_to_stack(file_path)
+        print(f"Shape of the stack : {stack.shape}")
+
+        layers_per_second = stack_to_graphs(stack, 
+                                            output_file_name, 
+                                            neighbours, 
+                                            isovalue)
+        print(f"{stack.shape[0]} layers processed at {layers_per_second} layers per second.\n")
+        logging.info(f"{stack.shape[0]} layers processed at {layers_per_second} layers per second.")
+
+    except FileNotFoundError: 
+        print("The file containing the stack of scalar fields does not exist.")
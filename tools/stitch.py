@@ -2,12 +2,15 @@ import taichi as ti
 import time
 import argparse
 import logging
-import json 
-import os 
 
-from cglib.type import numpy_to_field, data_structure_to_numpy, numpy_contour_to_data_structure
+from cglib.type import numpy_to_field, numpy_to_memmap, data_structure_to_numpy, data_structure_to_paths, ContourFile
+from cglib.graph import to_graph, to_compact_graph
+from cglib.tiles import to_tiled_graph
 from cglib.stitch import stitch_all_cycles_with_neighbourhood
+from cglib.mst import stitch_all_cycles_with_spanning_tree
+from cglib.rounds import stitch_all_cycles_by_rounds
 from cglib.check import check_if_one_cycle
+from cglib.artifacts import CACHE_DIRECTORY, get_artifact_key, fetch_artifact, use_artifact, write_artifact, load_field_record
 
 
 
@@ -26,79 +29,189 @@ if __name__ == "__main__":
                         type = int, 
                         default = 5, 
                         nargs= '?')
+    parser.add_argument("--heap", 
+                        help= "Keep the cycles in a heap to find the minimal cycle at each iteration.", 
+                        action= "store_true")
+    parser.add_argument("--union-find", 
+                        help= "Track the cycle of each edge with a disjoint-set forest.", 
+                        action= "store_true")
+    parser.add_argument("--spatial-hash", 
+                        help= "Search the nearest edges in a spatial hash when an edge has no neighbour.", 
+                        action= "store_true")
+    parser.add_argument("--parallel", 
+                        help= "Compute the energies of all the edges of the minimal cycle in parallel.", 
+                        action= "store_true")
+    parser.add_argument("--cache", 
+                        help= "Cache the best candidate of each edge until a stitching changes its neighbourhood.", 
+                        action= "store_true")
+    parser.add_argument("--spanning-tree", 
+                        help= "Choose the stitchings with a minimum spanning tree of the cycles, then stitch the remaining cycles greedily.", 
+                        action= "store_true")
+    parser.add_argument("--rounds", 
+                        help= "Stitch several pairs of cycles in each round, instead of following the exact greedy order.", 
+                        action= "store_true")
+    parser.add_argument("--paths", 
+                        help= "Also save the points of the cycle in order.", 
+                        action= "store_true")
 
     args = parser.parse_args()
     file_path = args.input_file_path
     neighbours = args.neighbours
-
-    #get the output file name
-    with open('data/do_not_delete/output_file_names.json', 'r') as f:
-        data = json.load(f)
-    output_file_name = data[file_path]
+    use_heap = args.heap
+    use_union_find = args.union_find
+    use_spatial_hash = args.spatial_hash
+    parallel = args.parallel
+    use_cache = args.cache
+    use_spanning_tree = args.spanning_tree
+    use_rounds = args.rounds
+    save_paths = args.paths
+
+    stitching_mode = "greedy"
+    if use_spanning_tree: 
+        stitching_mode = "spanning-tree"
+    elif use_rounds: 
+        stitching_mode = "rounds"
 
 
     try: 
 
-        # get the isocontours
-        print("\nCompilation complete, start execution.\n")
-        grid = numpy_to_field(file_path)
-        points, previous_edge, next_edge, cycle_index, cycles =\
-                  numpy_contour_to_data_structure(output_file_name + "_contour")
+        #get the output file name and the key of the isocontours
+        record = load_field_record(file_path)
+        output_file_name = record["output_name"]
+        cycle_key = None
+        paths_key = None
+        if record["contour_key"] is not None: 
+            cycle_key = get_artifact_key(record["contour_key"], 
+                                         "stitch", 
+                                         {"distance_from_edge": neighbours, 
+                                          "mode": stitching_mode})
+            paths_key = get_artifact_key(cycle_key, 
+                                         "paths", 
+                                         {})
+
+        is_cached = cycle_key is not None\
+                and fetch_artifact(cycle_key, 
+                                   "data/np/" + output_file_name + "_cycle.npz")
+        if save_paths: 
+            is_cached = is_cached and fetch_artifact(paths_key, 
+                                                     "data/np/" + output_file_name + "_cycle_paths.npz")
+
+        if is_cached: 
+            print("\nThe cycle of these isocontours and these parameters was read from the cache.\n")
+        else: 
+            # get the isocontours
+            print("\nCompilation complete, start execution.\n")
+            #only the shape of the field is needed 
+            field_shape = numpy_to_memmap(file_path).shape
+            contour_names = ("points", "previous_edge", "next_edge", "cycle_index", "cycles", "edge_ids")
+            if record["contour_key"] is None: 
+                contour_file = ContourFile(output_file_name + "_contour")
+                points, previous_edge, next_edge, cycle_index, cycles, edge_ids =\
+                          [contour_file.get_field(name) for name in contour_names]
+            else: 
+                #the isocontours of the key are read in the cache, the file of the 
+                #output name can be replaced by the isocontours of another field 
+                try: 
+                    use_artifact(record["contour_key"])
+                    contour_file = ContourFile(record["contour_key"], 
+                                               CACHE_DIRECTORY)
+                    points, previous_edge, next_edge, cycle_index, cycles, edge_ids =\
+                              [contour_file.get_field(name) for name in contour_names]
+                except FileNotFoundError: 
+                    #the isocontours were removed from the cache, extract them again 
+                    print("The isocontours are not in the cache anymore, extract them again.\n")
+                    contour_parameters = record.get("contour_parameters")
+                    if contour_parameters is None: 
+                        raise
+                    edge_ids = None
+                    if contour_parameters["tile_size"] is not None: 
+                        points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_tiled_graph(file_path, 
+                                                                                                        contour_parameters["tile_size"], 
+                                                                                                        isovalue = contour_parameters["isovalue"])
+                    elif contour_parameters["compact"]: 
+                        points, previous_edge, next_edge, cycle_index, cycles, edge_ids = to_compact_graph(numpy_to_field(file_path), 
+                                                                                                          isovalue = contour_parameters["isovalue"])
+                    else: 
+                        points, previous_edge, next_edge, cycle_index, cycles = to_graph(numpy_to_field(file_path), 
+                                                                                         isovalue = contour_parameters["isovalue"])
+                    write_artifact(record["contour_key"], 
+                                   "data/np", 
+                                   None, 
+                                   lambda file_name: data_structure_to_numpy(points, 
+                                                                             previous_edge, 
+                                                                             next_edge, 
+                                                                             cycle_index, 
+                                                                             cycles, 
+                                                                             file_name, 
+                                                                             edge_ids))
     
 
-        #stitch the isocontours
-        start_stitch = time.perf_counter()
-        stitch_all_cycles_with_neighbourhood(
-                                             points, 
-                                             previous_edge, 
-                                             next_edge,
-                                             cycle_index, 
-                                             cycles, 
-                                             ti.math.ivec2(grid.shape[0], 
-                                                           grid.shape[1]), 
-                                             neighbours)
-        end_stitch = time.perf_counter()
-        print("Stitching algorithm runtime : " + str(end_stitch-start_stitch) + " seconds.\n")
-
-
-        #check if the isocontours have been stitched into one cycle
-        start_check = time.perf_counter()
-        test_if_one_cycle = check_if_one_cycle(next_edge, cycles)
-        end_check = time.perf_counter()
-
-        if test_if_one_cycle == 1:
-            print("The isocontours have been stitched into one cycle, the stitching succeeded.\n")
-        else:
-            print("WARNING: The stitching failed, there is more than one cycle.\n")
-        print("Check if there is only one cycle took : " + str(end_check-start_check) + " seconds.\n")
-
-
-        #save the cycle
-        start_data = time.perf_counter()
-        data_structure_to_numpy(
-                                points, 
-                                previous_edge,
-                                next_edge, 
-                                cycle_index, 
-                                cycles, 
-                                output_file_name + "_cycle")       
-        end_data = time.perf_counter()
-        print("Cycle data saved in : " + str(end_data-start_data) + " seconds.\n")
-        
-
-
-
-        
-        # If the flag file does not exist, this is the first run of the script. 
-        # I will create a log file and a flag file, because I want to keep the logs
-        # of the stitching algorithm only for the first run. If you run the contouring 
-        # script again, the logs will be overwritten.
-        
-
-        flag_file = 'data/do_not_delete/flag_' + output_file_name + '.txt'
-
-        if not os.path.exists(flag_file):
-            # This is the first run, so write logs and create the flag file
+            #stitch the isocontours
+            start_stitch = time.perf_counter()
+            stitching_algorithm = stitch_all_cycles_with_neighbourhood
+            if use_spanning_tree: 
+                stitching_algorithm = stitch_all_cycles_with_spanning_tree
+            elif use_rounds: 
+                stitching_algorithm = stitch_all_cycles_by_rounds
+            cache_hits_and_misses = stitching_algorithm(
+                                                 points, 
+                                                 previous_edge, 
+                                                 next_edge,
+                                                 cycle_index, 
+                                                 cycles, 
+                                                 ti.math.ivec2(field_shape[0] + 2, 
+                                                               field_shape[1] + 2), 
+                                                 neighbours, 
+                                                 use_heap = use_heap, 
+                                                 use_union_find = use_union_find, 
+                                                 use_spatial_hash = use_spatial_hash, 
+                                                 parallel = parallel, 
+                                                 use_cache = use_cache, 
+                                                 edge_ids = edge_ids)
+            end_stitch = time.perf_counter()
+            print("Stitching algorithm runtime : " + str(end_stitch-start_stitch) + " seconds.\n")
+            #only the greedy algorithm gives the counters of its candidate cache 
+            if stitching_algorithm is stitch_all_cycles_with_neighbourhood and cache_hits_and_misses is not None: 
+                print(f"Candidate cache: {cache_hits_and_misses[0]} hits, {cache_hits_and_misses[1]} misses.\n")
+
+
+            #check if the isocontours have been stitched into one cycle
+            start_check = time.perf_counter()
+            test_if_one_cycle = check_if_one_cycle(next_edge, cycles)
+            end_check = time.perf_counter()
+
+            if test_if_one_cycle == 1:
+                print("The isocontours have been stitched into one cycle, the stitching succeeded.\n")
+            else:
+                print("WARNING: The stitching failed, there is more than one cycle.\n")
+            print("Check if there is only one cycle took : " + str(end_check-start_check) + " seconds.\n")
+
+
+            #save the cycle, and store in the cache the file written by this run 
+            start_data = time.perf_counter()
+            write_artifact(cycle_key, 
+                           "data/np", 
+                           output_file_name + "_cycle", 
+                           lambda file_name: data_structure_to_numpy(points, 
+                                                                     previous_edge,
+                                                                     next_edge, 
+                                                                     cycle_index, 
+                                                                     cycles, 
+                                                                     file_name, 
+                                                                     edge_ids))
+            if save_paths: 
+                write_artifact(paths_key, 
+                               "data/np", 
+                               output_file_name + "_cycle_paths", 
+                               lambda file_name: data_structure_to_paths(points, 
+                                                                         next_edge, 
+                                                                         cycles, 
+                                                                         file_name))
+            end_data = time.perf_counter()
+            print("Cycle data saved in : " + str(end_data-start_data) + " seconds.\n")
+
+
+            #the logs are only written when the stitching is computed 
             log_file_name = "data/log/" + output_file_name + ".log"
             logging.basicConfig(filename=log_file_name, 
                                 filemode='a', 
@@ -106,11 +219,10 @@ if __name__ == "__main__":
                                 level=logging.INFO)
             logging.info(f"Number of neighbours to consider for the stitching : {neighbours}.")
             logging.info(f"Stitching algorithm runtime : {end_stitch-start_stitch} seconds.")
+            if stitching_algorithm is stitch_all_cycles_with_neighbourhood and cache_hits_and_misses is not None: 
+                logging.info(f"Candidate cache: {cache_hits_and_misses[0]} hits, {cache_hits_and_misses[1]} misses.")
             logging.info(f"Check if there is only one cycle took: {end_check-start_check} seconds.")
             logging.info("Cycle data saved in : " + str(end_data-start_data) + " seconds.\n")
-
-            with open(flag_file, 'w') as f:
-                f.write('This is not the first run.')
         
     except FileNotFoundError: 
         print("Please execute the contour extraction script first.")
\ No newline at end of file
@@ -1,8 +1,8 @@
 import taichi as ti
 import argparse
-import json
 
-from cglib.type import numpy_contour_to_data_structure, data_structure_to_svg
+from cglib.type import ContourFile, data_structure_to_svg
+from cglib.artifacts import load_field_record
 
 
 
@@ -19,29 +19,31 @@ if __name__ == '__main__':
     parser.add_argument("datatoexport", 
                         help = "contour or cycle", 
                         type= str)
+    parser.add_argument("--precision", 
+                        help= "Number of decimals of the coordinates, 6 by default.", 
+                        type = int, 
+                        default = 6)
     
     args = parser.parse_args()
     file_path = args.input_file_path
     datatoexport = args.datatoexport 
+    precision = args.precision
 
 
     #extract the file name
-    with open('data/do_not_delete/output_file_names.json', 'r') as f:
-        data = json.load(f)
-
-    file_name = data[file_path]
+    file_name = load_field_record(file_path)["output_name"]
 
     if datatoexport == "contour": 
         
         try: 
-            #import the graph 
-            points, previous_edge, next_edge, cycle_index, cycles =\
-                  numpy_contour_to_data_structure(file_name + "_contour")
+            #import the graph, only the fields used by the export are created 
+            contour_file = ContourFile(file_name + "_contour")
             #create a svg file 
-            data_structure_to_svg(points, 
-                                  next_edge, 
-                                  cycles, 
-                                  file_name+ "_contour")
+            data_structure_to_svg(contour_file.get_field("points"), 
+                                  contour_file.get_field("next_edge"), 
+                                  contour_file.get_field("cycles"), 
+                                  file_name+ "_contour", 
+                                  precision)
         except FileNotFoundError: 
             print("Please run the main tool before exporting the isocontours in SVG format.")
     
@@ -49,13 +51,13 @@ if __name__ == '__main__':
 
         try: 
             #import the graph with a single cycle
-            points, previous_edge, next_edge, cycle_index, cycles =\
-                  numpy_contour_to_data_structure(file_name + "_cycle")
+            contour_file = ContourFile(file_name + "_cycle")
             #create a svg file      
-            data_structure_to_svg(points, 
-                                  next_edge, 
-                                  cycles, 
-                                  file_name+ "_cycle")
+            data_structure_to_svg(contour_file.get_field("points"), 
+                                  contour_file.get_field("next_edge"), 
+                                  contour_file.get_field("cycles"), 
+                                  file_name+ "_cycle", 
+                                  precision)
         except FileNotFoundError: 
             print("Please run the main tool before exporting the cycle in SVG format.") 
 
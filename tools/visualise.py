@@ -1,10 +1,10 @@
 import taichi as ti 
 import argparse
-import json
 
 from cglib.polylines import graph_to_polylines
 from cglib.fields import normalize_grid, compute_pixels, shift_lines
 from cglib.type import numpy_to_field, numpy_contour_to_data_structure
+from cglib.artifacts import load_field_record
 
 
 
@@ -63,9 +63,7 @@ if __name__ == "__main__":
         
         try: 
                 #extract the file name
-            with open('data/do_not_delete/output_file_names.json', 'r') as f:
-                data = json.load(f)
-                file_name = data[file_path]
+            file_name = load_field_record(file_path)["output_name"]
 
             switch = 1 
             
@@ -113,9 +111,7 @@ if __name__ == "__main__":
         try: 
 
             #extract the file name
-            with open('data/do_not_delete/output_file_names.json', 'r') as f:
-                data = json.load(f)
-                file_name = data[file_path]
+            file_name = load_field_record(file_path)["output_name"]
             
             points_stitched, previous_edge_stitched, next_edge_stitched, cycle_index_stitched, cycles_stitched =\
                   numpy_contour_to_data_structure(file_name + "_cycle")
@@ -142,9 +138,7 @@ if __name__ == "__main__":
         try: 
             
                 #extract the file name
-            with open('data/do_not_delete/output_file_names.json', 'r') as f:
-                data = json.load(f)
-                file_name = data[file_path]
+            file_name = load_field_record(file_path)["output_name"]
 
             #get the contour data
             points, previous_edge, next_edge, cycle_index, cycles =\